@@ -0,0 +1,204 @@
+# artifacts.py
+"""Facts derived from a level grid, computed once and stored by content hash"""
+import json
+import zlib
+from array import array
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from config import PLAYER_SPAWN, GHOST_SPAWNS
+from level import Level, content_hash
+
+# Bump whenever compute_artifacts changes what it produces
+ARTIFACT_VERSION = 2
+UNREACHABLE = 0xFFFF
+
+DIRECTIONS = ((1, 0), (0, 1), (-1, 0), (0, -1))  # same order as the actors' 0..3
+
+
+class LevelArtifacts:
+    def __init__(self, content_hash: str, meta: dict, distances: bytes = None):
+        self.content_hash = content_hash
+        self.version = meta['version']
+        self.width = meta['width']
+        self.height = meta['height']
+        self.occupancy = tuple(tuple(row) for row in meta['occupancy'])  # 1 = walkable
+        self.wall_rects = [tuple(r) for r in meta['wall_rects']]        # (x, y, w, h) in cells
+        self.cells = [tuple(c) for c in meta['cells']]                  # walkable, row-major
+        self.cell_index = {cell: i for i, cell in enumerate(self.cells)}
+        self.junctions = [tuple(c) for c in meta['junctions']]
+        self.edges = [tuple(e) for e in meta['edges']]                  # (junction, junction, length)
+        self.dot_count = meta['dot_count']
+        self.pellet_count = meta['pellet_count']
+        self.spawn_errors = list(meta['spawn_errors'])
+        self._distances_blob = distances
+        self._distances: Optional[array] = None
+
+    @property
+    def distances(self) -> array:
+        """All-pairs shortest path lengths, row i = from self.cells[i]"""
+        if self._distances is None:
+            table = array('H')
+            if self._distances_blob is not None:
+                table.frombytes(zlib.decompress(self._distances_blob))
+            else:
+                table = bfs_distances(self.cells, self.cell_index)
+            self._distances = table
+        return self._distances
+
+    def distance(self, a: Tuple[int, int], b: Tuple[int, int]) -> int:
+        """Steps from cell a to cell b, UNREACHABLE if there is no path"""
+        n = len(self.cells)
+        return self.distances[self.cell_index[a] * n + self.cell_index[b]]
+
+    def meta(self) -> dict:
+        return {
+            'version': self.version,
+            'width': self.width,
+            'height': self.height,
+            'occupancy': [list(row) for row in self.occupancy],
+            'wall_rects': [list(r) for r in self.wall_rects],
+            'cells': [list(c) for c in self.cells],
+            'junctions': [list(c) for c in self.junctions],
+            'edges': [list(e) for e in self.edges],
+            'dot_count': self.dot_count,
+            'pellet_count': self.pellet_count,
+            'spawn_errors': self.spawn_errors,
+        }
+
+    def to_row(self) -> Tuple[str, int, str, bytes]:
+        """(content_hash, version, meta JSON, compressed distances) for level_artifacts"""
+        blob = zlib.compress(self.distances.tobytes(), 6)
+        return (self.content_hash, self.version,
+                json.dumps(self.meta(), separators=(',', ':')), blob)
+
+    @classmethod
+    def from_row(cls, content_hash: str, meta: str, distances: bytes) -> 'LevelArtifacts':
+        return cls(content_hash, json.loads(meta), distances)
+
+
+def wall_rects(grid) -> List[Tuple[int, int, int, int]]:
+    """Greedy decomposition of the wall cells into (x, y, w, h) rectangles
+
+    Scanning row-major, each uncovered wall cell starts a rectangle that
+    is grown right as far as the run goes, then down while the whole
+    span below is uncovered wall.
+    """
+    height = len(grid)
+    width = len(grid[0]) if height else 0
+    covered = [[False] * width for _ in range(height)]
+    rects = []
+    for y in range(height):
+        for x in range(width):
+            if grid[y][x] != 1 or covered[y][x]:
+                continue
+            w = 1
+            while x + w < width and grid[y][x + w] == 1 and not covered[y][x + w]:
+                w += 1
+            h = 1
+            while y + h < height and all(grid[y + h][i] == 1 and not covered[y + h][i]
+                                         for i in range(x, x + w)):
+                h += 1
+            for row in covered[y:y + h]:
+                row[x:x + w] = [True] * w
+            rects.append((x, y, w, h))
+    return rects
+
+
+def rects_cover_exactly(rects, grid) -> bool:
+    """Whether the rectangles tile the wall cells: no gaps, overlaps or extras"""
+    seen = set()
+    for x, y, w, h in rects:
+        for cy in range(y, y + h):
+            for cx in range(x, x + w):
+                if (cx, cy) in seen:
+                    return False
+                seen.add((cx, cy))
+    walls = {(x, y) for y, row in enumerate(grid) for x, cell in enumerate(row) if cell == 1}
+    return seen == walls
+
+
+def neighbors(cell: Tuple[int, int], cell_index: Dict[Tuple[int, int], int]) -> List[Tuple[int, int]]:
+    x, y = cell
+    return [(x + dx, y + dy) for dx, dy in DIRECTIONS if (x + dx, y + dy) in cell_index]
+
+
+def bfs_distances(cells: List[Tuple[int, int]], cell_index: Dict[Tuple[int, int], int]) -> array:
+    n = len(cells)
+    adjacency = [[cell_index[c] for c in neighbors(cell, cell_index)] for cell in cells]
+    table = array('H', [UNREACHABLE]) * (n * n)
+    for source in range(n):
+        row = source * n
+        table[row + source] = 0
+        queue = deque([source])
+        while queue:
+            current = queue.popleft()
+            step = table[row + current] + 1
+            for nxt in adjacency[current]:
+                if table[row + nxt] == UNREACHABLE:
+                    table[row + nxt] = step
+                    queue.append(nxt)
+    return table
+
+
+def junction_graph(cells, cell_index):
+    """Junctions (degree != 2) and the corridors joining them"""
+    junctions = [c for c in cells if len(neighbors(c, cell_index)) != 2]
+    junction_index = {c: i for i, c in enumerate(junctions)}
+    edges = set()
+    for start in junctions:
+        for first in neighbors(start, cell_index):
+            previous, current, length = start, first, 1
+            while current not in junction_index:
+                nxt = [c for c in neighbors(current, cell_index) if c != previous][0]
+                previous, current, length = current, nxt, length + 1
+            a, b = junction_index[start], junction_index[current]
+            edges.add((min(a, b), max(a, b), length))
+    return junctions, sorted(edges)
+
+
+def spawn_errors(level: Level, cell_index) -> List[str]:
+    errors = []
+    for name, cell in [('player', PLAYER_SPAWN)] + [(f'ghost {i}', c) for i, c in enumerate(GHOST_SPAWNS)]:
+        if cell not in cell_index:
+            errors.append(f"{name} spawn {cell} is not a walkable cell")
+    if PLAYER_SPAWN in cell_index:
+        reached = {PLAYER_SPAWN}
+        queue = deque([PLAYER_SPAWN])
+        while queue:
+            for nxt in neighbors(queue.popleft(), cell_index):
+                if nxt not in reached:
+                    reached.add(nxt)
+                    queue.append(nxt)
+        unreachable = [c for c in cell_index if level.grid[c[1]][c[0]] == 0 and c not in reached]
+        if unreachable:
+            errors.append(f"{len(unreachable)} dot/pellet cells unreachable from the player spawn")
+    return errors
+
+
+def compute_artifacts(level: Level) -> LevelArtifacts:
+    """Everything but the distance table, which is filled in on first use"""
+    grid = level.grid
+    height = len(grid)
+    width = len(grid[0]) if height else 0
+    cells = [(x, y) for y in range(height) for x in range(width) if grid[y][x] != 1]
+    cell_index = {cell: i for i, cell in enumerate(cells)}
+    junctions, edges = junction_graph(cells, cell_index)
+    pellet_count = sum(1 for x, y in level.pellets if 0 <= y < height and 0 <= x < width and grid[y][x] == 0)
+    rects = wall_rects(grid)
+    if not rects_cover_exactly(rects, grid):
+        raise ValueError(f"level {level.number}: merged wall rectangles don't match the wall cells")
+    meta = {
+        'version': ARTIFACT_VERSION,
+        'width': width,
+        'height': height,
+        'occupancy': [[int(cell != 1) for cell in row] for row in grid],
+        'wall_rects': rects,
+        'cells': cells,
+        'junctions': junctions,
+        'edges': edges,
+        'dot_count': sum(row.count(0) for row in grid) - pellet_count,
+        'pellet_count': pellet_count,
+        'spawn_errors': spawn_errors(level, cell_index),
+    }
+    return LevelArtifacts(content_hash(level), meta)
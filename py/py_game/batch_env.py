@@ -0,0 +1,338 @@
+# batch_env.py
+"""N headless games stepped in lockstep on stacked NumPy arrays
+
+Same rules, actions, rewards and observation layout as env.PacmanEnv,
+but every piece of state is an array with one row per game and step()
+advances all of them with a handful of vectorized operations:
+
+    envs = BatchEnv(4096)
+    obs, info = envs.reset()
+    obs, rewards, terminated, truncated, info = envs.step(actions)
+
+Games that end are restarted inside the same step (their final score,
+level and length are reported in info), so the batch never shrinks.
+
+Walls, dots and ghost navigation come from per-level lookup tables
+(LevelTables) built once from the compiled levels. Wall and dot tests
+look at the (at most four) cells an actor's rect covers, which is
+exactly what the Rect collisions in Simulation test. Chasing ghosts
+follow a shortest path from the level's distance table instead of
+running A*; both take a shortest path, but where several exist they
+may pick different ones, so individual games can drift from
+PacmanEnv once a ghost makes such a choice.
+"""
+from typing import Dict, Tuple
+
+import numpy as np
+
+from config import *
+from artifacts import UNREACHABLE
+from env import NOOP, STATE_FIELDS, dot_grid, load_levels
+from level_cache import CompiledLevel
+
+DX = np.array((1, 0, -1, 0), dtype=np.int32)  # by direction: 0 right, 1 down, 2 left, 3 up
+DY = np.array((0, 1, 0, -1), dtype=np.int32)
+NO_DIRECTION = 255
+NEVER = np.iinfo(np.int32).min   # ghost hasn't planned yet
+ACTOR_SIZE = CELL_SIZE           # player and ghost rects are one cell
+
+# Ghost.get_escape_direction's candidates, see GHOST_ESCAPE_CHOICES
+ESCAPE = np.array(GHOST_ESCAPE_CHOICES, dtype=np.int32)
+# A*'s neighbour order in Ghost.find_path, used to break shortest-path ties
+CHASE_ORDER = (1, 0, 3, 2)
+
+
+def next_hops(compiled: CompiledLevel) -> np.ndarray:
+    """(cells, cells) uint8: first direction along a shortest path from cell a to cell b
+
+    Cells are numbered y * width + x; NO_DIRECTION where a == b, either
+    is a wall or b can't be reached.
+    """
+    artifacts = compiled.artifacts
+    width, height = artifacts.width, artifacts.height
+    n = len(artifacts.cells)
+    dist = np.frombuffer(artifacts.distances, dtype=np.uint16).reshape(n, n).astype(np.int32)
+    compact = np.full((n, n), NO_DIRECTION, dtype=np.uint8)
+    todo = (dist != UNREACHABLE) & (dist > 0)
+    for direction in CHASE_ORDER:
+        neighbour = np.array([artifacts.cell_index.get((x + DX[direction], y + DY[direction]), -1)
+                              for x, y in artifacts.cells])
+        has = neighbour >= 0
+        step = np.zeros((n, n), dtype=bool)
+        step[has] = dist[neighbour[has]] + 1 == dist[has]
+        take = todo & step
+        compact[take] = direction
+        todo &= ~take
+    ids = np.array([y * width + x for x, y in artifacts.cells])
+    table = np.full((width * height, width * height), NO_DIRECTION, dtype=np.uint8)
+    table[np.ix_(ids, ids)] = compact
+    return table
+
+
+class LevelTables:
+    """Lookup arrays for every level, indexed by level number
+
+    walls and dots are padded with one free cell all round; anything
+    further out (the tunnel leads off the map) is clipped onto that
+    border, since nothing out there is a wall or a dot.
+    """
+    def __init__(self, levels: Dict[int, CompiledLevel]):
+        numbers = sorted(levels)
+        first = levels[numbers[0]]
+        self.height = len(first.level.grid)
+        self.width = len(first.level.grid[0])
+        count = numbers[-1] + 1
+        shape = (count, self.height + 2, self.width + 2)
+        self.exists = np.zeros(count + 1, dtype=bool)  # one past the end: no level
+        self.walls = np.zeros(shape, dtype=bool)
+        self.dots = np.zeros(shape, dtype=np.uint8)
+        self.dot_total = np.zeros(count, dtype=np.int32)
+        cells = self.width * self.height
+        self.next_dir = np.full((count, cells, cells), NO_DIRECTION, dtype=np.uint8)
+        for number in numbers:
+            compiled = levels[number]
+            self.exists[number] = True
+            self.walls[number, 1:-1, 1:-1] = np.array(compiled.artifacts.occupancy) == 0
+            grid = dot_grid(compiled)
+            self.dots[number, 1:-1, 1:-1] = grid
+            self.dot_total[number] = np.count_nonzero(grid)
+            self.next_dir[number] = next_hops(compiled)
+
+    def blocked(self, level: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Whether an actor rect at pixel (x, y) overlaps a wall cell"""
+        x0, y0, x1, y1 = self.cover(x, y)
+        walls = self.walls
+        return walls[level, y0, x0] | walls[level, y0, x1] | walls[level, y1, x0] | walls[level, y1, x1]
+
+    def cover(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """Padded-grid indices of the first and last cell column/row a rect covers"""
+        limit_x, limit_y = self.width + 1, self.height + 1
+        x0 = np.clip(x // CELL_SIZE + 1, 0, limit_x)
+        x1 = np.clip((x + ACTOR_SIZE - 1) // CELL_SIZE + 1, 0, limit_x)
+        y0 = np.clip(y // CELL_SIZE + 1, 0, limit_y)
+        y1 = np.clip((y + ACTOR_SIZE - 1) // CELL_SIZE + 1, 0, limit_y)
+        return x0, y0, x1, y1
+
+
+class BatchEnv:
+    def __init__(self, count: int, levels: Dict[int, CompiledLevel] = None, max_steps: int = None,
+                 start_level: int = 1, db_path: str = None, tables: LevelTables = None):
+        self.count = count
+        self.tables = tables or LevelTables(levels if levels is not None else load_levels(db_path))
+        self.max_steps = max_steps
+        self.start_level = start_level
+        ghosts = len(GHOST_SPAWNS)
+        i32 = np.int32
+        self.level = np.zeros(count, i32)
+        self.score = np.zeros(count, i32)
+        self.lives = np.zeros(count, i32)
+        self.ticks = np.zeros(count, i32)
+        self.over = np.zeros(count, bool)
+        self.remaining = np.zeros(count, i32)   # dots + pellets left on the level
+        self.player_x = np.zeros(count, i32)
+        self.player_y = np.zeros(count, i32)
+        self.player_dir = np.zeros(count, i32)
+        self.ghost_x = np.zeros((count, ghosts), i32)
+        self.ghost_y = np.zeros((count, ghosts), i32)
+        self.ghost_dir = np.zeros((count, ghosts), i32)
+        self.ghost_state = np.zeros((count, ghosts), i32)
+        self.frightened = np.zeros((count, ghosts), i32)
+        self.replanned = np.zeros((count, ghosts), i32)
+        self.respawn = np.zeros((count, ghosts), i32)
+        self.dots = np.zeros((count, self.tables.height + 2, self.tables.width + 2), np.uint8)
+        self.spawn_x = np.array([x * CELL_SIZE for x, _ in GHOST_SPAWNS], i32)
+        self.spawn_y = np.array([y * CELL_SIZE for _, y in GHOST_SPAWNS], i32)
+        self.obs_state = np.zeros((count, len(STATE_FIELDS)), i32)
+        self.rows = np.arange(count)
+
+    def reset(self, seed: int = None) -> Tuple[dict, dict]:
+        """Restart every game (the rules have no randomness; seed is accepted for API parity)"""
+        self._start(self.rows)
+        return self.observation(), self.info()
+
+    def _start(self, games: np.ndarray):
+        self.level[games] = self.start_level
+        self.score[games] = 0
+        self.lives[games] = INITIAL_LIVES
+        self.ticks[games] = 0
+        self.over[games] = False
+        if not self.tables.exists[self.start_level]:
+            raise ValueError(f"no level {self.start_level}")
+        self._load_level(games)
+
+    def _load_level(self, games: np.ndarray):
+        level = self.level[games]
+        self.dots[games] = self.tables.dots[level]
+        self.remaining[games] = self.tables.dot_total[level]
+        self.player_x[games] = PLAYER_SPAWN[0] * CELL_SIZE
+        self.player_y[games] = PLAYER_SPAWN[1] * CELL_SIZE
+        self.player_dir[games] = 2
+        self.ghost_x[games] = self.spawn_x
+        self.ghost_y[games] = self.spawn_y
+        self.ghost_dir[games] = 3
+        self.ghost_state[games] = 1
+        self.frightened[games] = 0
+        self.replanned[games] = NEVER
+        self.respawn[games] = 0
+
+    def step(self, actions) -> Tuple[dict, np.ndarray, np.ndarray, np.ndarray, dict]:
+        tables = self.tables
+        actions = np.asarray(actions, dtype=np.int32)
+        level = self.level
+        self.ticks += 1
+        now = self.ticks * 1000 // FPS
+        start_score = self.score.copy()
+
+        # Player: turn if the requested direction is open, then move
+        px, py = self.player_x, self.player_y
+        turn = actions != NOOP
+        wanted = np.where(turn, actions, 0)
+        open_ = ~tables.blocked(level, px + DX[wanted] * PLAYER_SPEED, py + DY[wanted] * PLAYER_SPEED)
+        self.player_dir = np.where(turn & open_, wanted, self.player_dir)
+        nx = px + DX[self.player_dir] * PLAYER_SPEED
+        ny = py + DY[self.player_dir] * PLAYER_SPEED
+        free = ~tables.blocked(level, nx, ny)
+        px = self.player_x = np.where(free, nx, px)
+        py = self.player_y = np.where(free, ny, py)
+
+        self._update_ghosts(now)
+        self._eat()
+        self._collide()
+
+        # Level completion
+        cleared = ~self.over & (self.remaining == 0)
+        if cleared.any():
+            self.level[cleared] += 1
+            exists = tables.exists[np.minimum(self.level, len(tables.exists) - 1)]
+            self.over |= cleared & ~exists
+            self._load_level(np.flatnonzero(cleared & exists))
+
+        rewards = (self.score - start_score).astype(np.float32)
+        terminated = self.over.copy()
+        truncated = ~terminated & (self.ticks >= self.max_steps) if self.max_steps else np.zeros_like(terminated)
+        info = self.info()
+        finished = terminated | truncated
+        if finished.any():
+            # Reported before the restart wipes them
+            info['final_score'] = np.where(finished, self.score, -1)
+            info['final_level'] = np.where(finished, self.level, -1)
+            info['final_ticks'] = np.where(finished, self.ticks, -1)
+            info['won'] = terminated & (self.lives > 0)
+            self._start(np.flatnonzero(finished))
+        return self.observation(), rewards, terminated, truncated, info
+
+    def _update_ghosts(self, now: np.ndarray):
+        tables = self.tables
+        now = now[:, None]
+        state = self.ghost_state
+
+        # Eaten ghosts wait GHOST_RESPAWN_MS out of play, then restart at home
+        eaten = state == 4
+        entering = eaten & (self.respawn == 0)
+        self.respawn[entering] = np.broadcast_to(now, state.shape)[entering]
+        back = eaten & ~entering & (now - self.respawn >= GHOST_RESPAWN_MS)
+        if back.any():
+            state[back] = 1
+            self.ghost_x[back] = np.broadcast_to(self.spawn_x, state.shape)[back]
+            self.ghost_y[back] = np.broadcast_to(self.spawn_y, state.shape)[back]
+            self.respawn[back] = 0
+            self.ghost_dir[back] = 3
+        active = ~eaten
+
+        # Frightened countdown
+        counting = active & (state == 3) & (self.frightened > 0)
+        self.frightened -= counting
+        state[counting & (self.frightened <= 0)] = 1
+
+        # Re-plan every GHOST_REPLAN_INTERVAL ms
+        due = active & ((self.replanned == NEVER) | (now - self.replanned > GHOST_REPLAN_INTERVAL))
+        if due.any():
+            self.replanned = np.where(due, now, self.replanned)
+            gx, gy = self.ghost_x, self.ghost_y
+            px, py = self.player_x[:, None], self.player_y[:, None]
+            level = np.broadcast_to(self.level[:, None], state.shape)
+
+            scared = due & (state == 3)
+            if scared.any():
+                dx, dy = gx - px, gy - py
+                key = np.where(np.abs(dx) > np.abs(dy), np.where(dx > 0, 0, 1), np.where(dy > 0, 2, 3))
+                candidates = ESCAPE[key]                                     # (games, ghosts, 3)
+                cx = gx[..., None] + DX[candidates] * GHOST_SPEED
+                cy = gy[..., None] + DY[candidates] * GHOST_SPEED
+                free = ~tables.blocked(level[..., None], cx, cy)
+                pick = np.take_along_axis(candidates, free.argmax(-1)[..., None], -1)[..., 0]
+                escape = np.where(free.any(-1), pick, self.ghost_dir)
+                self.ghost_dir = np.where(scared, escape, self.ghost_dir)
+
+            chasing = due & (state != 3)
+            if chasing.any():
+                width, height = tables.width, tables.height
+                gcx, gcy = gx // CELL_SIZE, gy // CELL_SIZE
+                pcx, pcy = px // CELL_SIZE, py // CELL_SIZE
+                inside = ((gcx >= 0) & (gcx < width) & (gcy >= 0) & (gcy < height) &
+                          (pcx >= 0) & (pcx < width) & (pcy >= 0) & (pcy < height))
+                source = np.clip(gcy, 0, height - 1) * width + np.clip(gcx, 0, width - 1)
+                target = np.broadcast_to(np.clip(pcy, 0, height - 1) * width + np.clip(pcx, 0, width - 1),
+                                         state.shape)
+                hop = tables.next_dir[level, source, target]
+                self.ghost_dir = np.where(chasing & inside & (hop != NO_DIRECTION), hop, self.ghost_dir)
+
+        # Movement (eaten ghosts, including ones that just respawned, stand still)
+        nx = self.ghost_x + DX[self.ghost_dir] * GHOST_SPEED
+        ny = self.ghost_y + DY[self.ghost_dir] * GHOST_SPEED
+        move = active & ~tables.blocked(self.level[:, None], nx, ny)
+        self.ghost_x = np.where(move, nx, self.ghost_x)
+        self.ghost_y = np.where(move, ny, self.ghost_y)
+
+    def _eat(self):
+        """Dots and pellets under the player's rect"""
+        x0, y0, x1, y1 = self.tables.cover(self.player_x, self.player_y)
+        rows = self.rows
+        pellet = np.zeros(self.count, dtype=bool)
+        # Corners can repeat when the rect is cell-aligned; a cell is
+        # cleared on its first visit, so it only counts once
+        for y, x in ((y0, x0), (y0, x1), (y1, x0), (y1, x1)):
+            value = self.dots[rows, y, x]
+            self.score += np.where(value == 1, 10, np.where(value == 2, 50, 0))
+            self.remaining -= value != 0
+            pellet |= value == 2
+            self.dots[rows, y, x] = 0
+        if pellet.any():
+            self.ghost_state[pellet] = 3
+            self.frightened[pellet] = POWER_PELLET_DURATION
+
+    def _collide(self):
+        """Ghost contact in ghost order: frightened ones are eaten until a normal one kills"""
+        state = self.ghost_state
+        touching = ((np.abs(self.ghost_x - self.player_x[:, None]) < ACTOR_SIZE) &
+                    (np.abs(self.ghost_y - self.player_y[:, None]) < ACTOR_SIZE))
+        killers = touching & (state == 1)
+        killed = killers.any(1)
+        first_killer = np.where(killed, killers.argmax(1), state.shape[1])
+        eaten = touching & (state == 3) & (np.arange(state.shape[1]) < first_killer[:, None])
+        state[eaten] = 4
+        self.score += 100 * eaten.sum(1, dtype=np.int32)
+        if killed.any():
+            self.lives -= killed
+            self.over |= killed & (self.lives <= 0)
+            self._load_level(np.flatnonzero(killed & (self.lives > 0)))
+
+    def observation(self) -> dict:
+        """Views into the batch's own buffers, overwritten by the next step"""
+        state = self.obs_state
+        state[:, 0] = self.player_x
+        state[:, 1] = self.player_y
+        state[:, 2] = self.player_dir
+        state[:, 3] = self.lives
+        state[:, 4] = self.level
+        state[:, 5] = self.score
+        state[:, 6] = self.ticks
+        state[:, 7::4] = self.ghost_x
+        state[:, 8::4] = self.ghost_y
+        state[:, 9::4] = self.ghost_state
+        state[:, 10::4] = self.ghost_dir
+        return {'state': state, 'dots': self.dots[:, 1:-1, 1:-1]}
+
+    def info(self) -> dict:
+        return {'score': self.score.copy(), 'lives': self.lives.copy(),
+                'level': self.level.copy(), 'ticks': self.ticks.copy()}
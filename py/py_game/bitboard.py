@@ -0,0 +1,640 @@
+# bitboard.py
+"""Cell-level rules on integer bitboards, for fast ghost-free rollouts
+
+A 28x31 level is 868 cells, so every set of cells - the walkable ones,
+the dots and the pellets left, where an actor is - fits in one Python
+int with bit y * width + x. Moving is a shift (1 for right/left, width
+for down/up) masked with the walkable cells, eating is an AND with the
+dots, and a collision is a non-zero AND of two actors' cells:
+
+    engine = BitboardSim(levels.get)  # no ghosts
+    engine.reset(1)
+    engine.load_level()
+    engine.step(direction)
+
+Actors are cell-aligned: an actor enters the next cell on the tick it
+starts moving and then waits out the ticks Simulation takes to slide
+across (CELL_SIZE // speed). Between cells it covers the cell it came
+from and the one it's entering, exactly the cells its rect overlaps in
+Simulation, so the player eats the same dots on the same ticks. Without
+ghosts (the default) the player's movement, eating, scoring and level
+changes follow Simulation tick for tick; the ways it can't are listed
+below and `validate` checks the rest on recorded inputs. Only that mode
+is fit for rollouts that drive a search.
+
+Where it differs from Simulation:
+  * The player turns only between cells (reversing is allowed mid-cell,
+    as in Simulation). Simulation also lets it turn mid-cell where the
+    maze is two cells wide.
+  * The edge of the map is a wall; Simulation lets actors walk out
+    through the side openings into the void.
+  * ghosts=True adds ghosts that only approximate Simulation's. They
+    re-plan on its clock, every replan_interval ms, with Ghost's own A*
+    (or its escape rule when frightened) and stall when told to turn into
+    a wall mid-cell, but where Simulation's ghost can make that turn (two
+    cells wide, e.g. the ghost house) this one stalls until the next
+    re-plan, and contact is tested per cell rather than per pixel. Games
+    with ghosts drift apart within the first second or two, so they are
+    not validated on recorded inputs; validate only checks that mean score
+    and game length stay within GHOST_TOLERANCE (over its 240 default runs
+    the score was 7% lower and games 0.5% longer). Don't search on them.
+
+advance() plays a span with the input held, stepping only the ticks
+where something can happen and jumping over the rest; the result is the
+same as stepping every tick, which validate also checks.
+
+    python bitboard.py validate [LOG ...]   # recorded inputs against Simulation
+    python bitboard.py bench                # ticks per second
+"""
+import argparse
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import *
+from level_cache import CompiledLevel
+from sprites import Ghost
+
+PLAYER_STEP_TICKS = CELL_SIZE // PLAYER_SPEED  # ticks to cross a cell
+GHOST_STEP_TICKS = CELL_SIZE // GHOST_SPEED
+DX = (1, 0, -1, 0)  # by direction: 0 right, 1 down, 2 left, 3 up
+DY = (0, 1, 0, -1)
+# How far validate lets the mean score and game length with ghosts drift from Simulation's
+GHOST_TOLERANCE = 0.15
+
+
+class BitboardLevel:
+    """A compiled level's cell sets as bitboards, built once per level"""
+    def __init__(self, compiled: CompiledLevel):
+        artifacts = compiled.artifacts
+        self.compiled = compiled
+        self.width = width = artifacts.width
+        self.height = artifacts.height
+        self.cells = self.width * self.height
+        self.walkable = sum(1 << (y * width + x) for x, y in artifacts.cells)
+        self.walls = ((1 << self.cells) - 1) & ~self.walkable
+        first_column = sum(1 << (y * width) for y in range(self.height))
+        # Where a shift right (left) lands, minus the cells it wrapped into
+        self.open_right = self.walkable & ~first_column
+        self.open_left = self.walkable & ~(first_column << (width - 1))
+        self.dots = sum(1 << (rect.y // CELL_SIZE * width + rect.x // CELL_SIZE) for rect in compiled.dots)
+        self.pellets = sum(1 << (rect.y // CELL_SIZE * width + rect.x // CELL_SIZE) for rect in compiled.pellets)
+        self.player_spawn = 1 << (PLAYER_SPAWN[1] * width + PLAYER_SPAWN[0])
+        self.ghost_spawns = tuple(1 << (y * width + x) for x, y in GHOST_SPAWNS)
+        self._chase: Dict[int, Optional[int]] = {}
+
+    def chase(self, start: int, goal: int) -> Optional[int]:
+        """First direction of Ghost.find_path's A* path between two cells, None if there's no step
+
+        The same A* as Simulation's ghosts, so shortest-path ties go the
+        same way; results are kept per (start, goal).
+        """
+        key = start * self.cells + goal
+        if key not in self._chase:
+            # find_path doesn't use the ghost it's called on
+            path = Ghost.find_path(None, (start % self.width, start // self.width),
+                                   (goal % self.width, goal // self.width), self.compiled.wall_cells)
+            if len(path) > 1:
+                (x, y), (nx, ny) = path[0], path[1]
+                self._chase[key] = 0 if nx > x else 2 if nx < x else 1 if ny > y else 3
+            else:
+                self._chase[key] = None
+        return self._chase[key]
+
+    def move(self, bit: int, direction: int) -> int:
+        """The cell next to `bit` in `direction`, 0 if it's a wall or off the map"""
+        if direction == 0:
+            return (bit << 1) & self.open_right
+        if direction == 1:
+            return (bit << self.width) & self.walkable
+        if direction == 2:
+            return (bit >> 1) & self.open_left
+        return (bit >> self.width) & self.walkable
+
+
+class BitboardSim:
+    """Simulation's run (levels, lives, score, deaths) on BitboardLevels
+
+    Actor positions are single-bit ints; `previous` is the cell an actor
+    is leaving (0 once it's aligned) and `offset` the ticks until it is.
+    Ghost state uses Ghost's codes (1 normal, 3 frightened, 4 eaten).
+    By default the level is played empty, the mode validate checks tick
+    for tick; ghosts=True is the approximation described in the module
+    docstring.
+    """
+    def __init__(self, levels: Callable[[int], Optional[CompiledLevel]], ghosts: bool = False,
+                 replan_interval: int = GHOST_REPLAN_INTERVAL):
+        self.levels = levels
+        self.ghost_count = len(GHOST_SPAWNS) if ghosts else 0
+        self.replan_interval = replan_interval
+        self.boards: Dict[int, BitboardLevel] = {}
+        self.reset()
+
+    def reset(self, level: int = 1, seed: int = None):
+        """Back to the start of a run; call load_level() to begin playing
+
+        The rules have no randomness; seed is taken for Simulation's signature.
+        """
+        self.seed = seed
+        self.ticks = 0
+        self.current_level = level
+        self.score = 0
+        self.lives = INITIAL_LIVES
+        self.over = False
+        self.deaths: List[tuple] = []  # (tick, level, ghost index) per life lost
+        self.board: Optional[BitboardLevel] = None
+        self.dots = 0
+        self.pellets = 0
+        self.level_loaded = False
+        self.stepped = 0  # ticks advance() had to play one by one
+
+    @property
+    def now_ms(self) -> int:
+        return self.ticks * 1000 // FPS
+
+    @property
+    def won(self) -> bool:
+        return self.over and self.lives > 0
+
+    def _board(self, level: int) -> Optional[BitboardLevel]:
+        board = self.boards.get(level)
+        if board is None:
+            compiled = self.levels(level)
+            if not compiled:
+                return None
+            board = self.boards[level] = BitboardLevel(compiled)
+        return board
+
+    def load_level(self) -> bool:
+        board = self._board(self.current_level)
+        if not board:
+            return False
+        self.board = board
+        self.dots = board.dots
+        self.pellets = board.pellets
+        self.player = board.player_spawn
+        self.previous = 0
+        self.direction = 2
+        self.offset = 0
+        count = self.ghost_count
+        self.ghosts = list(board.ghost_spawns[:count])
+        self.ghost_previous = [0] * count
+        self.ghost_directions = [3] * count
+        self.ghost_motions = [3] * count   # the way the current move goes (direction may have turned since)
+        self.ghost_offsets = [0] * count
+        self.replanned: List[Optional[int]] = [None] * count  # now_ms of the last re-plan
+        self.ghost_states = [1] * count
+        self.frightened = [0] * count
+        self.respawn_ms = [0] * count  # when the ghost was eaten, 0 = not yet counting
+        self.level_loaded = True
+        return True
+
+    def step(self, direction: Optional[int]) -> int:
+        """Advance one tick with the given input (None = no key); returns the score gained"""
+        self.ticks += 1
+        self.level_loaded = False
+        board = self.board
+        start_score = self.score
+
+        bit, previous, heading, offset = self.player, self.previous, self.direction, self.offset
+        if offset:
+            if direction is not None and direction == heading ^ 2:
+                # Turn back towards the cell being left
+                heading = direction
+                bit, previous = previous, bit
+                offset = PLAYER_STEP_TICKS - 1 - offset
+            else:
+                offset -= 1
+            if not offset:
+                previous = 0
+        else:
+            if direction is not None and direction != heading and board.move(bit, direction):
+                heading = direction
+            target = board.move(bit, heading)
+            if target:
+                previous, bit, offset = bit, target, PLAYER_STEP_TICKS - 1
+        self.player, self.previous, self.direction, self.offset = bit, previous, heading, offset
+        covered = bit | previous
+
+        if self.ghost_count:
+            self._update_ghosts()
+
+        eaten = covered & self.dots
+        if eaten:
+            self.dots ^= eaten
+            self.score += 10 * eaten.bit_count()
+        eaten = covered & self.pellets
+        if eaten:
+            self.pellets ^= eaten
+            self.score += 50 * eaten.bit_count()
+            for i in range(self.ghost_count):
+                self.ghost_states[i] = 3
+                self.frightened[i] = POWER_PELLET_DURATION
+
+        states = self.ghost_states
+        for i in range(self.ghost_count):
+            if states[i] != 4 and covered & (self.ghosts[i] | self.ghost_previous[i]):
+                if states[i] == 3:
+                    states[i] = 4
+                    self.score += 100
+                elif states[i] == 1:
+                    self.lives -= 1
+                    self.deaths.append((self.ticks, self.current_level, i))
+                    if self.lives <= 0:
+                        self.over = True
+                    else:
+                        self.load_level()
+                    break
+
+        if not self.over and not self.dots and not self.pellets:
+            self.current_level += 1
+            if not self.load_level():
+                self.over = True
+        return self.score - start_score
+
+    def _update_ghosts(self):
+        board = self.board
+        ghosts, previous, directions = self.ghosts, self.ghost_previous, self.ghost_directions
+        motions, offsets, states = self.ghost_motions, self.ghost_offsets, self.ghost_states
+        now = self.now_ms
+        player = None  # the player's pixel position, worked out on first use
+        for i in range(self.ghost_count):
+            state = states[i]
+            if state == 4:
+                if self.respawn_ms[i] == 0:
+                    self.respawn_ms[i] = now
+                elif now - self.respawn_ms[i] >= GHOST_RESPAWN_MS:
+                    states[i] = 1
+                    ghosts[i] = board.ghost_spawns[i]
+                    previous[i] = 0
+                    offsets[i] = 0
+                    directions[i] = 3
+                    self.respawn_ms[i] = 0
+                continue
+            if state == 3 and self.frightened[i] > 0:
+                self.frightened[i] -= 1
+                if self.frightened[i] <= 0:
+                    states[i] = state = 1
+
+            heading = directions[i]
+            if self.replanned[i] is None or now - self.replanned[i] > self.replan_interval:
+                self.replanned[i] = now
+                if player is None:
+                    player = self.player_position()
+                gx, gy = self.ghost_position(i)
+                if state == 3:
+                    dx = gx - player[0]
+                    dy = gy - player[1]
+                    if abs(dx) > abs(dy):
+                        choices = GHOST_ESCAPE_CHOICES[0 if dx > 0 else 1]
+                    else:
+                        choices = GHOST_ESCAPE_CHOICES[2 if dy > 0 else 3]
+                    for choice in choices:
+                        if offsets[i]:
+                            free = choice == motions[i] or choice == motions[i] ^ 2  # along the corridor
+                        else:
+                            free = board.move(ghosts[i], choice)
+                        if free:
+                            heading = choice
+                            break
+                else:
+                    # Both ends rounded to the cell under the rect's top-left corner, as Ghost does
+                    cell = gy // CELL_SIZE * board.width + gx // CELL_SIZE
+                    target = player[1] // CELL_SIZE * board.width + player[0] // CELL_SIZE
+                    hop = board.chase(cell, target)
+                    if hop is not None:
+                        heading = hop
+                directions[i] = heading
+
+            offset = offsets[i]
+            if offset:
+                motion = motions[i]
+                if heading == motion:
+                    offsets[i] = offset = offset - 1
+                    if not offset:
+                        previous[i] = 0
+                elif heading == motion ^ 2:
+                    # Back towards the cell being left
+                    motions[i] = heading
+                    ghosts[i], previous[i] = previous[i], ghosts[i]
+                    offsets[i] = offset = GHOST_STEP_TICKS - 1 - offset
+                    if not offset:
+                        previous[i] = 0
+                # else it turned across the corridor mid-cell and is stuck until the next re-plan
+            else:
+                target = board.move(ghosts[i], heading)
+                if target:
+                    previous[i] = ghosts[i]
+                    ghosts[i] = target
+                    motions[i] = heading
+                    offsets[i] = GHOST_STEP_TICKS - 1
+
+    def advance(self, direction: Optional[int], ticks: int) -> int:
+        """Same as `ticks` step(direction) calls (fewer if the game ends); returns the score gained
+
+        Only the ticks where something can happen are played one by one: a
+        move into the next cell (which is where dots get eaten and actors
+        come into contact), a reversal, a ghost re-plan, a frightened timer
+        running out and a respawn. Everything in between only counts down, so it is jumped
+        over in one go. The input is held for the whole span; call again
+        when it changes.
+        """
+        start_score = self.score
+        end = self.ticks + ticks
+        while self.ticks < end and not self.over:
+            quiet = min(self._quiet_ticks(direction), end - self.ticks)
+            if quiet:
+                self._skip(quiet)
+            else:
+                self.step(direction)
+                self.stepped += 1
+        return self.score - start_score
+
+    def _quiet_ticks(self, direction: Optional[int]) -> int:
+        """How many ticks from now only count down, with this input held"""
+        if self.offset:
+            if direction is not None and direction == self.direction ^ 2:
+                return 0
+            quiet = self.offset
+        else:
+            board = self.board
+            if board.move(self.player, self.direction) or (
+                    direction is not None and direction != self.direction and board.move(self.player, direction)):
+                return 0
+            quiet = 1 << 62  # stuck against a wall until the input changes
+        states, offsets, frightened = self.ghost_states, self.ghost_offsets, self.frightened
+        for i in range(self.ghost_count):
+            if states[i] == 4:
+                if self.respawn_ms[i] == 0:
+                    return 0
+                # First tick whose now_ms is GHOST_RESPAWN_MS past being eaten
+                due = -(-(self.respawn_ms[i] + GHOST_RESPAWN_MS) * FPS // 1000)
+                quiet = min(quiet, due - self.ticks - 1)
+                continue
+            if self.replanned[i] is None:
+                return 0
+            # First tick whose now_ms is more than replan_interval past the last re-plan
+            due = -(-(self.replanned[i] + self.replan_interval + 1) * FPS // 1000)
+            quiet = min(quiet, due - self.ticks - 1)
+            heading = self.ghost_directions[i]
+            if offsets[i]:
+                if heading == self.ghost_motions[i]:
+                    quiet = min(quiet, offsets[i])
+                elif heading == self.ghost_motions[i] ^ 2:
+                    return 0
+            elif self.board.move(self.ghosts[i], heading):
+                return 0
+            if states[i] == 3 and frightened[i] > 0:
+                quiet = min(quiet, frightened[i] - 1)
+        return max(quiet, 0)
+
+    def _skip(self, ticks: int):
+        """Play `ticks` quiet ticks at once (see _quiet_ticks)"""
+        self.ticks += ticks
+        self.level_loaded = False
+        if self.offset:
+            self.offset -= ticks
+            if not self.offset:
+                self.previous = 0
+        states, offsets = self.ghost_states, self.ghost_offsets
+        for i in range(self.ghost_count):
+            if states[i] == 4:
+                continue
+            if offsets[i] and self.ghost_directions[i] == self.ghost_motions[i]:
+                offsets[i] -= ticks
+                if not offsets[i]:
+                    self.ghost_previous[i] = 0
+            if states[i] == 3 and self.frightened[i] > 0:
+                self.frightened[i] -= ticks
+
+    def player_position(self) -> Tuple[int, int]:
+        """The player's pixel position, comparable to Simulation's player.rect.topleft"""
+        cell = self.player.bit_length() - 1
+        back = self.offset * PLAYER_SPEED
+        return (cell % self.board.width * CELL_SIZE - DX[self.direction] * back,
+                cell // self.board.width * CELL_SIZE - DY[self.direction] * back)
+
+    def ghost_position(self, i: int) -> Tuple[int, int]:
+        """Ghost i's pixel position, comparable to Simulation's ghost.rect.topleft"""
+        cell = self.ghosts[i].bit_length() - 1
+        back = self.ghost_offsets[i] * GHOST_SPEED
+        motion = self.ghost_motions[i]
+        return (cell % self.board.width * CELL_SIZE - DX[motion] * back,
+                cell // self.board.width * CELL_SIZE - DY[motion] * back)
+
+    def snapshot(self) -> tuple:
+        """The full state of a loaded run as a hashable tuple"""
+        return (self.current_level, self.ticks, self.score, self.lives, self.over, self.dots, self.pellets,
+                self.player, self.previous, self.direction, self.offset, tuple(self.ghosts),
+                tuple(self.ghost_previous), tuple(self.ghost_directions), tuple(self.ghost_motions),
+                tuple(self.ghost_offsets), tuple(self.replanned), tuple(self.ghost_states), tuple(self.frightened),
+                tuple(self.respawn_ms), tuple(self.deaths))
+
+    def restore(self, state: tuple):
+        (level, self.ticks, self.score, self.lives, self.over, self.dots, self.pellets, self.player,
+         self.previous, self.direction, self.offset, ghosts, previous, directions, motions, offsets, replanned,
+         states, frightened, respawn, deaths) = state
+        self.board = self._board(level)
+        if not self.board:
+            raise ValueError(f"no level {level}")
+        self.current_level = level
+        self.ghosts, self.ghost_previous = list(ghosts), list(previous)
+        self.ghost_directions, self.ghost_motions, self.ghost_offsets = list(directions), list(motions), list(offsets)
+        self.replanned = list(replanned)
+        self.ghost_states, self.frightened, self.respawn_ms = list(states), list(frightened), list(respawn)
+        self.deaths = list(deaths)
+        self.level_loaded = False
+
+    def clone(self) -> 'BitboardSim':
+        copy = BitboardSim(self.levels, self.ghost_count > 0, self.replan_interval)
+        copy.boards = self.boards
+        copy.restore(self.snapshot())
+        return copy
+
+
+def random_inputs(rng: np.random.Generator, ticks: int) -> List[Tuple[int, Optional[int]]]:
+    """(tick, input) changes of a wandering player, like simulate.wander: a key now and then"""
+    events = []
+    current = None
+    for tick in range(1, ticks + 1):
+        action = int(rng.integers(4)) if rng.random() < 0.05 else None
+        if action != current:
+            events.append((tick, action))
+            current = action
+    return events
+
+
+def _inputs(events, ticks: int):
+    """Per-tick input from (tick, input) changes"""
+    events = iter(events)
+    upcoming = next(events, None)
+    direction = None
+    for tick in range(1, ticks + 1):
+        if upcoming is not None and upcoming[0] == tick:
+            direction = upcoming[1]
+            upcoming = next(events, None)
+        yield direction
+
+
+def compare(levels: Callable, level: int, events, ticks: int) -> Tuple[str, int]:
+    """Replay inputs on Simulation and BitboardSim without ghosts, tick by tick
+
+    Returns ('same', ticks), ('left maze', tick) when Simulation's player
+    walked off the map, ('turned mid-cell', tick) when it turned across a
+    two-cell-wide stretch between cells, or ('differs', tick) at the first
+    tick where the player's position, the score, the dots left, the level
+    or game over disagree.
+    """
+    from simulation import Simulation
+
+    sim = Simulation(levels)
+    sim.set_quality(False, GHOST_REPLAN_INTERVAL)
+    sim.reset(level)
+    sim.load_level()
+    sim.ghosts = []
+    engine = BitboardSim(levels)
+    engine.reset(level)
+    engine.load_level()
+    width = engine.board.width * CELL_SIZE
+    height = engine.board.height * CELL_SIZE
+    for tick, direction in enumerate(_inputs(events, ticks), 1):
+        sim.step(direction)
+        if sim.level_loaded:
+            sim.ghosts = []
+        engine.step(direction)
+        x, y = sim.player.rect.topleft
+        if not (0 <= x <= width - CELL_SIZE and 0 <= y <= height - CELL_SIZE):
+            return 'left maze', tick
+        if (sim.player.direction ^ engine.direction) & 1 and (x % CELL_SIZE or y % CELL_SIZE):
+            return 'turned mid-cell', tick
+        if ((x, y) != engine.player_position() or sim.score != engine.score or sim.over != engine.over
+                or sim.current_level != engine.current_level
+                or len(sim.dots) != engine.dots.bit_count() or len(sim.power_pellets) != engine.pellets.bit_count()):
+            return 'differs', tick
+        if sim.over:
+            break
+    return 'same', tick
+
+
+def play(engine, events, ticks: int) -> Tuple[int, int]:
+    """Score and ticks played for a Simulation or BitboardSim on the given inputs"""
+    for direction in _inputs(events, ticks):
+        engine.step(direction)
+        if engine.over:
+            break
+    return engine.score, engine.ticks
+
+
+def play_events(engine: BitboardSim, events, ticks: int) -> Tuple[int, int]:
+    """play() with BitboardSim.advance between input changes"""
+    direction = None
+    for tick, action in list(events) + [(ticks + 1, None)]:
+        engine.advance(direction, tick - 1 - engine.ticks)
+        if engine.over:
+            break
+        direction = action
+    return engine.score, engine.ticks
+
+
+def compare_events(levels: Callable, level: int, events, ticks: int) -> Optional[int]:
+    """Play inputs through step() and advance() side by side
+
+    Returns None if their snapshots agree at every input change, else the
+    tick of the first change where they don't.
+    """
+    stepped = BitboardSim(levels, ghosts=True)
+    jumped = BitboardSim(levels, ghosts=True)
+    jumped.boards = stepped.boards
+    for engine in (stepped, jumped):
+        engine.reset(level)
+        engine.load_level()
+    direction = None
+    for tick, action in list(events) + [(ticks + 1, None)]:
+        while stepped.ticks < tick - 1 and not stepped.over:
+            stepped.step(direction)
+        jumped.advance(direction, tick - 1 - jumped.ticks)
+        if stepped.snapshot() != jumped.snapshot():
+            return tick - 1
+        if stepped.over:
+            break
+        direction = action
+    return None
+
+
+if __name__ == '__main__':
+    from env import load_levels
+    from input_log import load_log
+    from simulation import Simulation
+
+    parser = argparse.ArgumentParser(description="Check or time the bitboard rules")
+    parser.add_argument('command', choices=('validate', 'bench'))
+    parser.add_argument('logs', nargs='*', help="input logs to replay (validate); random inputs otherwise")
+    parser.add_argument('--runs', type=int, default=20, help="random input runs (per level for validate)")
+    parser.add_argument('--ticks', type=int, default=3000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    compiled = load_levels()
+
+    if args.command == 'bench':
+        runs = [random_inputs(np.random.default_rng((args.seed, run)), args.ticks) for run in range(args.runs)]
+        # Same rules as Simulation's (with ghosts), then the ghost-free rollout mode
+        for label, make, player in (('simulation', lambda: Simulation(compiled.get), play),
+                                    ('bitboard', lambda: BitboardSim(compiled.get, True), play),
+                                    ('events', lambda: BitboardSim(compiled.get, True), play_events),
+                                    ('no ghosts', lambda: BitboardSim(compiled.get), play_events)):
+            engine = make()
+            if label == 'simulation':
+                engine.set_quality(False, GHOST_REPLAN_INTERVAL)
+            steps = stepped = 0
+            started = time.perf_counter()
+            for events in runs:
+                engine.reset(1)
+                engine.load_level()
+                steps += player(engine, events, args.ticks)[1]
+                stepped += engine.ticks if player is play else engine.stepped
+            elapsed = time.perf_counter() - started
+            print(f"{label:10}  {steps / elapsed:9.0f} ticks/s, {stepped / steps:4.0%} of ticks stepped")
+    else:
+        if args.logs:
+            runs = []
+            for path in args.logs:
+                log = load_log(path)
+                runs.append((path, log.level, log.events, log.ticks, log.replan_interval))
+        else:
+            runs = [(f"L{level} #{run}", level, random_inputs(np.random.default_rng((args.seed, level, run)),
+                                                              args.ticks), args.ticks, GHOST_REPLAN_INTERVAL)
+                    for level in sorted(compiled) for run in range(args.runs)]
+        outcomes = {'same': 0, 'left maze': 0, 'turned mid-cell': 0, 'differs': 0}
+        mismatched = 0
+        scores = {'simulation': [], 'bitboard': []}
+        for name, level, events, ticks, interval in runs:
+            outcome, tick = compare(compiled.get, level, events, ticks)
+            outcomes[outcome] += 1
+            if outcome == 'differs':
+                print(f"{name}: differs from tick {tick}")
+            tick = compare_events(compiled.get, level, events, ticks)
+            if tick is not None:
+                mismatched += 1
+                print(f"{name}: advance() and step() disagree by tick {tick}")
+            sim = Simulation(compiled.get)
+            sim.set_quality(False, interval)
+            for label, engine in (('simulation', sim), ('bitboard', BitboardSim(compiled.get, True, interval))):
+                engine.reset(level)
+                engine.load_level()
+                scores[label].append(play(engine, events, ticks))
+        print(f"without ghosts: {outcomes['same']} runs identical, {outcomes['left maze']} identical until "
+              f"Simulation's player left the maze, {outcomes['turned mid-cell']} until it turned mid-cell, "
+              f"{outcomes['differs']} differ")
+        reference = np.mean(scores['simulation'], axis=0)
+        gaps = np.mean(scores['bitboard'], axis=0) / np.maximum(reference, 1) - 1
+        for label, results in scores.items():
+            score, played = np.mean(results, axis=0)
+            print(f"with ghosts, {label:10}  mean score {score:.0f}, mean ticks {played:.0f}")
+        close = bool(np.all(np.abs(gaps) <= GHOST_TOLERANCE))
+        print(f"with ghosts, bitboard is {gaps[0]:+.1%} on score and {gaps[1]:+.1%} on ticks: "
+              f"{'within' if close else 'OUTSIDE'} the {GHOST_TOLERANCE:.0%} tolerance")
+        print(f"advance() against step(): {len(runs) - mismatched} of {len(runs)} runs identical")
+        if outcomes['differs'] or mismatched or not close:
+            sys.exit(1)
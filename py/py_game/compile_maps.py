@@ -0,0 +1,92 @@
+# compile_maps.py
+"""Precompute per-level artifacts (walls, navigation, distances) into pacman.db
+
+Run after init_maps.py or whenever levels change; levels whose content
+hash already has artifacts of the current version are skipped.
+
+    python compile_maps.py --check   # merged wall rects == wall cells, stored levels and edge cases
+"""
+import argparse
+import sys
+import time
+
+from artifacts import ARTIFACT_VERSION, compute_artifacts, rects_cover_exactly, wall_rects
+from database import Database
+from init_maps import config_levels
+from level import content_hash
+
+
+def compile_levels(db: Database, levels, force: bool = False):
+    compiled = skipped = 0
+    for level in levels:
+        digest = content_hash(level)
+        if not force and db.has_artifacts(digest):
+            skipped += 1
+            continue
+        start = time.perf_counter()
+        artifacts = compute_artifacts(level)
+        db.save_artifacts(artifacts)
+        compiled += 1
+        print(f"level {level.number:3d}: {len(artifacts.wall_rects)} wall rects, "
+              f"{len(artifacts.junctions)} junctions, {artifacts.dot_count} dots "
+              f"({(time.perf_counter() - start) * 1000:.0f} ms)")
+        for error in artifacts.spawn_errors:
+            print(f"  warning: {error}")
+    print(f"compiled {compiled}, up to date {skipped} (artifact version {ARTIFACT_VERSION})")
+
+
+# Grids the wall merge has to get right besides the stored levels
+EDGE_CASES = (
+    ('empty level', []),
+    ('single wall cell', [[1]]),
+    ('single open cell', [[0]]),
+    ('fully walled row', [[1, 1, 1, 1], [0, 0, 0, 0], [0, 2, 0, 0]]),
+    ('fully walled level', [[1, 1, 1], [1, 1, 1]]),
+    ('single wall column', [[0, 1, 0], [0, 1, 0], [0, 1, 0]]),
+    ('checkerboard', [[(x + y) % 2 for x in range(5)] for y in range(4)]),
+    ('notched block', [[1, 1, 1], [1, 0, 1], [1, 1, 1]]),
+)
+
+
+def check_levels(db: Database, levels) -> int:
+    """Check that the merged wall rectangles tile exactly the wall cells; returns the failures
+
+    Covers the merge of every given level, the rects stored with its
+    artifacts (if it has any) and EDGE_CASES.
+    """
+    artifacts = db.get_all_artifacts()
+    cases = [(name, grid, wall_rects(grid)) for name, grid in EDGE_CASES]
+    for level in levels:
+        cases.append((f"level {level.number}", level.grid, wall_rects(level.grid)))
+        stored = artifacts.get(content_hash(level))
+        if stored:
+            cases.append((f"level {level.number} (stored)", level.grid, stored.wall_rects))
+    failures = 0
+    for name, grid, rects in cases:
+        if not rects_cover_exactly(rects, grid):
+            failures += 1
+            print(f"{name}: wall rects don't tile the wall cells")
+    print(f"checked {len(cases)} wall layouts, {failures} failed")
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source', choices=('db', 'config'), default='db',
+                        help="compile the levels stored in pacman.db or MAPS_CONFIG")
+    parser.add_argument('--force', action='store_true', help="recompile up-to-date levels too")
+    parser.add_argument('--check', action='store_true', help="only check the wall rects, compile nothing")
+    args = parser.parse_args()
+
+    db = Database(read_only=args.check)
+    if args.source == 'config':
+        levels = list(config_levels())
+    else:
+        all_levels = db.get_all_levels()
+        levels = [all_levels[n] for n in sorted(all_levels)]
+    if args.check:
+        failed = check_levels(db, levels)
+        db.close()
+        sys.exit(1 if failed else 0)
+    compile_levels(db, levels, args.force)
+    db.close()
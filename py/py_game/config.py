@@ -1,5 +1,8 @@
 # config.py
-import pygame
+# Plain constants only - keep this module free of heavy imports, every
+# other module pulls it in with `from config import *` (hence the
+# underscore: os isn't re-exported).
+import os as _os
 
 # Colors
 WHITE = (255, 255, 255)
@@ -20,6 +23,10 @@ PATH_WIDTH = CELL_SIZE * 1.5  # 通道宽度
 PLAYER_SIZE = CELL_SIZE - 5  # 玩家大小略小于格子
 GHOST_SIZE = CELL_SIZE
 
+# Spawn cells (x, y)
+PLAYER_SPAWN = (13, 23)
+GHOST_SPAWNS = ((12, 14), (13, 14), (14, 14), (15, 14))
+
 # Game states
 STATE_MENU = 0
 STATE_PLAYING = 1 
@@ -27,9 +34,45 @@ STATE_PAUSED = 2
 STATE_GAME_OVER = 3
 
 # Game settings
+FPS = 60
 PLAYER_SPEED = 2
 GHOST_SPEED = 1
+GHOST_REPLAN_INTERVAL = 500  # ms between ghost path updates
 INITIAL_LIVES = 5
 POWER_PELLET_DURATION = 250
+GHOST_RESPAWN_MS = 5000  # eaten ghosts wait this long before restarting at home
+# Frightened ghosts' candidate directions, by which way the player is
+# mostly away: ghost right of, left of, below, above the player
+GHOST_ESCAPE_CHOICES = ((0, 1, 3), (2, 1, 3), (1, 0, 2), (3, 0, 2))
+
+# Startup
+STARTUP_TARGET_MS = 500  # menu should be on screen within this time
+
+# Garbage collector: 'auto' or 'deferred' (gen 2 only at level transitions/pause)
+GC_MODE = 'auto'
+
+# Frame-budget governor: degrade quality step by step when frames overrun
+ADAPTIVE_QUALITY = True
+SLOW_HUD_INTERVAL = 15  # frames between HUD refreshes at QUALITY_SLOW_HUD
+
+# Database: pacman.db at the repository root unless PACMAN_DB points elsewhere,
+# absolute so the tools work from any working directory
+DB_PATH = _os.path.abspath(_os.environ.get('PACMAN_DB') or
+                           _os.path.join(_os.path.dirname(__file__), '..', '..', 'pacman.db'))
+DB_STATEMENT_CACHE = 128   # prepared statements kept per connection
+
+# Score persistence (background writer, see score_writer.py)
+DB_SYNCHRONOUS = 'NORMAL'  # OFF/NORMAL/FULL; NORMAL can't corrupt in WAL mode, only lose the last commits
+SCORE_QUEUE_SIZE = 1024    # queued submissions before the game starts dropping scores
+SCORE_BATCH_SIZE = 5000    # most rows written per transaction
+LEADERBOARD_SIZE = 100     # best runs kept in memory for the leaderboard
 
+# Replays (see replays.py)
+RECORD_REPLAYS = True
+REPLAY_SPOOL_BYTES = 1 << 20  # compressed replay kept in memory up to this, then on disk
 
+# Deterministic runs: the quality governor may no longer slow ghost
+# re-planning, so a run is a function of its seed and inputs alone, and
+# every run's input log is saved to INPUT_LOG_DIR (see input_log.py)
+DETERMINISTIC = False
+INPUT_LOG_DIR = _os.path.join(_os.path.dirname(DB_PATH), 'input_logs')
@@ -1,49 +1,218 @@
 # database.py
+import os
+import pathlib
 import sqlite3
-from typing import List, Tuple
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from artifacts import ARTIFACT_VERSION, LevelArtifacts
+from level import (Level, LEVEL_FORMAT_VERSION, content_hash, decode_level, encode_grid,
+                   encode_pellets, level_to_map)
+from migrations import SCHEMA_VERSION, migrate, stored_schema_version
+from score_writer import ScoreWriter
+from config import DB_PATH, DB_STATEMENT_CACHE, DB_SYNCHRONOUS
+
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def sqlite_uri(path: str, **params) -> str:
+    """file: URI for sqlite3.connect(uri=True), e.g. sqlite_uri(p, mode='ro')"""
+    query = '&'.join(f'{key}={value}' for key, value in params.items())
+    return pathlib.Path(path).resolve().as_uri() + (f'?{query}' if query else '')
+
 
 class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect('pacman.db')
-        self.cursor = self.conn.cursor()
+    """pacman.db shared by the game, its background threads and tools
+
+    All writes go through one connection behind write_lock (see
+    transaction()), so writers queue up in Python instead of failing with
+    "database is locked". Reads use a read-only connection per thread,
+    which in WAL mode never waits for the writer.
+
+    read_only refuses writes; a database that isn't migrated yet is
+    brought up to date once on a short-lived writer connection first
+    (immutable ones can't be, they raise instead). immutable additionally
+    tells SQLite the file can't change (no locking at all), for worker
+    processes reading a database nothing else is writing to. Immutable
+    readers don't see the WAL, so checkpoint() or close the writers first.
+    """
+    def __init__(self, path: str = None, synchronous: str = DB_SYNCHRONOUS,
+                 read_only: bool = False, immutable: bool = False):
+        synchronous = synchronous.upper()
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"synchronous must be one of {SYNCHRONOUS_MODES}, not {synchronous!r}")
+        self.path = str(pathlib.Path(path or DB_PATH).resolve())
+        self.read_only = read_only or immutable
+        self.immutable = immutable
+        if immutable and os.path.exists(self.path + '-wal') and os.path.getsize(self.path + '-wal'):
+            raise ValueError(f"{self.path} has uncheckpointed WAL content, it can't be opened immutable")
+        self.write_lock = threading.RLock()
+        self.conn: Optional[sqlite3.Connection] = None
+        if not self.read_only:
+            # Opened by the startup preloader thread, then used by whichever
+            # thread holds write_lock
+            self.conn = sqlite3.connect(self.path, check_same_thread=False,
+                                        cached_statements=DB_STATEMENT_CACHE)
+            # WAL lets readers and the score writer work at the same time
+            self.conn.execute('PRAGMA journal_mode = WAL')
+            self.conn.execute(f'PRAGMA synchronous = {synchronous}')
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._scores: Optional[ScoreWriter] = None
+        self.levels: Dict[int, Level] = {}  # decoded levels, shared and immutable
+        # Called with a level number whenever that level's content changes
+        self.level_listeners: List[Callable[[int], None]] = []
         self.create_tables()
-        
+
     def create_tables(self):
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS maps (
-            level INTEGER PRIMARY KEY,
-            map_data TEXT,
-            wall_color TEXT,
-            power_pellets TEXT
-        )''')
-        
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS scores (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            score INTEGER,
-            completed_level INTEGER,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )''')
-        self.conn.commit()
-        
+        if not self.read_only:
+            with self.write_lock:
+                migrate(self.conn)
+            return
+        version = stored_schema_version(self.reader()) if os.path.exists(self.path) else 0
+        if version >= SCHEMA_VERSION:
+            return
+        if self.immutable:
+            raise sqlite3.OperationalError(
+                f"{self.path} is at schema version {version}, not {SCHEMA_VERSION}: "
+                "run the game or migrate it first")
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute('PRAGMA journal_mode = WAL')
+            migrate(conn)
+        finally:
+            conn.close()
+
+    def reader(self) -> sqlite3.Connection:
+        """The calling thread's read-only connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            params = {'mode': 'ro'}
+            if self.immutable:
+                params['immutable'] = 1
+            # check_same_thread is off only so close() can close it
+            conn = sqlite3.connect(sqlite_uri(self.path, **params), uri=True,
+                                   check_same_thread=False, cached_statements=DB_STATEMENT_CACHE)
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """The writer connection, committed on exit or rolled back on error"""
+        if self.read_only:
+            raise sqlite3.OperationalError(f"{self.path} was opened read-only")
+        with self.write_lock:
+            with self.conn:
+                yield self.conn
+
+    def checkpoint(self):
+        """Fold the WAL back into the main file (e.g. before handing it to immutable readers)"""
+        with self.write_lock:
+            self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
     def save_map(self, level: int, map_data: List[List[int]], wall_color: str, power_pellets: dict):
-        self.cursor.execute(
-            'INSERT OR REPLACE INTO maps (level, map_data, wall_color, power_pellets) VALUES (?, ?, ?, ?)',
-            (level, str(map_data), wall_color, str(power_pellets))
-        )
-        self.conn.commit()
-        
+        pellets = frozenset(tuple(int(v) for v in key.split(',')) for key in power_pellets) \
+            if isinstance(power_pellets, dict) else frozenset(power_pellets)
+        self.save_levels([Level(level, tuple(tuple(row) for row in map_data), pellets, wall_color)])
+
+    def save_levels(self, levels: Iterable[Level]) -> List[int]:
+        """Write the levels whose content changed, in one transaction
+
+        Returns the numbers of the levels written; listeners registered in
+        level_listeners are called for each of them after the commit.
+        """
+        levels = list(levels)
+        with self.transaction() as conn:
+            stored = dict(conn.execute('SELECT level, content_hash FROM maps').fetchall())
+            rows = []
+            for level in levels:
+                digest = content_hash(level)
+                if stored.get(level.number) != digest:
+                    rows.append((level.number, encode_grid(level.grid), level.color,
+                                 encode_pellets(level.pellets), LEVEL_FORMAT_VERSION, digest))
+            if rows:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO maps '
+                    '(level, map_data, wall_color, power_pellets, format_version, content_hash) '
+                    'VALUES (?, ?, ?, ?, ?, ?)', rows)
+        changed = [row[0] for row in rows]
+        for number in changed:
+            self.levels.pop(number, None)
+            for listener in self.level_listeners:
+                listener(number)
+        return changed
+
+    def get_level(self, level: int) -> Optional[Level]:
+        """Decoded level, parsed once and then served from memory"""
+        if level not in self.levels:
+            result = self.reader().execute(
+                'SELECT map_data, wall_color, power_pellets, format_version FROM maps WHERE level = ?',
+                (level,)).fetchone()
+            if not result:
+                return None
+            self.levels[level] = decode_level(level, *result)
+        return self.levels[level]
+
+    def get_all_levels(self) -> Dict[int, Level]:
+        """Decode every level in one query (and cache them)"""
+        rows = self.reader().execute(
+            'SELECT level, map_data, wall_color, power_pellets, format_version FROM maps ORDER BY level')
+        for row in rows:
+            if row[0] not in self.levels:
+                self.levels[row[0]] = decode_level(*row)
+        return dict(self.levels)
+
     def get_map(self, level: int) -> Tuple[List[List[int]], str, dict]:
-        self.cursor.execute('SELECT map_data, wall_color, power_pellets FROM maps WHERE level = ?', (level,))
-        result = self.cursor.fetchone()
+        result = self.get_level(level)
         if result:
-            return eval(result[0]), result[1], eval(result[2])
+            return level_to_map(result)
         return None, None, None
 
-    def save_score(self, score: int, level: int):
-        self.cursor.execute(
-            'INSERT INTO scores (score, completed_level) VALUES (?, ?)',
-            (score, level)
-        )
-        self.conn.commit()
+    def get_artifacts(self, content_hash: str, version: int = ARTIFACT_VERSION) -> Optional[LevelArtifacts]:
+        result = self.reader().execute(
+            'SELECT meta, distances FROM level_artifacts WHERE content_hash = ? AND version = ?',
+            (content_hash, version)).fetchone()
+        if result:
+            return LevelArtifacts.from_row(content_hash, *result)
+        return None
+
+    def get_all_artifacts(self, version: int = ARTIFACT_VERSION) -> Dict[str, LevelArtifacts]:
+        rows = self.reader().execute(
+            'SELECT content_hash, meta, distances FROM level_artifacts WHERE version = ?', (version,))
+        return {row[0]: LevelArtifacts.from_row(*row) for row in rows}
+
+    def has_artifacts(self, content_hash: str, version: int = ARTIFACT_VERSION) -> bool:
+        return self.reader().execute(
+            'SELECT 1 FROM level_artifacts WHERE content_hash = ? AND version = ?',
+            (content_hash, version)).fetchone() is not None
+
+    def save_artifacts(self, artifacts: LevelArtifacts):
+        with self.transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO level_artifacts (content_hash, version, meta, distances) '
+                'VALUES (?, ?, ?, ?)', artifacts.to_row())
+
+    @property
+    def scores(self) -> ScoreWriter:
+        """Background score writer, started on first use"""
+        if self._scores is None:
+            self._scores = ScoreWriter(self)
+        return self._scores
+
+    def save_score(self, score: int, level: int, player: str = None, session: str = None) -> bool:
+        """Queue a score for the background writer; never waits on disk"""
+        return self.scores.submit(score, level, player, session)
 
+    def close(self):
+        if self._scores is not None:
+            self._scores.close()
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        if self.conn is not None:
+            with self.write_lock:
+                self.conn.close()
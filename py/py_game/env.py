@@ -0,0 +1,116 @@
+# env.py
+"""Gymnasium-style environment over the game rules, no window needed
+
+    env = PacmanEnv()
+    obs, info = env.reset(seed=0)
+    obs, reward, terminated, truncated, info = env.step(action)
+
+Actions are the game's directions, 0 right, 1 down, 2 left, 3 up, plus
+NOOP (4) for no key. The observation is a dict:
+    'state'  int32 vector, one entry per STATE_FIELDS name
+    'dots'   uint8 (height, width) cell grid, 1 dot, 2 power pellet, 0 empty
+The reward is the score gained by the step (dots 10, pellets 50, ghosts
+100). terminated means the run is over (out of lives or levels),
+truncated that max_steps ran out first.
+"""
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from config import *
+from database import Database
+from level_cache import CompiledLevel, LevelCache
+from simulation import Simulation
+
+RIGHT, DOWN, LEFT, UP, NOOP = range(5)
+ACTIONS = 5
+
+STATE_FIELDS = ('player_x', 'player_y', 'player_direction', 'lives', 'level', 'score', 'ticks') + tuple(
+    f'ghost{i}_{field}' for i in range(len(GHOST_SPAWNS)) for field in ('x', 'y', 'state', 'direction'))
+
+
+def load_levels(db_path: str = None) -> Dict[int, CompiledLevel]:
+    """Compile every level once; environments can share the result"""
+    db = Database(db_path, read_only=True)
+    cache = LevelCache(db)
+    try:
+        return cache.compile_all()
+    finally:
+        cache.close()
+        db.close()
+
+
+def dot_grid(compiled: CompiledLevel) -> np.ndarray:
+    """Fresh 'dots' observation for the start of a level"""
+    grid = np.zeros((len(compiled.level.grid), len(compiled.level.grid[0])), dtype=np.uint8)
+    for rect in compiled.dots:
+        grid[rect.y // CELL_SIZE, rect.x // CELL_SIZE] = 1
+    for rect in compiled.pellets:
+        grid[rect.y // CELL_SIZE, rect.x // CELL_SIZE] = 2
+    return grid
+
+
+class PacmanEnv:
+    """One headless game; reset() reuses the compiled levels, nothing is reloaded"""
+    def __init__(self, levels: Dict[int, CompiledLevel] = None, max_steps: int = None,
+                 start_level: int = 1, db_path: str = None):
+        self.levels = levels if levels is not None else load_levels(db_path)
+        self.max_steps = max_steps
+        self.start_level = start_level
+        self.sim = Simulation(self.levels.get)
+        self.sim.set_quality(False, GHOST_REPLAN_INTERVAL)  # nobody sees the mouth
+        self.seed: Optional[int] = None
+        self.dot_templates: Dict[int, np.ndarray] = {}
+        self.dots: Optional[np.ndarray] = None
+
+    def reset(self, seed: int = None, options: dict = None) -> Tuple[dict, dict]:
+        """Start a new run; options={'level': n} starts on another level
+
+        seed goes to the simulation's RNG (kept from the last reset if
+        None); the current rules draw nothing from it.
+        """
+        if seed is not None:
+            self.seed = seed
+        level = (options or {}).get('level', self.start_level)
+        self.sim.reset(level, self.seed)
+        if not self.sim.load_level():
+            raise ValueError(f"no level {level}")
+        self._load_dots()
+        return self.observation(), self.info()
+
+    def step(self, action: int) -> Tuple[dict, float, bool, bool, dict]:
+        sim = self.sim
+        if sim.over:
+            raise RuntimeError("step() after the run ended, call reset() first")
+        reward = sim.step(None if action == NOOP else int(action))
+        if sim.level_loaded:
+            self._load_dots()
+        else:
+            for rect in sim.eaten:
+                self.dots[rect.y // CELL_SIZE, rect.x // CELL_SIZE] = 0
+        terminated = sim.over
+        truncated = not terminated and self.max_steps is not None and sim.ticks >= self.max_steps
+        return self.observation(), float(reward), terminated, truncated, self.info()
+
+    def _load_dots(self):
+        number = self.sim.current_level
+        if number not in self.dot_templates:
+            self.dot_templates[number] = dot_grid(self.sim.compiled)
+        self.dots = self.dot_templates[number].copy()
+
+    def state(self) -> np.ndarray:
+        sim = self.sim
+        player = sim.player
+        values = [player.rect.x, player.rect.y, player.direction,
+                  sim.lives, sim.current_level, sim.score, sim.ticks]
+        for ghost in sim.ghosts:
+            values += (ghost.rect.x, ghost.rect.y, ghost.state, ghost.direction)
+        return np.array(values, dtype=np.int32)
+
+    def observation(self) -> dict:
+        return {'state': self.state(), 'dots': self.dots.copy()}
+
+    def info(self) -> dict:
+        sim = self.sim
+        return {'score': sim.score, 'lives': sim.lives, 'level': sim.current_level,
+                'ticks': sim.ticks, 'won': sim.won, 'seed': sim.seed}
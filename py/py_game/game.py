@@ -1,59 +1,116 @@
 # game.py
 import pygame
-import random
+import uuid
 from config import *
-from sprites import Player, Ghost
+from simulation import Simulation
 from database import Database
+from level_cache import LevelCache
+from leaderboard import Leaderboard
+from replays import Frame, ReplayRecorder
+from input_log import InputRecorder, save_log
+from startup import StartupProfile, Preloader
+from gc_control import GCMonitor
+from timing import FrameTimer
+from governor import (FrameGovernor, QUALITY_SLOW_REPLAN, QUALITY_NO_MOUTH,
+                      QUALITY_SLOW_HUD, QUALITY_DIRTY_RECTS)
 
 class Game:
-    def __init__(self):
-        pygame.init()
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        pygame.display.set_caption("Pac-Man")
+    def __init__(self, profile: StartupProfile = None, gc_mode: str = GC_MODE,
+                 render_every: int = 1, fps: int = FPS, timings_path: str = None,
+                 autoplay: int = None):
+        self.profile = profile or StartupProfile()
+        self.autoplay = autoplay  # MCTS search processes when the agent plays, 0 = in-process
+        self.agent = None
+        self.timer = FrameTimer(export_path=timings_path)
+        self.timer_overlay = None  # (rendered on frame, [(surface, pos)], rows)
+        self.render_every = render_every  # draw every N ticks, 0 = only on demand
+        self.fps = fps                    # 0 = run the simulation uncapped
+        self.ticks = 0
+        self.render_requested = False
+        self.gc = GCMonitor(gc_mode, 1000 / (fps or FPS))  # uncapped runs are held to the default rate
+        self.session = uuid.uuid4().hex  # tags every score from this run of the program
+
+        # Only bring up what the menu needs; pygame.init() would also start
+        # the mixer, joystick and other subsystems we never use.
+        with self.profile.phase('display/font init'):
+            pygame.display.init()
+            pygame.font.init()
+        with self.profile.phase('set_mode'):
+            self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+            pygame.display.set_caption("Pac-Man")
         self.clock = pygame.time.Clock()
-        self.db = Database()
-        
+        self.clock.tick()  # starts SDL's timer so get_ticks() counts from here
+        self.fonts = {}
+        self.governor = FrameGovernor(fps or FPS, enabled=ADAPTIVE_QUALITY)  # like self.gc
+
+        # Everything else is opened in the background while the menu is up
+        self.preloader = Preloader(self.profile)
+        self.preloader.add('database', Database)
+        self.preloader.add('levels', self.open_level_cache)
+        self.preloader.add('leaderboard', lambda: Leaderboard(self.preloader.results['database']))
+        self.preloader.start()
+
+        self.reset()
+
+    @property
+    def db(self) -> Database:
+        return self.preloader.get('database')
+
+    @property
+    def levels(self) -> LevelCache:
+        return self.preloader.get('levels')
+
+    @property
+    def leaderboard(self) -> Leaderboard:
+        return self.preloader.get('leaderboard')
+
+    def open_level_cache(self) -> LevelCache:
+        levels = LevelCache(self.preloader.results['database'])
+        levels.get(1)  # compiled before SPACE is pressed
+        return levels
+
+    def font(self, size: int) -> pygame.font.Font:
+        if size not in self.fonts:
+            self.fonts[size] = pygame.font.Font(None, size)
+        return self.fonts[size]
+
+    def reset(self):
         self.state = STATE_MENU
-        self.current_level = 1
-        self.score = 0
-        self.lives = INITIAL_LIVES
-        
-        self.player = None
-        self.ghosts = []
-        self.walls = []
-        self.dots = []
-        self.power_pellets = []
+        # Rules and actors; levels are looked up lazily so the menu never
+        # waits for the preloader
+        self.sim = Simulation(lambda number: self.levels.get(number), self.timer)
+        self.final_rank = None  # (rank, runs, percentile), set at game over
+        self.recorder = None    # ReplayRecorder of the run in progress
+        self.input_recorder = None  # InputRecorder of the run, DETERMINISTIC only
+        self.wall_layer = None
+
+        self.frame = 0
+        self.hud = None          # (values, [(surface, pos)], rendered on frame)
+        self.dirty_ready = False  # screen holds a complete playing frame
+        self.dirty_rects = []
         
     def load_level(self):
-        map_data, wall_color, power_pellets = self.db.get_map(self.current_level)
-        if not map_data:
+        if not self.sim.load_level():
             return False
-            
-        self.walls.clear()
-        self.dots.clear()
-        self.power_pellets.clear()
-        
-        for y, row in enumerate(map_data):
-            for x, cell in enumerate(row):
-                pos = (x * CELL_SIZE, y * CELL_SIZE)
-                if cell == 1:
-                    self.walls.append(pygame.Rect(pos, (CELL_SIZE, CELL_SIZE)))
-                elif cell == 0:
-                    if f"{x},{y}" in power_pellets:
-                        self.power_pellets.append(pygame.Rect(pos, (CELL_SIZE, CELL_SIZE)))
-                    else:
-                        self.dots.append(pygame.Rect(pos, (CELL_SIZE, CELL_SIZE)))
-                        
-        # Create player and ghosts
-        self.player = Player(13 * CELL_SIZE, 23 * CELL_SIZE)
-        self.ghosts = [
-            Ghost(12 * CELL_SIZE, 14 * CELL_SIZE, GHOST_COLORS[0]),
-            Ghost(13 * CELL_SIZE, 14 * CELL_SIZE, GHOST_COLORS[1]),
-            Ghost(14 * CELL_SIZE, 14 * CELL_SIZE, GHOST_COLORS[2]),
-            Ghost(15 * CELL_SIZE, 14 * CELL_SIZE, GHOST_COLORS[3])
-        ]
-        
+        self.level_loaded()
         return True
+
+    def level_loaded(self):
+        """The simulation just (re)started a level"""
+        self.wall_layer = self.sim.compiled.wall_layer
+        self.dirty_ready = False
+        # Have the next level ready before this one is cleared
+        self.levels.prefetch(self.sim.current_level + 1)
+
+        self.apply_quality()
+        self.gc.level_loaded()
+
+    def apply_quality(self):
+        """Push the governor's current quality level into the actors"""
+        level = self.governor.level
+        slow = level >= QUALITY_SLOW_REPLAN and not DETERMINISTIC  # would change the rules
+        interval = GHOST_REPLAN_INTERVAL * (2 if slow else 1)
+        self.sim.set_quality(level < QUALITY_NO_MOUTH, interval)
         
     def handle_events(self):
         for event in pygame.event.get():
@@ -63,100 +120,112 @@ class Game:
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     return False
+                elif event.key == pygame.K_F3:
+                    self.timer.toggle_overlay()
+                    # The dirty-rect path never repaints the panel's area, so
+                    # the next frame has to be a full one to clear it
+                    self.dirty_ready = False
+                elif event.key == pygame.K_F5:
+                    # Render one frame on demand when the cadence skips frames
+                    self.request_render()
                 elif event.key == pygame.K_SPACE:
                     if self.state == STATE_MENU:
                         self.state = STATE_PLAYING
+                        if RECORD_REPLAYS:
+                            self.recorder = ReplayRecorder(self.sim.current_level)
                         self.load_level()
+                        if self.autoplay is not None:
+                            if self.agent is None:
+                                from mcts import MCTSAgent
+                                self.agent = MCTSAgent(self.sim.levels, self.autoplay)
+                            self.agent.reset()
+                        if DETERMINISTIC:
+                            self.input_recorder = InputRecorder(self.sim)
                     elif self.state == STATE_PLAYING:
                         self.state = STATE_PAUSED
+                        self.gc.idle_point()
                     elif self.state == STATE_PAUSED:
                         self.state = STATE_PLAYING
                     elif self.state == STATE_GAME_OVER:
-                        self.__init__()
-                        self.state = STATE_MENU
+                        self.reset()
+                        self.gc.idle_point()
         return True
         
     def update(self):
         if self.state != STATE_PLAYING:
             return
 
-        ################################################
-        # Handle player movement based on next_direction
-        keys = pygame.key.get_pressed()
-        new_direction = None
-        if keys[pygame.K_LEFT]:
-            new_direction = 2
-        elif keys[pygame.K_RIGHT]:
-            new_direction = 0
-        elif keys[pygame.K_UP]:
-            new_direction = 3
-        elif keys[pygame.K_DOWN]:
-            new_direction = 1
-
-        # Try new direction if key pressed
-        if new_direction is not None:
-            next_rect = self.player.rect.copy()
-            if new_direction == 0: next_rect.x += self.player.speed
-            elif new_direction == 1: next_rect.y += self.player.speed
-            elif new_direction == 2: next_rect.x -= self.player.speed
-            elif new_direction == 3: next_rect.y -= self.player.speed
-            
-            # Check if new direction is possible
-            can_move = True
-            for wall in self.walls:
-                if next_rect.colliderect(wall):
-                    can_move = False
-                    break
-            
-            if can_move:
-                self.player.direction = new_direction
-        ################################################
-
-        ################################################
-
-        # Update player position
-        self.player.update(self.walls)
-                
-        # Update ghost positions
-        for ghost in self.ghosts:
-            ghost.update(self.player, self.walls)
-            
-        # Check dot collection
-        player_rect = self.player.rect
-        for dot in self.dots[:]:
-            if player_rect.colliderect(dot):
-                self.dots.remove(dot)
-                self.score += 10
-                
-        # Check power pellet collection
-        for pellet in self.power_pellets[:]:
-            if player_rect.colliderect(pellet):
-                self.power_pellets.remove(pellet)
-                self.score += 50
-                for ghost in self.ghosts:
-                    ghost.state = 3
-                    ghost.frightened_timer = POWER_PELLET_DURATION
-                    
-        # Check ghost collisions
-        for ghost in self.ghosts:
-            if player_rect.colliderect(ghost.rect):
-                if ghost.state == 3:
-                    ghost.state = 4
-                    self.score += 100
-                elif ghost.state == 1:
-                    self.lives -= 1
-                    if self.lives <= 0:
-                        self.state = STATE_GAME_OVER
-                    else:
-                        self.load_level()
-                        
-        # Check level completion
-        if not self.dots and not self.power_pellets:
-            self.current_level += 1
-            if not self.load_level():
-                self.state = STATE_GAME_OVER
+        sim = self.sim
+        if self.agent:
+            new_direction = self.agent.act(sim)
+            self.timer.lap('update.agent')
+        else:
+            # Handle player movement based on next_direction
+            keys = pygame.key.get_pressed()
+            new_direction = None
+            if keys[pygame.K_LEFT]:
+                new_direction = 2
+            elif keys[pygame.K_RIGHT]:
+                new_direction = 0
+            elif keys[pygame.K_UP]:
+                new_direction = 3
+            elif keys[pygame.K_DOWN]:
+                new_direction = 1
+
+        sim.step(new_direction)
+        self.dirty_rects.extend(sim.eaten)
+        if sim.level_loaded:
+            self.level_loaded()
+        if self.input_recorder:
+            self.input_recorder.record(new_direction)
+        if self.recorder:
+            self.recorder.add(Frame(
+                new_direction, sim.current_level, sim.player.rect.topleft, sim.score,
+                tuple((ghost.rect.x, ghost.rect.y, ghost.state) for ghost in sim.ghosts)))
+        if sim.over:
+            self.game_over()
+
+    def game_over(self):
+        self.state = STATE_GAME_OVER
+        self.request_render()
+        # Ranked once against the runs stored so far, so the game-over
+        # screen only blits text. Off the cached top that takes a query, so
+        # it runs on the writer thread, queued ahead of this run's score
+        score = self.sim.score
+        board = self.leaderboard
+        self.final_rank = None
+
+        def rank():
+            self.final_rank = board.standing(score)
+            self.request_render()
+        self.db.scores.call(rank)
+        # Queued for the writer thread and committed right away, without
+        # waiting for it here; the recorder now belongs to the writer
+        self.db.scores.submit(score, self.sim.current_level - 1, session=self.session,
+                              replay=self.recorder)
+        self.recorder = None
+        self.db.scores.flush()
+        if self.input_recorder:
+            save_log(self.input_recorder.finish(), f'{self.session}-{self.sim.seed}')
+            self.input_recorder = None
+
+    def request_render(self):
+        """Draw the next frame even if the render cadence would skip it"""
+        self.render_requested = True
+
+    def should_render(self) -> bool:
+        if self.render_requested:
+            self.render_requested = False
+            return True
+        return self.render_every > 0 and self.ticks % self.render_every == 0
 
     def draw(self):
+        self.frame += 1
+        if (self.state == STATE_PLAYING and self.dirty_ready and not self.timer.overlay
+                and self.governor.level >= QUALITY_DIRTY_RECTS):
+            self.draw_game_dirty()
+            return
+
         self.screen.fill(BLACK)
         
         if self.state == STATE_MENU:
@@ -165,11 +234,79 @@ class Game:
             self.draw_game()
         elif self.state == STATE_GAME_OVER:
             self.draw_game_over()
+        if self.timer.overlay:
+            self.draw_timer_overlay()
+            self.timer.lap('draw.overlay')
             
         pygame.display.flip()
+        self.timer.lap('draw.flip')
+        self.dirty_ready = self.state == STATE_PLAYING
+        if self.dirty_ready:
+            self.dirty_rects = self.actor_rects()
+
+    def actor_rects(self):
+        # Inflated: the player's mouth line reaches past its rect
+        rects = [self.sim.player.rect.inflate(8, 8)]
+        rects.extend(ghost.rect.inflate(4, 4) for ghost in self.sim.ghosts)
+        return rects
+
+    def draw_game_dirty(self):
+        """Redraw and present only the areas actors left or entered"""
+        old_hud_rect = self.hud_rect()
+        hud_changed = self.update_hud()
+        actors = self.actor_rects()
+        dirty = self.dirty_rects + actors
+        hud_rect = self.hud_rect().union(old_hud_rect)
+        redraw_hud = hud_changed or hud_rect.collidelist(dirty) != -1
+        if redraw_hud:
+            dirty.append(hud_rect)
+
+        for rect in dirty:
+            self.screen.blit(self.wall_layer, rect, rect)
+            for i in rect.collidelistall(self.sim.dots):
+                pygame.draw.circle(self.screen, WHITE, self.sim.dots[i].center, 2)
+            for i in rect.collidelistall(self.sim.power_pellets):
+                pygame.draw.circle(self.screen, WHITE, self.sim.power_pellets[i].center, 6)
+        self.timer.lap('draw.dots')
+        self.sim.player.draw(self.screen)
+        for ghost in self.sim.ghosts:
+            ghost.draw(self.screen)
+        self.timer.lap('draw.actors')
+        if redraw_hud:
+            self.blit_hud()
+        self.timer.lap('draw.hud')
+
+        pygame.display.update(dirty)
+        self.timer.lap('draw.flip')
+        self.dirty_rects = actors
+
+    def update_hud(self) -> bool:
+        """Re-render the HUD text if it changed; True if it did"""
+        values = (self.sim.score, self.sim.lives, self.sim.current_level)
+        if self.hud and self.hud[0] == values:
+            return False
+        interval = SLOW_HUD_INTERVAL if self.governor.level >= QUALITY_SLOW_HUD else 1
+        if self.hud and self.frame - self.hud[2] < interval:
+            return False
+        font = self.font(36)
+        surfaces = [
+            (font.render(f"Score: {self.sim.score}", True, WHITE), (20, 20)),
+            (font.render(f"Lives: {self.sim.lives}", True, WHITE), (20, 50)),
+            (font.render(f"Level: {self.sim.current_level}", True, WHITE), (20, 80)),
+        ]
+        self.hud = (values, surfaces, self.frame)
+        return True
+
+    def hud_rect(self) -> pygame.Rect:
+        rects = [surface.get_rect(topleft=pos) for surface, pos in self.hud[1]]
+        return rects[0].unionall(rects[1:])
+
+    def blit_hud(self):
+        for surface, pos in self.hud[1]:
+            self.screen.blit(surface, pos)
         
     def draw_menu(self):
-        font = pygame.font.Font(None, 64)
+        font = self.font(64)
         title = font.render("PAC-MAN", True, YELLOW)
         start = font.render("Press SPACE to Start", True, WHITE)
         
@@ -178,60 +315,124 @@ class Game:
         
     def draw_game(self):
         # Draw walls
-        for wall in self.walls:
+        for wall in self.sim.walls:
             pygame.draw.rect(self.screen, BLUE, wall)
+        self.timer.lap('draw.walls')
             
         # Draw dots
-        for dot in self.dots:
+        for dot in self.sim.dots:
             pygame.draw.circle(self.screen, WHITE,
                              dot.center, 2)
                              
         # Draw power pellets
-        for pellet in self.power_pellets:
+        for pellet in self.sim.power_pellets:
             pygame.draw.circle(self.screen, WHITE,
                              pellet.center, 6)
+        self.timer.lap('draw.dots')
                              
         # Draw player and ghosts
-        self.player.draw(self.screen)
-        for ghost in self.ghosts:
+        self.sim.player.draw(self.screen)
+        for ghost in self.sim.ghosts:
             ghost.draw(self.screen)
+        self.timer.lap('draw.actors')
 
         # Draw score and lives
-        font = pygame.font.Font(None, 36)
-        score_text = font.render(f"Score: {self.score}", True, WHITE)
-        lives_text = font.render(f"Lives: {self.lives}", True, WHITE)
-        level_text = font.render(f"Level: {self.current_level}", True, WHITE)
-        
-        self.screen.blit(score_text, (20, 20))
-        self.screen.blit(lives_text, (20, 50))
-        self.screen.blit(level_text, (20, 80))
+        self.update_hud()
+        self.blit_hud()
+        self.timer.lap('draw.hud')
         
         if self.state == STATE_PAUSED:
+            font = self.font(36)
             pause_text = font.render("PAUSED", True, WHITE)
             self.screen.blit(pause_text,
                            (SCREEN_WIDTH//2 - pause_text.get_width()//2,
                             SCREEN_HEIGHT//2))
             
     def draw_game_over(self):
-        font = pygame.font.Font(None, 64)
-        if self.lives > 0:
+        font = self.font(64)
+        if self.sim.lives > 0:
             text1 = font.render("YOU WIN!", True, WHITE)
         else:
             text1 = font.render("GAME OVER", True, WHITE)
             
-        text2 = font.render(f"Final Score: {self.score}", True, WHITE)
+        text2 = font.render(f"Final Score: {self.sim.score}", True, WHITE)
         text3 = font.render("Press SPACE to Play Again", True, WHITE)
         
         self.screen.blit(text1, (SCREEN_WIDTH//2 - text1.get_width()//2, SCREEN_HEIGHT//3))
         self.screen.blit(text2, (SCREEN_WIDTH//2 - text2.get_width()//2, SCREEN_HEIGHT//2))
         self.screen.blit(text3, (SCREEN_WIDTH//2 - text3.get_width()//2, 2*SCREEN_HEIGHT//3))
+        if self.final_rank:
+            rank, runs, percentile = self.final_rank
+            text4 = self.font(32).render(
+                f"Rank #{rank} of {runs} - better than {percentile:.0f}% of runs", True, YELLOW)
+            self.screen.blit(text4, (SCREEN_WIDTH//2 - text4.get_width()//2, SCREEN_HEIGHT//2 + 50))
         
+    def draw_timer_overlay(self):
+        """p50/p95/p99 per phase plus a graph of recent frame times"""
+        if not self.timer_overlay or self.frame - self.timer_overlay[0] >= 30:
+            font = self.font(18)
+            rows = [('phase (ms)', ('p50', 'p95', 'p99'))]
+            for phase, values in self.timer.summary().items():
+                rows.append((phase, [f"{ms:.2f}" for ms in values]))
+            rows.append(('quality', (self.governor.stats()['quality_name'],)))
+            if self.agent:
+                stats = self.agent.stats()
+                rows.append(('mcts', (f"{stats['rollouts_per_second']:.0f}/s", f"d{stats['depth']}")))
+            surfaces = []
+            for i, (label, columns) in enumerate(rows):
+                y = 120 + 14 * i
+                surfaces.append((font.render(label, True, YELLOW), (SCREEN_WIDTH - 250, y)))
+                for j, text in enumerate(columns):
+                    surfaces.append((font.render(text, True, YELLOW), (SCREEN_WIDTH - 130 + 40 * j, y)))
+            self.timer_overlay = (self.frame, surfaces, len(rows))
+        panel = pygame.Rect(SCREEN_WIDTH - 260, 110, 255, 14 * self.timer_overlay[2] + 80)
+        self.screen.fill(BLACK, panel)
+        for surface, pos in self.timer_overlay[1]:
+            self.screen.blit(surface, pos)
+
+        # Frame-time graph, the horizontal line is the 1/FPS budget
+        graph = pygame.Rect(panel.x + 5, panel.bottom - 65, panel.width - 10, 60)
+        pygame.draw.rect(self.screen, WHITE, graph, 1)
+        scale = graph.height / (2000 / FPS)  # budget sits at half height
+        budget_y = graph.bottom - int(1000 / FPS * scale)
+        pygame.draw.line(self.screen, RED, (graph.x, budget_y), (graph.right - 1, budget_y))
+        totals = self.timer.recent(self.timer.totals)[-graph.width:]
+        if len(totals) > 1:
+            points = [(graph.x + i, max(graph.y, graph.bottom - 1 - int(ns / 1e6 * scale)))
+                      for i, ns in enumerate(totals)]
+            pygame.draw.lines(self.screen, YELLOW, False, points)
+
     def run(self):
+        self.gc.install()
         running = True
         while running:
+            self.gc.begin_frame()
+            self.governor.begin()
+            self.timer.begin_frame()
             running = self.handle_events()
+            self.timer.lap('events')
             self.update()
-            self.draw()
-            self.clock.tick(60)
-            
+            drawn = self.should_render()
+            if drawn:
+                self.draw()
+            self.timer.end_frame()
+            self.ticks += 1
+            if self.governor.end():
+                self.apply_quality()
+            self.gc.end_frame()
+            # Only a presented frame counts; with render_every=0 nothing is drawn
+            if drawn and self.profile.enabled and 'first menu frame' not in self.profile.milestones:
+                self.profile.mark('first menu frame')
+                self.preloader.done.wait()
+                print(self.profile.report(STARTUP_TARGET_MS))
+            self.clock.tick(self.fps)
+
+        self.gc.uninstall()
+        self.timer.close()
+        if self.recorder:
+            self.recorder.close()  # run abandoned mid-game
+        if self.agent:
+            self.agent.close()
+        self.levels.close()
+        self.db.close()  # waits for queued scores to be written
         pygame.quit()
\ No newline at end of file
@@ -0,0 +1,141 @@
+# gc_control.py
+import gc
+import time
+from typing import Dict, List
+
+# Upper bounds (ms) of the frame-time histogram buckets; the last bucket is open
+FRAME_BUCKETS_MS = (2, 4, 8, 12, 16.7, 25, 33, 50)
+# In deferred mode a full collection is still forced once this many
+# gen-1 collections have piled up, so a long level can't grow without bound
+DEFERRED_GEN2_LIMIT = 100
+
+
+class GCMonitor:
+    """Record every collection through gc.callbacks and keep them off the frame
+
+    mode 'auto' leaves the collector alone apart from freezing level data,
+    mode 'deferred' disables automatic collection and runs the young
+    generations at the end of each frame. Level loads only run the young
+    generations and freeze; in both modes the full collection, which also
+    unfreezes and sweeps what earlier levels left frozen, runs at idle
+    points (the pause screen and the return to the menu), and in deferred
+    mode also once DEFERRED_GEN2_LIMIT young collections have piled up.
+
+    Frames longer than frame_budget_ms count as over budget.
+    """
+    def __init__(self, mode: str = 'auto', frame_budget_ms: float = 1000 / 60):
+        if mode not in ('auto', 'deferred'):
+            raise ValueError(f"unknown GC mode: {mode}")
+        self.mode = mode
+        self.frame_budget_ms = frame_budget_ms
+        self.installed = False
+        self._start_ns = 0
+        self._frame_start = 0
+        self._frame_gc_ns = 0
+        self._frame_gc_count = 0
+        self.collections = [0, 0, 0]          # per generation
+        self.pause_ns = [0, 0, 0]             # total per generation
+        self.max_pause_ns = [0, 0, 0]
+        self.frames_with_gc = [0] * (len(FRAME_BUCKETS_MS) + 1)
+        self.frames_without_gc = [0] * (len(FRAME_BUCKETS_MS) + 1)
+        self.over_budget = [0, 0]             # [without GC, with GC]
+        self.hitches: List[Dict] = []         # last over-budget frames that had a collection
+
+    def install(self):
+        if self.installed:
+            return
+        gc.callbacks.append(self._callback)
+        if self.mode == 'deferred':
+            gc.disable()
+        self.installed = True
+
+    def uninstall(self):
+        if not self.installed:
+            return
+        gc.callbacks.remove(self._callback)
+        if self.mode == 'deferred':
+            gc.enable()
+        self.installed = False
+
+    def _callback(self, phase: str, info: dict):
+        if phase == 'start':
+            self._start_ns = time.perf_counter_ns()
+            return
+        duration = time.perf_counter_ns() - self._start_ns
+        generation = info['generation']
+        self.collections[generation] += 1
+        self.pause_ns[generation] += duration
+        self.max_pause_ns[generation] = max(self.max_pause_ns[generation], duration)
+        self._frame_gc_ns += duration
+        self._frame_gc_count += 1
+
+    def begin_frame(self):
+        self._frame_start = time.perf_counter_ns()
+        self._frame_gc_ns = 0
+        self._frame_gc_count = 0
+
+    def end_frame(self):
+        if self.mode == 'deferred':
+            self.collect_young()
+        frame_ms = (time.perf_counter_ns() - self._frame_start) / 1e6
+        bucket = len(FRAME_BUCKETS_MS)
+        for i, bound in enumerate(FRAME_BUCKETS_MS):
+            if frame_ms <= bound:
+                bucket = i
+                break
+        over = frame_ms > self.frame_budget_ms
+        self.over_budget[bool(self._frame_gc_count)] += over
+        if self._frame_gc_count:
+            self.frames_with_gc[bucket] += 1
+            if over:
+                self.hitches.append({'frame_ms': frame_ms,
+                                     'gc_ms': self._frame_gc_ns / 1e6,
+                                     'collections': self._frame_gc_count})
+                del self.hitches[:-100]
+        else:
+            self.frames_without_gc[bucket] += 1
+
+    def collect_young(self):
+        """Run the gen-0/1 collections the automatic collector would have run"""
+        count0, count1, count2 = gc.get_count()
+        threshold0, threshold1, _ = gc.get_threshold()
+        if count2 > DEFERRED_GEN2_LIMIT:
+            gc.collect(2)
+        elif count0 > threshold0:
+            gc.collect(1 if count1 >= threshold1 else 0)
+
+    def idle_point(self):
+        """A moment where a pause can't be seen: pay for gen 2 now
+
+        Unfreezing first lets it sweep cycles that were frozen with earlier
+        levels; whatever survives is frozen again.
+        """
+        gc.unfreeze()
+        gc.collect(2)
+        gc.freeze()
+
+    def level_loaded(self):
+        """Move everything alive after load_level out of the collector's reach
+
+        Only the young generations are collected first - a full collection
+        here would cost ~10 ms in the middle of play. Data dropped from an
+        older frozen level is still freed by reference counting; frozen
+        cycles wait for the next idle_point().
+        """
+        gc.collect(1)
+        gc.freeze()
+
+    def report(self) -> str:
+        lines = [f'GC ({self.mode} mode, {gc.get_freeze_count()} objects frozen):']
+        for gen in range(3):
+            count = self.collections[gen]
+            avg = self.pause_ns[gen] / count / 1e6 if count else 0.0
+            lines.append(f'  gen {gen}: {count:6d} collections, '
+                         f'avg {avg:6.3f} ms, max {self.max_pause_ns[gen] / 1e6:6.3f} ms')
+        lines.append('  frame time      with GC   without GC')
+        labels = [f'<= {b} ms' for b in FRAME_BUCKETS_MS] + [f'>  {FRAME_BUCKETS_MS[-1]} ms']
+        for label, with_gc, without_gc in zip(labels, self.frames_with_gc, self.frames_without_gc):
+            lines.append(f'  {label:<12}{with_gc:10d}{without_gc:12d}')
+        lines.append(f'  over-budget frames: {self.over_budget[1]} with GC, '
+                     f'{self.over_budget[0]} without')
+        return '\n'.join(lines)
@@ -0,0 +1,71 @@
+# governor.py
+import time
+
+# Quality levels, each one keeps everything the previous one turned off
+QUALITY_FULL = 0
+QUALITY_SLOW_REPLAN = 1   # ghosts re-plan their path half as often
+QUALITY_NO_MOUTH = 2      # player mouth animation frozen
+QUALITY_SLOW_HUD = 3      # HUD text re-rendered a few times a second at most
+QUALITY_DIRTY_RECTS = 4   # only changed screen areas are redrawn/presented
+QUALITY_NAMES = ['full', 'slow-replan', 'no-mouth', 'slow-hud', 'dirty-rects']
+
+
+class FrameGovernor:
+    """Step quality down while update+draw overruns the frame budget
+
+    The per-frame cost is smoothed with an exponential moving average.
+    Quality drops one level after `window` consecutive frames above
+    `degrade_at` of the budget and comes back one level after
+    `2 * window` frames below `restore_at`, so it doesn't oscillate.
+    """
+    def __init__(self, fps: int = 60, degrade_at: float = 0.9, restore_at: float = 0.6,
+                 window: int = 30, enabled: bool = True):
+        self.budget_ms = 1000 / fps
+        self.degrade_at = degrade_at
+        self.restore_at = restore_at
+        self.window = window
+        self.enabled = enabled
+        self.level = QUALITY_FULL
+        self.cost_ms = 0.0
+        self.changes = 0
+        self._start = 0.0
+        self._over = 0
+        self._under = 0
+
+    def begin(self):
+        self._start = time.perf_counter()
+
+    def end(self) -> bool:
+        """Account for the frame just finished; True if the level changed"""
+        cost = (time.perf_counter() - self._start) * 1000
+        self.cost_ms += (cost - self.cost_ms) * 0.1
+        if not self.enabled:
+            return False
+
+        if self.cost_ms > self.budget_ms * self.degrade_at:
+            self._over += 1
+            self._under = 0
+        elif self.cost_ms < self.budget_ms * self.restore_at:
+            self._under += 1
+            self._over = 0
+        else:
+            self._over = self._under = 0
+
+        if self._over >= self.window and self.level < QUALITY_DIRTY_RECTS:
+            self.level += 1
+        elif self._under >= 2 * self.window and self.level > QUALITY_FULL:
+            self.level -= 1
+        else:
+            return False
+        self._over = self._under = 0
+        self.changes += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'quality_level': self.level,
+            'quality_name': QUALITY_NAMES[self.level],
+            'frame_cost_ms': round(self.cost_ms, 3),
+            'budget_ms': round(self.budget_ms, 3),
+            'changes': self.changes,
+        }
@@ -1,7 +1,7 @@
 # init_maps.py 
 """Run this script first to initialize the database with map data"""
-import sqlite3
-import json
+from database import Database
+from level import Level
 
 MAPS_CONFIG = [
         {				
@@ -511,29 +511,19 @@ MAPS_CONFIG = [
 ]
 
 
+def config_levels():
+    for number, config in enumerate(MAPS_CONFIG, 1):
+        pellets = frozenset(tuple(int(v) for v in key.split(',')) for key in config['power_pellets'])
+        yield Level(number, tuple(tuple(row) for row in config['map']), pellets, config['wall_color'])
+
+
 def init_db():
-    conn = sqlite3.connect('pacman.db')
-    cur = conn.cursor()
-    
-    # Create tables
-    cur.execute('DROP TABLE IF EXISTS maps')
-    cur.execute('''
-    CREATE TABLE maps (
-        level INTEGER PRIMARY KEY,
-        map_data TEXT,
-        wall_color TEXT,
-        power_pellets TEXT
-    )''')
-    
-    # Insert map data
-    for level, config in enumerate(MAPS_CONFIG, 1):
-        cur.execute(
-            'INSERT INTO maps (level, map_data, wall_color, power_pellets) VALUES (?, ?, ?, ?)',
-            (level, json.dumps(config['map']), config['wall_color'], json.dumps(config['power_pellets']))
-        )
-    
-    conn.commit()
-    conn.close()
+    # Migrates the schema, then only rewrites levels whose content changed
+    db = Database()
+    changed = db.save_levels(config_levels())
+    print(f"{len(changed)} of {len(MAPS_CONFIG)} levels updated"
+          + (f": {', '.join(map(str, changed))}" if changed else ""))
+    db.close()
 
 if __name__ == '__main__':
-    init_db()
\ No newline at end of file
+    init_db()
@@ -0,0 +1,206 @@
+# input_log.py
+"""Input logs: a run stored as its seed plus the ticks where the input changed
+
+The rules are a pure function of the seed, the starting level, the ghost
+re-plan interval and the input of every tick, so that is all a log keeps
+- a few bytes per key press instead of a frame per tick (compare
+replays.py). Every tick the recorder folds the simulation state into a
+running CRC-32; the value every CHECKSUM_INTERVAL ticks goes into the log,
+and replaying checks it, so a divergence is caught within a second of
+game time and reported with the tick range it happened in.
+
+Layout (little endian):
+    header       magic 'PMIL', version u16, seed u64, level u16,
+                 replan interval u16, ticks u32, events u32, checksums u32
+    events       (tick delta varint, input u8) per change, 255 = no key
+    checksums    u32 per CHECKSUM_INTERVAL ticks, then the final one
+
+    python input_log.py info run.pmil
+    python input_log.py verify run.pmil   # replay headless, check every checksum
+"""
+import argparse
+import os
+import struct
+import time
+import zlib
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from config import *
+from simulation import Simulation
+
+MAGIC = b'PMIL'
+INPUT_LOG_VERSION = 1
+HEADER = struct.Struct('<4sHQHHIII')
+NO_INPUT = 255
+CHECKSUM_INTERVAL = FPS  # one checkpoint per second of play
+
+# player x, y, direction, score, lives, level, tick, dots and pellets left,
+# then x, y, direction, state, frightened timer, respawn timer, last
+# re-plan (-1 = never) per ghost. Positions are int32: actors can walk
+# out through a side opening and keep going.
+STATE = struct.Struct('<iiBIBHIHH' + 'iiBBHii' * len(GHOST_SPAWNS))
+
+
+class ReplayDivergence(Exception):
+    def __init__(self, first_tick: int, last_tick: int):
+        super().__init__(f"replay diverged between ticks {first_tick} and {last_tick}")
+        self.first_tick = first_tick
+        self.last_tick = last_tick
+
+
+def state_checksum(sim: Simulation, previous: int = 0) -> int:
+    """CRC-32 of everything that decides the next ticks, chained onto `previous`"""
+    player = sim.player
+    values = [player.rect.x, player.rect.y, player.direction, sim.score, sim.lives,
+              sim.current_level, sim.ticks, len(sim.dots), len(sim.power_pellets)]
+    for ghost in sim.ghosts:
+        values += (ghost.rect.x, ghost.rect.y, ghost.direction, ghost.state, ghost.frightened_timer,
+                   ghost.respawn_timer, -1 if ghost.path_update_timer is None else ghost.path_update_timer)
+    return zlib.crc32(STATE.pack(*values), previous)
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+class InputLog(NamedTuple):
+    seed: int
+    level: int
+    replan_interval: int
+    ticks: int
+    events: Tuple[Tuple[int, Optional[int]], ...]  # (tick, input) where the input changed
+    checksums: Tuple[int, ...]
+
+    def pack(self) -> bytes:
+        out = [HEADER.pack(MAGIC, INPUT_LOG_VERSION, self.seed, self.level, self.replan_interval,
+                           self.ticks, len(self.events), len(self.checksums))]
+        last = 0
+        for tick, action in self.events:
+            out.append(_varint(tick - last))
+            out.append(bytes((NO_INPUT if action is None else action,)))
+            last = tick
+        out.append(struct.pack(f'<{len(self.checksums)}I', *self.checksums))
+        return b''.join(out)
+
+    @classmethod
+    def unpack(cls, data: bytes) -> 'InputLog':
+        magic, version, seed, level, interval, ticks, count, checks = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("not an input log")
+        if version != INPUT_LOG_VERSION:
+            raise ValueError(f"unsupported input log version {version}")
+        offset = HEADER.size
+        events = []
+        tick = 0
+        for _ in range(count):
+            delta = shift = 0
+            while True:
+                byte = data[offset]
+                offset += 1
+                delta |= (byte & 0x7f) << shift
+                shift += 7
+                if byte < 0x80:
+                    break
+            tick += delta
+            action = data[offset]
+            offset += 1
+            events.append((tick, None if action == NO_INPUT else action))
+        checksums = struct.unpack_from(f'<{checks}I', data, offset)
+        return cls(seed, level, interval, ticks, tuple(events), checksums)
+
+
+class InputRecorder:
+    """Logs a run as it is played
+
+    Create it right after the run's first load_level() and call record()
+    after every step with the input that step was given.
+    """
+    def __init__(self, sim: Simulation):
+        self.sim = sim
+        self.seed = sim.seed
+        self.level = sim.current_level
+        self.replan_interval = sim.replan_interval
+        self.events: List[Tuple[int, Optional[int]]] = []
+        self.checksums: List[int] = []
+        self.checksum = 0
+        self.last_input: Optional[int] = None
+
+    def record(self, direction: Optional[int]):
+        sim = self.sim
+        if direction != self.last_input:
+            self.events.append((sim.ticks, direction))
+            self.last_input = direction
+        self.checksum = state_checksum(sim, self.checksum)
+        if sim.ticks % CHECKSUM_INTERVAL == 0:
+            self.checksums.append(self.checksum)
+
+    def finish(self) -> InputLog:
+        return InputLog(self.seed, self.level, self.replan_interval, self.sim.ticks,
+                        tuple(self.events), tuple(self.checksums) + (self.checksum,))
+
+
+def replay(log: InputLog, levels: Callable, verify: bool = True) -> Simulation:
+    """Play a log back headless; raises ReplayDivergence when a checksum differs"""
+    sim = Simulation(levels)
+    sim.set_quality(False, log.replan_interval)
+    sim.reset(log.level, log.seed)
+    if not sim.load_level():
+        raise ValueError(f"no level {log.level}")
+    events = iter(log.events)
+    next_event = next(events, None)
+    direction = None
+    checksum = 0
+    checkpoint = 0
+    for tick in range(1, log.ticks + 1):
+        if next_event is not None and next_event[0] == tick:
+            direction = next_event[1]
+            next_event = next(events, None)
+        sim.step(direction)
+        if verify:
+            checksum = state_checksum(sim, checksum)
+            if tick % CHECKSUM_INTERVAL == 0:
+                if log.checksums[checkpoint] != checksum:
+                    raise ReplayDivergence(tick - CHECKSUM_INTERVAL + 1, tick)
+                checkpoint += 1
+    if verify and log.checksums[-1] != checksum:
+        raise ReplayDivergence(log.ticks - log.ticks % CHECKSUM_INTERVAL + 1, log.ticks)
+    return sim
+
+
+def save_log(log: InputLog, name: str, directory: str = INPUT_LOG_DIR) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name + '.pmil')
+    with open(path, 'wb') as f:
+        f.write(log.pack())
+    return path
+
+
+def load_log(path: str) -> InputLog:
+    with open(path, 'rb') as f:
+        return InputLog.unpack(f.read())
+
+
+if __name__ == '__main__':
+    from env import load_levels
+
+    parser = argparse.ArgumentParser(description="Inspect or verify an input log")
+    parser.add_argument('command', choices=('info', 'verify'))
+    parser.add_argument('path')
+    args = parser.parse_args()
+
+    log = load_log(args.path)
+    print(f"seed {log.seed}, level {log.level}, re-plan every {log.replan_interval} ms, "
+          f"{log.ticks} ticks ({log.ticks / FPS:.1f}s), {len(log.events)} input changes, "
+          f"{os.path.getsize(args.path)} bytes")
+    if args.command == 'verify':
+        levels = load_levels()
+        start = time.perf_counter()
+        sim = replay(log, levels.get)
+        elapsed = time.perf_counter() - start
+        print(f"ok: score {sim.score}, level {sim.current_level}, lives {sim.lives}; "
+              f"replayed in {elapsed:.2f}s ({log.ticks / FPS / elapsed:.0f}x real time)")
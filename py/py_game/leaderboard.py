@@ -0,0 +1,131 @@
+# leaderboard.py
+import heapq
+import itertools
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from config import LEADERBOARD_SIZE
+from database import Database
+
+
+class Entry(NamedTuple):
+    score: int
+    level: int
+    player: Optional[str]
+
+
+class Leaderboard:
+    """High-score queries backed by the scores indexes (migrations 5 and 7)
+
+    The best `size` scores and the total run count are kept in memory.
+    The score writer reports every committed batch, which is merged into
+    the heap, so top_n() and the rank of any score that makes the top
+    never touch the database; other ranks are one index range count.
+    Only players' runs count: bot games (scores.bot, see simulate.py) are
+    left out of every query and of the cache.
+    """
+    def __init__(self, db: Database, size: int = LEADERBOARD_SIZE):
+        self.db = db
+        self.size = size
+        self.lock = threading.Lock()
+        # Min-heap of (score, -arrival, entry) for the best `size` runs;
+        # on equal scores the older run ranks higher and stays
+        self._top: List[Tuple[int, int, Entry]] = []
+        self._arrival = itertools.count()
+        self._total = 0
+        db.scores.commit_listeners.append(self.on_commit)
+        self.reload()
+
+    def reload(self):
+        # The writer commits and calls on_commit under write_lock, so holding
+        # it here puts every batch either in these queries or after the swap
+        with self.db.write_lock:
+            rows = self.db.reader().execute(
+                'SELECT score, completed_level, player FROM scores WHERE bot = 0 '
+                'ORDER BY score DESC, id LIMIT ?',
+                (self.size,)).fetchall()
+            total = self.db.reader().execute('SELECT COUNT(*) FROM scores WHERE bot = 0').fetchone()[0]
+            with self.lock:
+                self._arrival = itertools.count()
+                self._top = [(row[0], -next(self._arrival), Entry(*row)) for row in rows]
+                heapq.heapify(self._top)
+                self._total = total
+
+    def on_commit(self, rows: Iterable[tuple]):
+        """Score writer callback (writer thread): fold new scores into the cache"""
+        with self.lock:
+            for score, level, player, _, bot in rows:
+                if bot:
+                    continue
+                item = (score, -next(self._arrival), Entry(score, level, player))
+                if len(self._top) < self.size:
+                    heapq.heappush(self._top, item)
+                elif item > self._top[0]:
+                    heapq.heapreplace(self._top, item)
+                self._total += 1
+
+    @property
+    def total(self) -> int:
+        return self._total
+
+    def top_n(self, n: int = 10, level: int = None) -> List[Entry]:
+        """Best n runs, overall or among runs that completed `level` levels"""
+        if level is None and n <= self.size:
+            with self.lock:
+                return [item[2] for item in heapq.nlargest(n, self._top)]
+        if level is None:
+            rows = self.db.reader().execute(
+                'SELECT score, completed_level, player FROM scores WHERE bot = 0 ORDER BY score DESC LIMIT ?',
+                (n,)).fetchall()
+        else:
+            rows = self.db.reader().execute(
+                'SELECT score, completed_level, player FROM scores WHERE bot = 0 AND completed_level = ? '
+                'ORDER BY score DESC LIMIT ?', (level, n)).fetchall()
+        return [Entry(*row) for row in rows]
+
+    def _counts(self, score: int) -> Tuple[int, int]:
+        """Stored runs scoring more than, and at least, `score`"""
+        with self.lock:
+            # The heap holds every run above its minimum (or every run at all)
+            complete = len(self._top) < self.size
+            if complete or score > self._top[0][0]:
+                return (sum(1 for item in self._top if item[0] > score),
+                        sum(1 for item in self._top if item[0] >= score))
+        # Both from one range scan of scores_by_score
+        above, at_least = self.db.reader().execute(
+            'SELECT COALESCE(SUM(score > ?), 0), COUNT(*) FROM scores WHERE bot = 0 AND score >= ?',
+            (score, score)).fetchone()
+        return above, at_least
+
+    def rank_of(self, score: int) -> int:
+        """1-based position `score` would take (ties share the better rank)"""
+        return self._counts(score)[0] + 1
+
+    def percentile(self, score: int) -> float:
+        """Percentage of stored runs that scored below `score`"""
+        total = self._total
+        if not total:
+            return 100.0
+        return 100.0 * (total - self._counts(score)[1]) / total
+
+    def standing(self, score: int) -> Tuple[int, int, float]:
+        """(rank, runs, percentile) of a new run scoring `score`, counting it in runs
+
+        Outside the cached top this is a database query, so the game runs
+        it on the score writer thread (ScoreWriter.call), not the frame.
+        """
+        total = self._total
+        above, at_least = self._counts(score)
+        return above + 1, total + 1, 100.0 * (total - at_least) / total if total else 100.0
+
+    def level_bests(self, levels: Iterable[int] = None) -> Dict[int, int]:
+        """Best score per completed-level count, one index seek per level"""
+        if levels is None:
+            levels = [0] + sorted(self.db.get_all_levels())
+        bests = {}
+        for level in levels:
+            best = self.db.reader().execute(
+                'SELECT MAX(score) FROM scores WHERE bot = 0 AND completed_level = ?', (level,)).fetchone()[0]
+            if best is not None:
+                bests[level] = best
+        return bests
@@ -0,0 +1,63 @@
+# level.py
+import ast
+import hashlib
+import json
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Tuple
+
+# Version of the text stored in maps.map_data/power_pellets.
+# 0: written before the column existed - JSON from init_maps or a Python
+#    repr from the old Database.save_map
+# 1: compact JSON
+LEVEL_FORMAT_VERSION = 1
+
+
+class Level(NamedTuple):
+    """A decoded level; immutable so one instance can be shared by everyone"""
+    number: int
+    grid: Tuple[Tuple[int, ...], ...]       # grid[y][x]: 0 path, 1 wall, 2 ghost house
+    pellets: FrozenSet[Tuple[int, int]]     # (x, y) cells holding a power pellet
+    color: str
+
+
+def encode_grid(grid: Iterable[Iterable[int]]) -> str:
+    return json.dumps([list(row) for row in grid], separators=(',', ':'))
+
+
+def encode_pellets(pellets) -> str:
+    """Accepts the {'x,y': 1} dicts used by MAPS_CONFIG or (x, y) tuples"""
+    keys = pellets if isinstance(pellets, dict) else (f"{x},{y}" for x, y in pellets)
+    return json.dumps({key: 1 for key in sorted(keys)}, separators=(',', ':'))
+
+
+def _decode_text(text: str, format_version: int):
+    if format_version >= 1:
+        return json.loads(text)
+    try:
+        return json.loads(text)
+    except ValueError:
+        # Legacy str() repr; literal_eval only accepts literals, unlike eval
+        return ast.literal_eval(text)
+
+
+def decode_level(number: int, map_data: str, wall_color: str, power_pellets: str,
+                 format_version: int = LEVEL_FORMAT_VERSION) -> Level:
+    grid = tuple(tuple(row) for row in _decode_text(map_data, format_version))
+    pellets = frozenset(tuple(int(v) for v in key.split(','))
+                        for key in _decode_text(power_pellets, format_version))
+    return Level(number, grid, pellets, wall_color)
+
+
+def level_to_map(level: Level) -> Tuple[List[List[int]], str, Dict[str, int]]:
+    """The (map_data, wall_color, power_pellets) shape Database.get_map returns"""
+    return ([list(row) for row in level.grid], level.color,
+            {f"{x},{y}": 1 for x, y in sorted(level.pellets)})
+
+
+def content_hash(level: Level) -> str:
+    """sha256 over everything that defines a level except its number"""
+    digest = hashlib.sha256()
+    digest.update(f"{len(level.grid[0]) if level.grid else 0}x{len(level.grid)};".encode())
+    digest.update(bytes(cell for row in level.grid for cell in row))
+    digest.update(encode_pellets(level.pellets).encode())
+    digest.update(level.color.encode())
+    return digest.hexdigest()
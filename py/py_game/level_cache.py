@@ -0,0 +1,127 @@
+# level_cache.py
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import pygame
+
+from config import *
+from artifacts import LevelArtifacts, compute_artifacts
+from database import Database
+from level import Level, content_hash
+
+
+class CompiledLevel:
+    """Everything load_level needs, built once per level and then shared
+
+    Walls and navigation come from the level's compiled artifacts (see
+    compile_maps.py) when pacman.db has them, otherwise they are derived
+    here. walls, wall_cells and wall_layer are never modified after
+    compile, dots/pellets are templates - take fresh lists with
+    new_dots/new_pellets.
+    """
+    def __init__(self, level: Level, artifacts: LevelArtifacts = None):
+        self.level = level
+        self.artifacts = artifacts or compute_artifacts(level)
+        self.walls: List[pygame.Rect] = [
+            pygame.Rect(x * CELL_SIZE, y * CELL_SIZE, w * CELL_SIZE, h * CELL_SIZE)
+            for x, y, w, h in self.artifacts.wall_rects
+        ]
+        # Navigation: a cell is walkable for the ghosts' A* unless it's a wall
+        self.wall_cells: FrozenSet[Tuple[int, int]] = frozenset(
+            (x, y) for y, row in enumerate(self.artifacts.occupancy)
+            for x, walkable in enumerate(row) if not walkable)
+        dots = []
+        pellets = []
+        for y, row in enumerate(level.grid):
+            for x, cell in enumerate(row):
+                if cell == 0:
+                    rect = pygame.Rect(x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE)
+                    (pellets if (x, y) in level.pellets else dots).append(rect)
+        self.dots: Tuple[pygame.Rect, ...] = tuple(dots)
+        self.pellets: Tuple[pygame.Rect, ...] = tuple(pellets)
+        # Template index by pixel position, for Simulation's eaten flags
+        self.dot_index = {(rect.x, rect.y): i for i, rect in enumerate(dots)}
+        self.pellet_index = {(rect.x, rect.y): i for i, rect in enumerate(pellets)}
+
+        # Static background for dirty-rect redraws
+        self.wall_layer = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+        for wall in self.walls:
+            pygame.draw.rect(self.wall_layer, BLUE, wall)
+
+    def new_dots(self) -> List[pygame.Rect]:
+        return list(self.dots)
+
+    def new_pellets(self) -> List[pygame.Rect]:
+        return list(self.pellets)
+
+
+class LevelCache:
+    """All levels read in one query, compiled on demand or ahead of time
+
+    prefetch() compiles a level on a background thread while the current
+    one is played, so the switch in load_level only swaps objects in.
+    """
+    def __init__(self, db: Database):
+        self.db = db
+        self.levels: Dict[int, Level] = db.get_all_levels()
+        self.artifacts: Dict[str, LevelArtifacts] = db.get_all_artifacts()
+        self.compiled: Dict[int, CompiledLevel] = {}
+        self.pending: Dict[int, Future] = {}
+        # Bumped by invalidate(), so a compile that was already running
+        # when its level changed doesn't store the stale result
+        self.generations: Dict[int, int] = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='level-prefetch')
+        db.level_listeners.append(self.invalidate)
+
+    def invalidate(self, number: int):
+        """Forget a level whose content changed; it is re-read on next use"""
+        with self.lock:
+            self.levels.pop(number, None)
+            self.compiled.pop(number, None)
+            self.pending.pop(number, None)
+            self.generations[number] = self.generations.get(number, 0) + 1
+
+    def prefetch(self, number: int):
+        with self.lock:
+            if number in self.compiled or number in self.pending:
+                return
+            self.pending[number] = self.executor.submit(self._compile, number)
+
+    def _compile(self, number: int) -> Optional[CompiledLevel]:
+        with self.lock:
+            generation = self.generations.get(number, 0)
+            level = self.levels.get(number)
+        try:
+            level = level or self.db.get_level(number)
+            if not level:
+                return None
+            compiled = CompiledLevel(level, self.artifacts.get(content_hash(level)))
+            with self.lock:
+                if self.generations.get(number, 0) == generation:
+                    self.levels[number] = level
+                    self.compiled[number] = compiled
+            return compiled
+        finally:
+            with self.lock:
+                # After an invalidate, pending may hold a newer prefetch
+                if self.generations.get(number, 0) == generation:
+                    self.pending.pop(number, None)
+
+    def get(self, number: int) -> Optional[CompiledLevel]:
+        with self.lock:
+            compiled = self.compiled.get(number)
+            future = self.pending.get(number)
+        if compiled:
+            return compiled
+        if future:
+            return future.result()
+        return self._compile(number)
+
+    def compile_all(self) -> Dict[int, CompiledLevel]:
+        """Every level compiled, e.g. for headless runs that never touch the DB again"""
+        return {number: self.get(number) for number in sorted(self.levels)}
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,212 @@
+# levelpack.py
+"""Binary level packs: 2 bits per cell, a pellet bitmap and an index
+
+Layout (little endian):
+    header   magic 'PMLP', version u16, level count u32, index offset u64
+    records  width u16, height u16, color 16s, content hash 16s,
+             cells  - 2 bits per cell, row-major, lowest bits first
+             pellets - 1 bit per cell, same order
+    index    (level u32, record offset u64, record length u32) per level
+
+Packs are read through mmap, so worker processes opening the same file
+share one copy in the page cache and nothing is parsed until asked for.
+
+    python levelpack.py export levels.pack   # pacman.db -> pack
+    python levelpack.py import levels.pack   # pack -> pacman.db
+    python levelpack.py info levels.pack
+"""
+import argparse
+import mmap
+import struct
+from typing import Dict, Iterable, Iterator, Tuple
+
+import numpy as np
+
+from level import Level, content_hash
+
+MAGIC = b'PMLP'
+PACK_VERSION = 1
+HEADER = struct.Struct('<4sHIQ')
+RECORD = struct.Struct('<HH16s16s')
+INDEX_ENTRY = struct.Struct('<IQI')
+
+
+def pack_level(level: Level) -> bytes:
+    height = len(level.grid)
+    width = len(level.grid[0]) if height else 0
+    cells = bytearray((width * height + 3) // 4)
+    pellets = bytearray((width * height + 7) // 8)
+    for y, row in enumerate(level.grid):
+        if len(row) != width:
+            raise ValueError(f"level {level.number}: row {y} has {len(row)} cells, expected {width}")
+        for x, cell in enumerate(row):
+            if not 0 <= cell <= 3:
+                raise ValueError(f"level {level.number}: cell ({x},{y}) = {cell} doesn't fit 2 bits")
+            i = y * width + x
+            cells[i >> 2] |= cell << ((i & 3) * 2)
+    for x, y in level.pellets:
+        i = y * width + x
+        pellets[i >> 3] |= 1 << (i & 7)
+    color = level.color.encode()
+    if len(color) > 16:
+        raise ValueError(f"level {level.number}: color {level.color!r} is too long")
+    digest = bytes.fromhex(content_hash(level))[:16]
+    return RECORD.pack(width, height, color, digest) + bytes(cells) + bytes(pellets)
+
+
+def write_pack(path: str, levels: Iterable[Level]):
+    index = []
+    with open(path, 'wb') as f:
+        f.write(bytes(HEADER.size))
+        for level in levels:
+            record = pack_level(level)
+            index.append((level.number, f.tell(), len(record)))
+            f.write(record)
+        index_offset = f.tell()
+        for entry in index:
+            f.write(INDEX_ENTRY.pack(*entry))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, PACK_VERSION, len(index), index_offset))
+
+
+class LevelPack:
+    """Random access to a pack through a read-only memory map
+
+    packed_cells() and packed_pellets() return zero-copy views into the
+    map. An mmap can't be unmapped while such a view is alive, so close()
+    with views still around only lets go of the map: it is unmapped once
+    the last view is dropped. Copy a view (np.array(view)) to keep the
+    data past that point without keeping the mapping.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, index_offset = HEADER.unpack_from(self.map, 0)
+        self.closed = False
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a level pack")
+        if version != PACK_VERSION:
+            raise ValueError(f"{path}: unsupported pack version {version}")
+        self.index: Dict[int, Tuple[int, int]] = {}
+        for i in range(count):
+            number, offset, length = INDEX_ENTRY.unpack_from(self.map, index_offset + i * INDEX_ENTRY.size)
+            self.index[number] = (offset, length)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, number: int) -> bool:
+        return number in self.index
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(sorted(self.index))
+
+    def _check_open(self):
+        if self.closed:
+            raise ValueError(f"{self.path}: level pack is closed")
+
+    def header(self, number: int) -> Tuple[int, int, str, bytes]:
+        """(width, height, color, 16-byte content hash) of one level"""
+        self._check_open()
+        offset, _ = self.index[number]
+        width, height, color, digest = RECORD.unpack_from(self.map, offset)
+        return width, height, color.rstrip(b'\0').decode(), digest
+
+    def _spans(self, number: int) -> Tuple[int, int, int, int, int]:
+        self._check_open()
+        offset, _ = self.index[number]
+        width, height, _, _ = RECORD.unpack_from(self.map, offset)
+        cells_at = offset + RECORD.size
+        cells_len = (width * height + 3) // 4
+        pellets_len = (width * height + 7) // 8
+        return width, height, cells_at, cells_len, pellets_len
+
+    def packed_cells(self, number: int) -> np.ndarray:
+        """Zero-copy uint8 view of the 2-bit cell data"""
+        _, _, at, length, _ = self._spans(number)
+        return np.frombuffer(self.map, dtype=np.uint8, count=length, offset=at)
+
+    def packed_pellets(self, number: int) -> np.ndarray:
+        """Zero-copy uint8 view of the pellet bitmap"""
+        _, _, at, cells_len, length = self._spans(number)
+        return np.frombuffer(self.map, dtype=np.uint8, count=length, offset=at + cells_len)
+
+    def grid_array(self, number: int) -> np.ndarray:
+        """(height, width) uint8 cell grid unpacked from the view"""
+        width, height, _, _, _ = self._spans(number)
+        packed = self.packed_cells(number)
+        cells = np.stack([(packed >> shift) & 3 for shift in (0, 2, 4, 6)], axis=1)
+        return cells.reshape(-1)[:width * height].reshape(height, width)
+
+    def pellet_array(self, number: int) -> np.ndarray:
+        """(height, width) bool pellet mask unpacked from the view"""
+        width, height, _, _, _ = self._spans(number)
+        bits = np.unpackbits(self.packed_pellets(number), bitorder='little')
+        return bits[:width * height].reshape(height, width).astype(bool)
+
+    def level(self, number: int) -> Level:
+        width, height, color, _ = self.header(number)
+        grid = self.grid_array(number)
+        pellets = np.argwhere(self.pellet_array(number))
+        return Level(number, tuple(tuple(int(c) for c in row) for row in grid),
+                     frozenset((int(x), int(y)) for y, x in pellets), color)
+
+    def verify(self, number: int) -> bool:
+        """Whether the decoded level still matches its stored content hash"""
+        return bytes.fromhex(content_hash(self.level(number)))[:16] == self.header(number)[3]
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.map.close()
+        except BufferError:
+            pass  # views are still exported; the map goes when they do
+        self.map = None
+
+    def __enter__(self) -> 'LevelPack':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def export_db(db, path: str) -> int:
+    levels = db.get_all_levels()
+    write_pack(path, (levels[n] for n in sorted(levels)))
+    return len(levels)
+
+
+def import_pack(path: str, db) -> int:
+    """Store the pack's levels; returns how many actually changed"""
+    pack = LevelPack(path)
+    try:
+        return len(db.save_levels([pack.level(number) for number in pack]))
+    finally:
+        pack.close()
+
+
+if __name__ == '__main__':
+    from database import Database
+
+    parser = argparse.ArgumentParser(description="Convert between pacman.db and level packs")
+    parser.add_argument('command', choices=('export', 'import', 'info'))
+    parser.add_argument('path')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        db = Database(read_only=True)
+        print(f"exported {export_db(db, args.path)} levels to {args.path}")
+        db.close()
+    elif args.command == 'import':
+        db = Database()
+        print(f"{import_pack(args.path, db)} levels changed by {args.path}")
+        db.close()
+    else:
+        pack = LevelPack(args.path)
+        for number in pack:
+            width, height, color, digest = pack.header(number)
+            status = 'ok' if pack.verify(number) else 'HASH MISMATCH'
+            print(f"level {number:3d}: {width}x{height} {color:<8} {digest.hex()} {status}")
@@ -1,9 +1,41 @@
-from game import Game
+import argparse
+
+from config import FPS, GC_MODE
+from startup import StartupProfile
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pac-Man")
+    parser.add_argument('--startup-profile', action='store_true',
+                        help="print an import/init time breakdown once the menu is up")
+    parser.add_argument('--render-every', type=int, default=1, metavar='N',
+                        help="draw every N simulation ticks, 0 = only on demand (F5, game over)")
+    parser.add_argument('--fps', type=int, default=FPS,
+                        help="simulation ticks per second, 0 = uncapped")
+    parser.add_argument('--timings', metavar='PATH',
+                        help="stream per-frame phase timings to a .csv or .json(l) file")
+    parser.add_argument('--gc-mode', choices=('auto', 'deferred'), default=GC_MODE,
+                        help="'deferred' keeps gen-2 collections off the frame loop")
+    parser.add_argument('--autoplay', type=int, nargs='?', const=0, metavar='WORKERS',
+                        help="let the MCTS agent play, searching in WORKERS processes (default in-process)")
+    parser.add_argument('--gc-stats', action='store_true',
+                        help="print GC pause and frame-time histograms on exit")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    profile = StartupProfile(enabled=args.startup_profile)
+
+    # Imported here so the profile can attribute import time
+    with profile.phase('pygame', 'import'):
+        import pygame
+    with profile.phase('game', 'import'):
+        from game import Game
 
-def main():    
     # Start the game
-    game = Game()
+    game = Game(profile, args.gc_mode, args.render_every, args.fps, args.timings, args.autoplay)
     game.run()
+    if args.gc_stats:
+        print(game.gc.report())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
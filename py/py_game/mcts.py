@@ -0,0 +1,389 @@
+# mcts.py
+"""Monte Carlo tree search player
+
+The agent decides once per MACRO_TICKS ticks (the time the player takes
+to cross a cell) which direction to hold next. Tree nodes are
+Simulation snapshots, and an edge holds one direction for a macro step.
+Leaves are scored by a short rollout, mostly heading for the nearest
+dot with some random turns: points gained, minus
+DEATH_PENALTY per life lost, minus a little for the distance left to the
+nearest dot along the maze. Nodes are picked with UCT.
+
+The rules are deterministic, so the state at the end of the macro step
+being played is known in advance. The agent searches from that state
+while the current step plays out. The subtree of the move it then
+commits to becomes the next root (tree reuse).
+
+With workers, every worker process grows its own tree from the same root
+(root parallelism). The root visit counts are summed to pick the move.
+Without workers, the game process searches for think_ms per frame.
+
+    python main.py --autoplay 8                            # watch it play, 8 search processes
+    python simulate.py --policy mcts:policy --games 100    # benchmark it headless
+"""
+import math
+import multiprocessing as mp
+import random
+import time
+from itertools import chain, compress
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import *
+from simulation import DX, DY, SNAPSHOT_HEAD, Simulation
+
+MACRO_TICKS = CELL_SIZE // PLAYER_SPEED  # one decision per cell of movement
+
+
+def _plan_key(snapshot: bytes) -> bytes:
+    """snapshot without the quality knobs, which the governor flips mid-plan"""
+    head = list(SNAPSHOT_HEAD.unpack_from(snapshot))
+    head[6] = head[7] = head[14] = 0  # re-plan interval, animate, animation frame
+    return SNAPSHOT_HEAD.pack(*head) + snapshot[SNAPSHOT_HEAD.size:]
+ROLLOUT_TICKS = 6 * MACRO_TICKS
+EXPLORATION = 100.0    # UCT exploration constant, in points
+DEATH_PENALTY = 1000   # points a lost life costs a rollout
+ROLLOUT_GREEDY = 0.75  # chance a rollout heads for the nearest dot at each cell, else random or straight on
+DOT_DISTANCE_COST = 5  # points per cell of maze distance from a rollout's end to the nearest dot
+DIRECTIONS = (0, 1, 2, 3)
+POLICY_ITERATIONS = 300  # per move for the simulate.py policy, where time budgets would break determinism
+
+
+class Node:
+    __slots__ = ('snapshot', 'reward', 'terminal', 'children', 'untried', 'visits', 'total')
+
+    def __init__(self, snapshot: bytes, reward: float = 0.0, terminal: bool = False):
+        self.snapshot = snapshot
+        self.reward = reward      # points gained on the edge into this node
+        self.terminal = terminal
+        self.children: Dict[int, 'Node'] = {}
+        self.untried = list(DIRECTIONS)
+        self.visits = 0
+        self.total = 0.0          # sum of the returns from this node on
+
+
+def advance(sim: Simulation, direction: int, ticks: int) -> float:
+    """Hold a direction for `ticks` ticks; the points gained, minus lives lost"""
+    score, lives = sim.score, sim.lives
+    for _ in range(ticks):
+        if sim.over:
+            break
+        sim.step(direction)
+    return sim.score - score - DEATH_PENALTY * (lives - sim.lives)
+
+
+class Searcher:
+    """One UCT tree over a private Simulation"""
+    def __init__(self, levels: Callable, seed: int = 0):
+        self.sim = Simulation(levels)
+        self.rng = random.Random(seed)
+        self.root: Optional[Node] = None
+        self.rollouts = 0
+        self.search_time = 0.0
+        self.depth = 0
+        self.reused = 0     # visits inherited from the previous search
+        self.dot_cells: Dict[int, tuple] = {}  # id(CompiledLevel) -> artifact cell index per dot, per pellet
+
+    def set_root(self, snapshot: bytes):
+        """Search from this state next, keeping the subtree if it was already explored"""
+        root = None
+        if self.root is not None:
+            if self.root.snapshot == snapshot:
+                root = self.root
+            else:
+                root = next((child for child in self.root.children.values()
+                             if child.snapshot == snapshot), None)
+        self.root = root or Node(snapshot)
+        self.reused = self.root.visits
+        self.rollouts = 0
+        self.search_time = 0.0
+        self.depth = 0
+
+    def search(self, seconds: float = None, iterations: int = None):
+        """Grow the tree for a time budget or a number of rollouts, whichever ends first"""
+        start = time.perf_counter()
+        deadline = start + seconds if seconds is not None else math.inf
+        done = 0
+        while done != iterations:
+            self._iterate()
+            done += 1
+            if time.perf_counter() >= deadline:
+                break
+        self.search_time += time.perf_counter() - start
+
+    def _iterate(self):
+        sim = self.sim
+        node = self.root
+        path = [node]
+        # Selection
+        while not node.untried and node.children and not node.terminal:
+            node = self._select(node)
+            path.append(node)
+
+        # Expansion
+        restored = False
+        if node.untried and not node.terminal:
+            direction = node.untried.pop(self.rng.randrange(len(node.untried)))
+            sim.restore(node.snapshot)
+            reward = advance(sim, direction, MACRO_TICKS)
+            snapshot = sim.snapshot()
+            if any(child.snapshot == snapshot for child in node.children.values()):
+                return  # blocked, so the same move as a sibling
+            child = Node(snapshot, reward, sim.over)
+            node.children[direction] = child
+            node = child
+            path.append(node)
+            restored = True
+
+        # Rollout
+        value = 0.0
+        if not node.terminal:
+            if not restored:
+                sim.restore(node.snapshot)
+            value = self._rollout(sim)
+        self.rollouts += 1
+        self.depth = max(self.depth, len(path) - 1)
+
+        # Backpropagation: each node's total is the return from its own state
+        for step in reversed(path):
+            step.visits += 1
+            step.total += value
+            value += step.reward
+
+    def _select(self, node: Node) -> Node:
+        log_visits = math.log(node.visits)
+        best, best_score = None, -math.inf
+        for child in node.children.values():
+            score = (child.reward + child.total / child.visits
+                     + EXPLORATION * math.sqrt(log_visits / child.visits))
+            if score > best_score:
+                best, best_score = child, score
+        return best
+
+    def _rollout(self, sim: Simulation) -> float:
+        rng = self.rng
+        score, lives = sim.score, sim.lives
+        direction = sim.player.direction
+        for tick in range(ROLLOUT_TICKS):
+            if sim.over or sim.lives < lives:
+                break
+            if tick % MACRO_TICKS == 0:
+                roll = rng.random()
+                if roll < ROLLOUT_GREEDY:
+                    direction = self._toward_dot(sim, direction)
+                elif roll < (1 + ROLLOUT_GREEDY) / 2:
+                    direction = rng.randrange(4)
+            sim.step(direction)
+        value = sim.score - score - DEATH_PENALTY * (lives - sim.lives)
+        # Without this every rollout far from the remaining dots scores 0
+        # and the agent wanders
+        if not sim.over:
+            value -= DOT_DISTANCE_COST * self._nearest_dot(sim)[0]
+        return value
+
+    def _nearest_dot(self, sim: Simulation) -> Tuple[int, Optional[int], Optional[int]]:
+        """(maze distance, player cell, dot cell) for the nearest dot or pellet left
+
+        Cells are artifact cell indexes, None off the maze.
+        """
+        compiled = sim.compiled
+        artifacts = compiled.artifacts
+        cells = self.dot_cells.get(id(compiled))
+        if cells is None:
+            index = artifacts.cell_index
+            cells = self.dot_cells[id(compiled)] = (
+                [index[rect.x // CELL_SIZE, rect.y // CELL_SIZE] for rect in compiled.dots],
+                [index[rect.x // CELL_SIZE, rect.y // CELL_SIZE] for rect in compiled.pellets])
+        center = sim.player.rect.center
+        start = artifacts.cell_index.get((center[0] // CELL_SIZE, center[1] // CELL_SIZE))
+        if start is None:
+            # Off the maze (through a side opening): as the crow flies, so
+            # hiding out there doesn't look free
+            x, y = sim.player.rect.topleft
+            return min((abs(rect.x - x) + abs(rect.y - y) for rect in chain(sim.dots, sim.power_pellets)),
+                       default=0) // CELL_SIZE, None, None
+        n = len(artifacts.cells)
+        row = artifacts.distances[start * n:(start + 1) * n]
+        targets = list(chain(compress(cells[0], sim.dot_flags), compress(cells[1], sim.pellet_flags)))
+        distance, target = min(zip(map(row.__getitem__, targets), targets), default=(0, None))
+        return distance, start, target
+
+    def _toward_dot(self, sim: Simulation, default: int) -> int:
+        """First direction along a shortest path to the nearest dot"""
+        _, start, target = self._nearest_dot(sim)
+        if target is None:
+            return default
+        artifacts = sim.compiled.artifacts
+        distances = artifacts.distances
+        n = len(artifacts.cells)
+        x, y = artifacts.cells[start]
+        here = distances[start * n + target]
+        for direction in DIRECTIONS:
+            cell = artifacts.cell_index.get((x + DX[direction], y + DY[direction]))
+            if cell is not None and distances[cell * n + target] < here:
+                return direction
+        return default
+
+    def root_stats(self) -> List[Tuple[int, int, float]]:
+        """(direction, visits, summed return) per explored root move"""
+        return [(direction, child.visits, child.total + child.reward * child.visits)
+                for direction, child in self.root.children.items()]
+
+
+def _serve(conn, db_path: Optional[str], seed: int):
+    """Worker process: search whatever root the agent sends, reply with root stats"""
+    from env import load_levels
+
+    searcher = Searcher(load_levels(db_path).get, seed)
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        snapshot, seconds, iterations = message
+        searcher.set_root(snapshot)
+        searcher.search(seconds, iterations)
+        conn.send((searcher.root_stats(), searcher.rollouts, searcher.search_time,
+                   searcher.depth, searcher.reused))
+    conn.close()
+
+
+class MCTSAgent:
+    """Plays through Game's input path: call act(sim) once per tick, before sim.step
+
+    move_ms is the search time per move for workers, think_ms the search
+    time per tick when searching in-process. first_ms bounds the blocking
+    search for the first move of a run. When the game does something the
+    plan didn't predict, the last move is kept for one more macro step
+    while the search restarts from where it leads, so act() never stalls
+    a frame mid-run; quality knob changes don't count (see _plan_key).
+    """
+    def __init__(self, levels: Callable = None, workers: int = 0, think_ms: float = 6.0,
+                 move_ms: float = None, first_ms: float = 50.0, seed: int = 0, db_path: str = None):
+        self.think = think_ms / 1000
+        self.move = (move_ms if move_ms is not None else MACRO_TICKS * 1000 / FPS * 0.75) / 1000
+        self.first = first_ms / 1000
+        self.iterations: Optional[int] = None  # fixed rollouts per move instead of time budgets
+        self.connections = []
+        self.processes = []
+        self.searcher = None
+        if workers:
+            ctx = mp.get_context('spawn')  # don't fork a process that has SDL up
+            for i in range(workers):
+                parent, child = ctx.Pipe()
+                process = ctx.Process(target=_serve, args=(child, db_path, seed + i),
+                                      name=f'mcts-{i}', daemon=True)
+                process.start()
+                self.connections.append(parent)
+                self.processes.append(process)
+        else:
+            self.searcher = Searcher(levels, seed)
+        self.searching = False
+        self.reset()
+        self.rollouts_per_second = 0.0
+        self.depth = 0
+        self.reused = 0
+
+    def reset(self):
+        """Forget the plan, e.g. for a new run"""
+        self.action: Optional[int] = None
+        self.remaining = 0
+        self.planned: Optional[bytes] = None
+
+    def act(self, sim: Simulation) -> Optional[int]:
+        if sim.over:
+            return None
+        if self.remaining <= 0:
+            self._decide(sim)
+        elif self.searcher and self.iterations is None:
+            self.searcher.search(self.think)
+        self.remaining -= 1
+        return self.action
+
+    def _decide(self, sim: Simulation):
+        snapshot = sim.snapshot()
+        if self.planned is not None and _plan_key(snapshot) == _plan_key(self.planned):
+            stats = self._collect()
+        elif self.action is None:
+            # Nothing to fall back on yet
+            if self.searching:
+                self._collect()
+            self._start(snapshot, self.first)
+            stats = self._collect()
+        else:
+            # Off plan (a death, a new level): keep the last move
+            stats = None
+            if self.searching:
+                self._collect()  # stale, but the workers' pipes have to be drained
+        if stats:
+            self.action = max(stats, key=lambda d: (stats[d][0], stats[d][1]))
+        # Think about the state this move leads to while it plays out
+        future = sim.clone()
+        advance(future, self.action, MACRO_TICKS)
+        self.planned = future.snapshot()
+        self._start(self.planned, self.move)
+        self.remaining = MACRO_TICKS
+
+    def _start(self, snapshot: bytes, seconds: float):
+        if self.searcher:
+            self.searcher.set_root(snapshot)
+            if self.iterations is not None:
+                self.searcher.search(iterations=self.iterations)
+            return
+        for conn in self.connections:
+            conn.send((snapshot, None if self.iterations else seconds, self.iterations))
+        self.searching = True
+
+    def _collect(self) -> Dict[int, Tuple[int, float]]:
+        """Root stats of the search started last, summed over workers: direction -> (visits, return)"""
+        merged: Dict[int, Tuple[int, float]] = {}
+        if self.searcher:
+            if self.searcher.root.visits == self.searcher.reused:
+                self.searcher.search(self.first, self.iterations)
+            results = [(self.searcher.root_stats(), self.searcher.rollouts, self.searcher.search_time,
+                        self.searcher.depth, self.searcher.reused)]
+        else:
+            results = [conn.recv() for conn in self.connections]
+            self.searching = False
+        rollouts = elapsed = 0
+        self.depth = self.reused = 0
+        for stats, count, seconds, depth, reused in results:
+            for direction, visits, total in stats:
+                old_visits, old_total = merged.get(direction, (0, 0.0))
+                merged[direction] = (old_visits + visits, old_total + total)
+            rollouts += count
+            elapsed = max(elapsed, seconds)
+            self.depth = max(self.depth, depth)
+            self.reused += reused
+        if elapsed:
+            self.rollouts_per_second = rollouts / elapsed
+        return merged
+
+    def stats(self) -> dict:
+        return {'rollouts_per_second': self.rollouts_per_second, 'depth': self.depth,
+                'reused': self.reused, 'workers': len(self.processes)}
+
+    def close(self):
+        if self.searching:
+            self._collect()
+        for conn in self.connections:
+            conn.send(None)
+            conn.close()
+        for process in self.processes:
+            process.join(5)
+        self.connections = []
+        self.processes = []
+
+
+_policy_agent: Optional[MCTSAgent] = None
+
+
+def policy(sim: Simulation, rng) -> Optional[int]:
+    """simulate.py policy: in-process search, POLICY_ITERATIONS rollouts per move"""
+    global _policy_agent
+    if _policy_agent is None or _policy_agent.searcher.sim.levels is not sim.levels:
+        _policy_agent = MCTSAgent(sim.levels)
+        _policy_agent.iterations = POLICY_ITERATIONS
+    if sim.ticks == 0:
+        # Seeded per game, so results don't depend on which worker played it
+        _policy_agent.reset()
+        _policy_agent.searcher.rng.seed(int(rng.integers(1 << 63)))
+    return _policy_agent.act(sim)
@@ -0,0 +1,153 @@
+# migrations.py
+"""Versioned, incremental schema changes for pacman.db
+
+Each migration runs once, inside its own write transaction, and bumps
+schema_version. They are written to be safe on databases that were
+created by older code without a schema_version table.
+"""
+import sqlite3
+from typing import Callable, List, Tuple
+
+from level import LEVEL_FORMAT_VERSION, content_hash, decode_level, encode_grid, encode_pellets
+
+
+def _columns(cur: sqlite3.Cursor, table: str) -> List[str]:
+    return [row[1] for row in cur.execute(f'PRAGMA table_info({table})')]
+
+
+def create_base_tables(cur: sqlite3.Cursor):
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS maps (
+        level INTEGER PRIMARY KEY,
+        map_data TEXT,
+        wall_color TEXT,
+        power_pellets TEXT
+    )''')
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS scores (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        score INTEGER,
+        completed_level INTEGER,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+
+def add_format_version(cur: sqlite3.Cursor):
+    """maps.format_version, and rewrite legacy rows as canonical JSON"""
+    if 'format_version' not in _columns(cur, 'maps'):
+        cur.execute('ALTER TABLE maps ADD COLUMN format_version INTEGER NOT NULL DEFAULT 0')
+    rows = cur.execute(
+        'SELECT level, map_data, wall_color, power_pellets, format_version FROM maps '
+        'WHERE format_version < ?', (LEVEL_FORMAT_VERSION,)).fetchall()
+    cur.executemany(
+        'UPDATE maps SET map_data = ?, power_pellets = ?, format_version = ? WHERE level = ?',
+        [(encode_grid(level.grid), encode_pellets(level.pellets), LEVEL_FORMAT_VERSION, level.number)
+         for level in (decode_level(*row) for row in rows)])
+
+
+def add_level_artifacts(cur: sqlite3.Cursor):
+    # Derived data from compile_maps.py, keyed by the level's content hash
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS level_artifacts (
+        content_hash TEXT PRIMARY KEY,
+        version INTEGER NOT NULL,
+        meta TEXT NOT NULL,
+        distances BLOB
+    )''')
+
+
+def add_content_hash(cur: sqlite3.Cursor):
+    """maps.content_hash, so unchanged levels can be skipped on import"""
+    if 'content_hash' not in _columns(cur, 'maps'):
+        cur.execute('ALTER TABLE maps ADD COLUMN content_hash TEXT')
+    rows = cur.execute(
+        'SELECT level, map_data, wall_color, power_pellets, format_version FROM maps').fetchall()
+    cur.executemany('UPDATE maps SET content_hash = ? WHERE level = ?',
+                    [(content_hash(decode_level(*row)), row[0]) for row in rows])
+
+
+def add_score_indexes(cur: sqlite3.Cursor):
+    """Optional player/session columns and the leaderboard indexes"""
+    columns = _columns(cur, 'scores')
+    for name in ('player', 'session'):
+        if name not in columns:
+            cur.execute(f'ALTER TABLE scores ADD COLUMN {name} TEXT')
+    # Top-N and rank counts read only this index, never the table
+    cur.execute('CREATE INDEX IF NOT EXISTS scores_by_score ON scores (score DESC, completed_level, player)')
+    cur.execute('CREATE INDEX IF NOT EXISTS scores_by_level ON scores (completed_level, score)')
+
+
+def add_replays(cur: sqlite3.Cursor):
+    # Compressed frame streams (see replays.py), written through blobopen
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS replays (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        score_id INTEGER REFERENCES scores (id),
+        format_version INTEGER NOT NULL,
+        level INTEGER NOT NULL,
+        frame_count INTEGER NOT NULL,
+        raw_size INTEGER NOT NULL,
+        data BLOB NOT NULL
+    )''')
+    cur.execute('CREATE INDEX IF NOT EXISTS replays_by_score ON replays (score_id)')
+
+
+def add_score_bot_flag(cur: sqlite3.Cursor):
+    """scores.bot, so simulate.py's games stay off the player leaderboard"""
+    if 'bot' not in _columns(cur, 'scores'):
+        cur.execute('ALTER TABLE scores ADD COLUMN bot INTEGER NOT NULL DEFAULT 0')
+    # simulate.py has always saved its games under a sim- session
+    cur.execute("UPDATE scores SET bot = 1 WHERE session LIKE 'sim-%'")
+    # Leaderboard queries all filter on bot, so it leads both indexes
+    cur.execute('DROP INDEX IF EXISTS scores_by_score')
+    cur.execute('DROP INDEX IF EXISTS scores_by_level')
+    cur.execute('CREATE INDEX scores_by_score ON scores (bot, score DESC, completed_level, player)')
+    cur.execute('CREATE INDEX scores_by_level ON scores (bot, completed_level, score)')
+
+
+MIGRATIONS: List[Tuple[int, Callable[[sqlite3.Cursor], None]]] = [
+    (1, create_base_tables),
+    (2, add_format_version),
+    (3, add_level_artifacts),
+    (4, add_content_hash),
+    (5, add_score_indexes),
+    (6, add_replays),
+    (7, add_score_bot_flag),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    conn.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def stored_schema_version(conn: sqlite3.Connection) -> int:
+    """schema_version() that works on read-only connections (0 if never migrated)"""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'").fetchone():
+        return 0
+    return conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] or 0
+
+
+def migrate(conn: sqlite3.Connection) -> List[int]:
+    """Bring the schema up to SCHEMA_VERSION; returns the versions applied"""
+    if schema_version(conn) >= SCHEMA_VERSION:
+        conn.commit()
+        return []
+    applied = []
+    cur = conn.cursor()
+    for version, step in MIGRATIONS:
+        # IMMEDIATE takes the write lock first, so two processes starting at
+        # once can't both apply the same step
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            if schema_version(conn) < version:
+                step(cur)
+                cur.execute('INSERT INTO schema_version (version) VALUES (?)', (version,))
+                applied.append(version)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return applied
@@ -0,0 +1,155 @@
+# replays.py
+"""Recorded runs stored as zlib-compressed blobs in pacman.db
+
+A replay is a stream of fixed-size frames, one per simulation tick:
+the input direction, the level, the player position and score and each
+ghost's position and state. Frames are compressed as they are recorded
+into a SpooledTemporaryFile (memory up to REPLAY_SPOOL_BYTES, disk
+beyond), copied into the replays table chunk by chunk through
+Connection.blobopen and read back the same way, so neither side ever
+holds a whole replay in memory.
+
+    python replays.py                 # list stored replays
+    python replays.py dump REPLAY_ID  # print its frames
+"""
+import argparse
+import sqlite3
+import struct
+import tempfile
+import zlib
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from config import GHOST_SPAWNS, REPLAY_SPOOL_BYTES
+
+REPLAY_FORMAT_VERSION = 1
+NO_INPUT = 255
+CHUNK_SIZE = 64 * 1024
+
+# input, level, player x, player y, score, then (x, y, state) per ghost.
+# Positions are int32: actors can leave the map through a side opening
+# and keep going.
+FRAME = struct.Struct('<BBiiI' + 'iiB' * len(GHOST_SPAWNS))
+
+
+class Frame(NamedTuple):
+    input: Optional[int]                     # direction 0..3 pressed this tick
+    level: int
+    player: Tuple[int, int]
+    score: int
+    ghosts: Tuple[Tuple[int, int, int], ...]  # (x, y, state)
+
+    def pack(self) -> bytes:
+        ghosts = [value for ghost in self.ghosts for value in ghost]
+        return FRAME.pack(NO_INPUT if self.input is None else self.input, self.level,
+                          self.player[0], self.player[1], self.score, *ghosts)
+
+    @classmethod
+    def unpack(cls, data, offset: int = 0) -> 'Frame':
+        values = FRAME.unpack_from(data, offset)
+        ghosts = tuple(values[i:i + 3] for i in range(5, len(values), 3))
+        return cls(None if values[0] == NO_INPUT else values[0], values[1],
+                   (values[2], values[3]), values[4], ghosts)
+
+
+class ReplayRecorder:
+    """Compresses frames as they come in; finish() before saving"""
+    def __init__(self, level: int = 1):
+        self.level = level
+        self.frame_count = 0
+        self.raw_size = 0
+        self.file = tempfile.SpooledTemporaryFile(max_size=REPLAY_SPOOL_BYTES)
+        self.compressor = zlib.compressobj(6)
+        self.finished = False
+
+    def add(self, frame: Frame):
+        data = frame.pack()
+        self.file.write(self.compressor.compress(data))
+        self.frame_count += 1
+        self.raw_size += len(data)
+
+    def finish(self) -> int:
+        """Flush the compressor; returns the compressed size"""
+        if not self.finished:
+            self.file.write(self.compressor.flush())
+            self.finished = True
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def write_replay(conn: sqlite3.Connection, score_id: Optional[int], recorder: ReplayRecorder) -> int:
+    """Store a finished recording in the current transaction; returns its id
+
+    The row is inserted with a zeroblob of the right size, which is then
+    filled in CHUNK_SIZE pieces.
+    """
+    size = recorder.finish()
+    replay_id = conn.execute(
+        'INSERT INTO replays (score_id, format_version, level, frame_count, raw_size, data) '
+        'VALUES (?, ?, ?, ?, ?, zeroblob(?))',
+        (score_id, REPLAY_FORMAT_VERSION, recorder.level, recorder.frame_count,
+         recorder.raw_size, size)).lastrowid
+    recorder.file.seek(0)
+    with conn.blobopen('replays', 'data', replay_id) as blob:
+        while chunk := recorder.file.read(CHUNK_SIZE):
+            blob.write(chunk)
+    return replay_id
+
+
+def replay_for_score(conn: sqlite3.Connection, score_id: int) -> Optional[int]:
+    row = conn.execute('SELECT id FROM replays WHERE score_id = ?', (score_id,)).fetchone()
+    return row[0] if row else None
+
+
+def iter_frames(conn: sqlite3.Connection, replay_id: int) -> Iterator[Frame]:
+    """Decode a stored replay lazily, CHUNK_SIZE compressed bytes at a time"""
+    row = conn.execute('SELECT format_version FROM replays WHERE id = ?', (replay_id,)).fetchone()
+    if row is None:
+        raise KeyError(f"no replay {replay_id}")
+    if row[0] != REPLAY_FORMAT_VERSION:
+        raise ValueError(f"replay {replay_id}: unsupported format version {row[0]}")
+    decompressor = zlib.decompressobj()
+    pending = b''
+    with conn.blobopen('replays', 'data', replay_id, readonly=True) as blob:
+        while chunk := blob.read(CHUNK_SIZE):
+            # max_length keeps highly compressible stretches from expanding
+            # into one huge buffer
+            while chunk:
+                pending += decompressor.decompress(chunk, CHUNK_SIZE)
+                chunk = decompressor.unconsumed_tail
+                usable = len(pending) - len(pending) % FRAME.size
+                for offset in range(0, usable, FRAME.size):
+                    yield Frame.unpack(pending, offset)
+                pending = pending[usable:]
+    pending += decompressor.flush()
+    if len(pending) % FRAME.size:
+        raise ValueError(f"replay {replay_id} ends with a partial frame")
+    for offset in range(0, len(pending), FRAME.size):
+        yield Frame.unpack(pending, offset)
+
+
+def list_replays(conn: sqlite3.Connection) -> List[tuple]:
+    """(id, score_id, score, level, frames, raw size, stored size) per replay"""
+    return conn.execute(
+        'SELECT replays.id, score_id, scores.score, level, frame_count, raw_size, length(data) '
+        'FROM replays LEFT JOIN scores ON scores.id = replays.score_id ORDER BY replays.id').fetchall()
+
+
+if __name__ == '__main__':
+    from database import Database
+
+    parser = argparse.ArgumentParser(description="Inspect replays stored in pacman.db")
+    parser.add_argument('command', nargs='?', choices=('list', 'dump'), default='list')
+    parser.add_argument('replay_id', nargs='?', type=int)
+    args = parser.parse_args()
+
+    db = Database(read_only=True)
+    if args.command == 'dump':
+        for tick, frame in enumerate(iter_frames(db.reader(), args.replay_id)):
+            print(tick, frame.input, frame.level, frame.player, frame.score, frame.ghosts)
+    else:
+        for replay_id, score_id, score, level, frames, raw, stored in list_replays(db.reader()):
+            print(f"replay {replay_id:5d}: score #{score_id} = {score}, from level {level}, "
+                  f"{frames} frames, {raw} -> {stored} bytes")
+    db.close()
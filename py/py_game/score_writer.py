@@ -0,0 +1,208 @@
+# score_writer.py
+import queue
+import threading
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+from config import SCORE_QUEUE_SIZE, SCORE_BATCH_SIZE
+from replays import ReplayRecorder, write_replay
+
+ScoreRow = Tuple[int, int, Optional[str], Optional[str], bool]  # (score, completed_level, player, session, bot)
+
+
+class ReplayScore(NamedTuple):
+    row: ScoreRow
+    replay: ReplayRecorder
+
+
+class ScoreWriter:
+    """Background thread that appends scores to pacman.db
+
+    submit() only puts the row on a bounded queue; the writer thread
+    drains whatever has piled up (up to batch_size rows) and inserts it
+    with one executemany in one Database.transaction(), so a burst of
+    scores costs a single commit on the database's writer connection.
+    The game submits without blocking and a full queue drops the score
+    instead of stalling a frame; batch jobs pass block=True to get
+    backpressure instead. call() runs a function on the writer thread,
+    after everything queued before it is committed.
+    """
+    def __init__(self, db, max_queue: int = SCORE_QUEUE_SIZE, batch_size: int = SCORE_BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+        # Items: a list of rows, a ReplayScore, a flush Event, a function
+        # for call(), or None to stop
+        self.queue: queue.Queue = queue.Queue(max_queue)
+        # Called on the writer thread with the rows of each committed batch
+        self.commit_listeners: List[Callable[[List[ScoreRow]], None]] = []
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.last_error: Optional[Exception] = None
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name='score-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, score: int, level: int, player: str = None, session: str = None,
+               replay: ReplayRecorder = None, block: bool = False, bot: bool = False) -> bool:
+        """Queue one score, with the recording of the run if there is one
+
+        The writer owns the replay from here: it is closed once written, or
+        right away if the score is dropped.
+        """
+        row = (score, level, player, session, bot)
+        if replay is None:
+            return self.submit_many([row], block)
+        if not self.closed:
+            try:
+                self.queue.put(ReplayScore(row, replay), block)
+                return True
+            except queue.Full:
+                pass
+        self.dropped += 1
+        replay.close()
+        return False
+
+    def submit_many(self, rows: Iterable[ScoreRow], block: bool = True) -> bool:
+        """Queue rows for writing; False if they were dropped (queue full or closed)"""
+        rows = list(rows)
+        if self.closed:
+            self.dropped += len(rows)
+            return False
+        try:
+            self.queue.put(rows, block)
+            return True
+        except queue.Full:
+            self.dropped += len(rows)
+            return False
+
+    def call(self, fn: Callable[[], None]) -> bool:
+        """Run fn on the writer thread once what is queued so far is written
+
+        Never blocks; False if it was dropped (queue full or closed).
+        """
+        if self.closed:
+            return False
+        try:
+            self.queue.put(fn, False)
+            return True
+        except queue.Full:
+            return False
+
+    def flush(self, wait: bool = False, timeout: float = None) -> Optional[threading.Event]:
+        """Commit everything submitted so far; the event is set once it is on disk
+
+        Without wait this never blocks: if the queue is full the writer is
+        busy draining it anyway, so no marker is queued and None is returned.
+        """
+        done = threading.Event()
+        if self.closed:
+            done.set()
+            return done
+        try:
+            self.queue.put(done, wait)
+        except queue.Full:
+            return None
+        if wait:
+            done.wait(timeout)
+        return done
+
+    def close(self, timeout: float = 5.0):
+        """Write what is still queued and stop the thread"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join(timeout)
+        if not self.thread.is_alive():
+            self._reject_pending()
+
+    def stats(self) -> dict:
+        return {
+            'written': self.written,
+            'batches': self.batches,
+            'dropped': self.dropped,
+            'queued': self.queue.qsize(),
+            'last_error': repr(self.last_error) if self.last_error else None,
+        }
+
+    def _run(self):
+        running = True
+        while running:
+            item = self.queue.get()
+            rows: List[ScoreRow] = []
+            replays: List[ReplayScore] = []
+            waiters: List[threading.Event] = []
+            call = None
+            while True:
+                if item is None:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif isinstance(item, ReplayScore):
+                    replays.append(item)
+                elif callable(item):
+                    # Ends the batch, so it runs after exactly what came before it
+                    call = item
+                else:
+                    rows.extend(item)
+                if not running or call or len(rows) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if rows or replays:
+                self._write(rows, replays)
+            if call:
+                try:
+                    call()
+                except Exception as e:
+                    self.last_error = e
+            for done in waiters:
+                done.set()
+        self._reject_pending()
+
+    def _reject_pending(self):
+        """Drop what was queued behind the stop sentinel by submits racing close()"""
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(item, threading.Event):
+                item.set()
+            elif isinstance(item, ReplayScore):
+                self.dropped += 1
+                item.replay.close()
+            elif isinstance(item, list):
+                self.dropped += len(item)
+
+    def _write(self, rows: List[ScoreRow], replays: List[ReplayScore]):
+        insert = 'INSERT INTO scores (score, completed_level, player, session, bot) VALUES (?, ?, ?, ?, ?)'
+        # Listeners run before write_lock is released, so a reader holding
+        # it (Leaderboard.reload) never sees a commit without its callback
+        with self.db.write_lock:
+            try:
+                with self.db.transaction() as conn:
+                    conn.executemany(insert, rows)
+                    # Runs with a replay need their score id, so one insert each
+                    for job in replays:
+                        write_replay(conn, conn.execute(insert, job.row).lastrowid, job.replay)
+            except Exception as e:
+                # Anything, not just sqlite3.Error (the replay spool can raise
+                # OSError): flush() and close() wait on this thread, so keep
+                # it alive; the batch is lost but later ones may succeed
+                self.last_error = e
+                self.dropped += len(rows) + len(replays)
+                return
+            finally:
+                for job in replays:
+                    job.replay.close()
+            rows = rows + [job.row for job in replays]
+            self.written += len(rows)
+            self.batches += 1
+            for listener in self.commit_listeners:
+                try:
+                    listener(rows)
+                except Exception as e:
+                    self.last_error = e
@@ -0,0 +1,205 @@
+# shared_env.py
+"""BatchEnv split across worker processes that share their arrays with the parent
+
+Every input and output - actions, observations, rewards, episode flags
+and info - lives in one multiprocessing.shared_memory block. Each worker
+runs a BatchEnv over its own slice of the games, and that BatchEnv's
+observation and dot buffers *are* the shared arrays, so nothing is
+pickled or copied between processes. A step is: the parent writes the
+actions, everyone meets at the `start` barrier, the workers step their
+slices, everyone meets at the `done` barrier.
+
+    with SharedBatchEnv(65536, workers=32) as envs:
+        obs, info = envs.reset()
+        obs, rewards, terminated, truncated, info = envs.step(actions)
+
+The returned arrays are views of shared memory, overwritten by the next
+call.
+"""
+import multiprocessing as mp
+import os
+import threading
+from multiprocessing.connection import wait
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from batch_env import BatchEnv, LevelTables
+from env import STATE_FIELDS, load_levels
+
+STEP, RESET, CLOSE = range(3)
+SYNC_TIMEOUT = 60.0  # seconds a barrier waits before assuming a worker died
+
+
+def _layout(count: int, tables: LevelTables) -> Dict[str, Tuple[int, tuple, str]]:
+    """name -> (byte offset, shape, dtype) within the shared block"""
+    fields = [
+        ('control', (2,), 'i4'),
+        ('actions', (count,), 'i4'),
+        ('state', (count, len(STATE_FIELDS)), 'i4'),
+        ('dots', (count, tables.height + 2, tables.width + 2), 'u1'),  # padded, as BatchEnv keeps it
+        ('rewards', (count,), 'f4'),
+        ('terminated', (count,), '?'),
+        ('truncated', (count,), '?'),
+        ('won', (count,), '?'),
+    ] + [(name, (count,), 'i4') for name in
+         ('score', 'lives', 'level', 'ticks', 'final_score', 'final_level', 'final_ticks')]
+    layout = {}
+    offset = 0
+    for name, shape, dtype in fields:
+        layout[name] = (offset, shape, dtype)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        offset += (size + 63) // 64 * 64  # cache-line aligned, so slices don't share lines
+    return layout
+
+
+def _size(layout) -> int:
+    offset, shape, dtype = max(layout.values(), key=lambda v: v[0])
+    return offset + int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+
+def _views(buffer, layout) -> Dict[str, np.ndarray]:
+    return {name: np.ndarray(shape, dtype, buffer=buffer, offset=offset)
+            for name, (offset, shape, dtype) in layout.items()}
+
+
+def _publish(arrays: Dict[str, np.ndarray], part: slice, rewards, terminated, truncated, info):
+    arrays['rewards'][part] = rewards
+    arrays['terminated'][part] = terminated
+    arrays['truncated'][part] = truncated
+    for name in ('score', 'lives', 'level', 'ticks'):
+        arrays[name][part] = info[name]
+    for name in ('final_score', 'final_level', 'final_ticks'):
+        arrays[name][part] = info.get(name, -1)
+    arrays['won'][part] = info.get('won', False)
+
+
+def _worker(name: str, layout, part: slice, tables: LevelTables, max_steps: int, start_level: int,
+            start: threading.Barrier, done: threading.Barrier):
+    shm = SharedMemory(name)
+    arrays = env = None
+    try:
+        arrays = _views(shm.buf, layout)
+        env = BatchEnv(part.stop - part.start, max_steps=max_steps, start_level=start_level, tables=tables)
+        # Step straight into shared memory
+        env.obs_state = arrays['state'][part]
+        env.dots = arrays['dots'][part]
+        while True:
+            start.wait()
+            command = arrays['control'][0]
+            if command == CLOSE:
+                break
+            if command == RESET:
+                env.reset()
+                _publish(arrays, part, 0, False, False, env.info())
+            else:
+                _, rewards, terminated, truncated, info = env.step(arrays['actions'][part])
+                _publish(arrays, part, rewards, terminated, truncated, info)
+            done.wait()
+    except threading.BrokenBarrierError:
+        pass  # another process failed; the parent reports it
+    except BaseException:
+        # Wake the parent and the other workers, whichever barrier they're at
+        start.abort()
+        done.abort()
+        raise
+    finally:
+        del arrays, env
+        shm.close()
+
+
+class SharedBatchEnv:
+    def __init__(self, count: int, workers: int = None, levels=None, max_steps: int = None,
+                 start_level: int = 1, db_path: str = None, tables: LevelTables = None,
+                 context: str = None):
+        self.count = count
+        self.workers = max(1, min(workers or os.cpu_count() or 1, count))
+        tables = tables or LevelTables(levels if levels is not None else load_levels(db_path))
+        self.height, self.width = tables.height, tables.width
+        self.layout = _layout(count, tables)
+        self.shm = SharedMemory(create=True, size=_size(self.layout))
+        self.arrays = _views(self.shm.buf, self.layout)
+        self.closed = False
+
+        ctx = mp.get_context(context)
+        self.start = ctx.Barrier(self.workers + 1)
+        self.done = ctx.Barrier(self.workers + 1)
+        bounds = np.linspace(0, count, self.workers + 1).astype(int)
+        self.processes: List[mp.Process] = []
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            process = ctx.Process(
+                target=_worker, name=f'shared-env-{lo}',
+                args=(self.shm.name, self.layout, slice(int(lo), int(hi)), tables, max_steps,
+                      start_level, self.start, self.done),
+                daemon=True)
+            process.start()
+            self.processes.append(process)
+        threading.Thread(target=self._watch, name='shared-env-watch', daemon=True).start()
+
+    def _watch(self):
+        """Break both barriers as soon as a worker exits before close()
+
+        Covers workers that die without running their own error handling
+        (killed, out of memory), so the parent fails right away instead of
+        after SYNC_TIMEOUT.
+        """
+        wait([process.sentinel for process in self.processes])
+        if not self.closed:
+            self.start.abort()
+            self.done.abort()
+
+    def _run(self, command: int):
+        if self.closed:
+            raise RuntimeError("environment is closed")
+        self.arrays['control'][0] = command
+        try:
+            self.start.wait(SYNC_TIMEOUT)
+            self.done.wait(SYNC_TIMEOUT)
+        except threading.BrokenBarrierError:
+            self.close()
+            raise RuntimeError("a worker failed or timed out, see its traceback") from None
+
+    def reset(self, seed: int = None) -> Tuple[dict, dict]:
+        self._run(RESET)
+        return self.observation(), self.info()
+
+    def step(self, actions) -> Tuple[dict, np.ndarray, np.ndarray, np.ndarray, dict]:
+        self.arrays['actions'][:] = actions
+        self._run(STEP)
+        arrays = self.arrays
+        info = self.info()
+        finished = arrays['terminated'] | arrays['truncated']
+        if finished.any():
+            for name in ('final_score', 'final_level', 'final_ticks', 'won'):
+                info[name] = arrays[name]
+        return self.observation(), arrays['rewards'], arrays['terminated'], arrays['truncated'], info
+
+    def observation(self) -> dict:
+        return {'state': self.arrays['state'], 'dots': self.arrays['dots'][:, 1:-1, 1:-1]}
+
+    def info(self) -> dict:
+        return {name: self.arrays[name] for name in ('score', 'lives', 'level', 'ticks')}
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.arrays['control'][0] = CLOSE
+        try:
+            self.start.wait(SYNC_TIMEOUT)
+        except threading.BrokenBarrierError:
+            pass
+        for process in self.processes:
+            process.join(SYNC_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+        del self.arrays
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self) -> 'SharedBatchEnv':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
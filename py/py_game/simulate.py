@@ -0,0 +1,251 @@
+# simulate.py
+"""Play many headless games with a bot and summarise how it did
+
+    python simulate.py --games 100000 --workers 32 --policy simulate:wander --levels 1-12 --seed 7
+
+A policy is any `module:function` importable from here, called once per
+tick as fn(sim, rng) with the game's Simulation and the game's own
+numpy Generator; it returns a direction (0 right, 1 down, 2 left, 3 up)
+or None / env.NOOP for no key. Game i is seeded with (seed, i), so a
+run's results don't depend on how games were split across workers.
+
+Games start on the first level of --levels (or spread over all of them
+with --spread) and end when the lives run out, the range is cleared, or
+--max-ticks passes. Each finished game is a row in pacman.db's scores
+table, tagged with the policy as player, a session id for the run and
+the bot flag that keeps it off the in-game leaderboard.
+"""
+import argparse
+import importlib
+import multiprocessing as mp
+import os
+import time
+import uuid
+from collections import Counter
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from config import *
+from env import NOOP, load_levels
+from simulation import Simulation
+
+DEFAULT_MAX_TICKS = 10 * 60 * FPS  # ten minutes of play
+
+
+class GameResult(NamedTuple):
+    game: int
+    start_level: int
+    score: int
+    level: int        # last level played
+    ticks: int
+    won: bool         # cleared every level in range
+    timed_out: bool
+    deaths: Tuple[int, ...]  # ghost index per life lost
+
+
+def wander(sim: Simulation, rng: np.random.Generator) -> Optional[int]:
+    """Baseline bot: keep going, pick a new random direction now and then"""
+    if rng.random() < 0.05:
+        return int(rng.integers(4))
+    return None
+
+
+def load_policy(spec: str) -> Callable:
+    module, _, name = spec.partition(':')
+    if not name:
+        raise ValueError(f"policy must be module:function, got {spec!r}")
+    return getattr(importlib.import_module(module), name)
+
+
+def parse_levels(spec: str) -> List[int]:
+    """'1-12' or '3' or '1,4,6-8'"""
+    levels = []
+    for part in spec.split(','):
+        first, _, last = part.partition('-')
+        levels.extend(range(int(first), int(last or first) + 1))
+    return levels
+
+
+class Summary:
+    """Streaming aggregate of GameResults; merge() combines partial summaries"""
+    def __init__(self):
+        self.games = 0
+        self.wins = 0
+        self.timeouts = 0
+        self.score_sum = 0
+        self.score_squares = 0
+        self.score_min: Optional[int] = None
+        self.score_max: Optional[int] = None
+        self.ticks_sum = 0
+        self.levels = Counter()   # level ended on -> games
+        self.deaths = Counter()   # ghost index -> lives lost
+
+    def add(self, result: GameResult):
+        self.games += 1
+        self.wins += result.won
+        self.timeouts += result.timed_out
+        self.score_sum += result.score
+        self.score_squares += result.score * result.score
+        self.score_min = result.score if self.score_min is None else min(self.score_min, result.score)
+        self.score_max = result.score if self.score_max is None else max(self.score_max, result.score)
+        self.ticks_sum += result.ticks
+        self.levels[result.level] += 1
+        self.deaths.update(result.deaths)
+
+    def merge(self, other: 'Summary'):
+        self.games += other.games
+        self.wins += other.wins
+        self.timeouts += other.timeouts
+        self.score_sum += other.score_sum
+        self.score_squares += other.score_squares
+        for value in (other.score_min, other.score_max):
+            if value is not None:
+                self.score_min = value if self.score_min is None else min(self.score_min, value)
+                self.score_max = value if self.score_max is None else max(self.score_max, value)
+        self.ticks_sum += other.ticks_sum
+        self.levels.update(other.levels)
+        self.deaths.update(other.deaths)
+
+    def report(self) -> str:
+        if not self.games:
+            return "no games played"
+        mean = self.score_sum / self.games
+        spread = max(0.0, self.score_squares / self.games - mean * mean) ** 0.5
+        lines = [
+            f"games     {self.games}  won {self.wins}  timed out {self.timeouts}",
+            f"score     mean {mean:.1f}  sd {spread:.1f}  min {self.score_min}  max {self.score_max}",
+            f"ticks     mean {self.ticks_sum / self.games:.0f}  ({self.ticks_sum / self.games / FPS:.1f}s of play)",
+            "last lvl  " + '  '.join(f"L{level}: {count}" for level, count in sorted(self.levels.items())),
+            "deaths    " + ('  '.join(f"ghost {ghost}: {count}" for ghost, count in sorted(self.deaths.items()))
+                            or 'none'),
+        ]
+        return '\n'.join(lines)
+
+
+# Per-worker state, set once by _init so every chunk reuses the compiled levels
+_worker: dict = {}
+
+
+def _init(db_path: Optional[str], levels: List[int], policy: str, max_ticks: int):
+    # An initializer that raises makes Pool respawn the worker forever, so
+    # failures are kept and raised by the first chunk instead
+    try:
+        compiled = load_levels(db_path)
+        in_range = {n: compiled[n] for n in levels if n in compiled}
+        missing = sorted(set(levels) - set(in_range))
+        if missing:
+            raise ValueError(f"levels not in the database: {missing}")
+        sim = Simulation(in_range.get)
+        sim.set_quality(False, GHOST_REPLAN_INTERVAL)
+        _worker.update(sim=sim, policy=load_policy(policy), max_ticks=max_ticks, error=None)
+    except Exception as e:
+        _worker['error'] = e
+
+
+def play(game: int, start_level: int, seed: int) -> GameResult:
+    if _worker['error']:
+        raise _worker['error']
+    sim, policy, max_ticks = _worker['sim'], _worker['policy'], _worker['max_ticks']
+    rng = np.random.default_rng((seed, game))
+    sim.reset(start_level, int(rng.integers(1 << 63)))
+    sim.load_level()
+    while not sim.over and sim.ticks < max_ticks:
+        action = policy(sim, rng)
+        sim.step(None if action is None or action == NOOP else action)
+    return GameResult(game, start_level, sim.score, sim.current_level - sim.won, sim.ticks, sim.won,
+                      not sim.over, tuple(ghost for _, _, ghost in sim.deaths))
+
+
+def _play_chunk(chunk: Tuple[List[Tuple[int, int]], int]) -> Tuple[Summary, List[tuple]]:
+    """Play (game, start level) pairs; returns their summary and score rows"""
+    games, seed = chunk
+    summary = Summary()
+    rows = []
+    for game, start_level in games:
+        result = play(game, start_level, seed)
+        summary.add(result)
+        # Levels cleared in this game; Game.game_over's current_level - 1 is
+        # the same count for the player, who always starts on level 1
+        rows.append((result.score, result.level - result.start_level + result.won))
+    return summary, rows
+
+
+def chunks(count: int, levels: List[int], spread: bool, size: int, seed: int) -> Iterator[tuple]:
+    games = []
+    for game in range(count):
+        games.append((game, levels[game % len(levels)] if spread else levels[0]))
+        if len(games) == size:
+            yield games, seed
+            games = []
+    if games:
+        yield games, seed
+
+
+def run(games: int, workers: int, policy: str, levels: List[int], seed: int,
+        max_ticks: int = DEFAULT_MAX_TICKS, spread: bool = False, chunk_size: int = None,
+        db_path: str = None, on_chunk: Callable[[Summary, List[tuple]], None] = None) -> Summary:
+    """Play the games, merging each chunk's results as it arrives"""
+    workers = max(1, workers)
+    chunk_size = chunk_size or max(1, min(256, games // (workers * 8)))
+    work = chunks(games, levels, spread, chunk_size, seed)
+    initargs = (db_path, levels, policy, max_ticks)
+    total = Summary()
+    if workers == 1:
+        _init(*initargs)
+        results = map(_play_chunk, work)
+        pool = None
+    else:
+        pool = mp.Pool(workers, initializer=_init, initargs=initargs)
+        results = pool.imap_unordered(_play_chunk, work)
+    try:
+        for summary, rows in results:
+            total.merge(summary)
+            if on_chunk:
+                on_chunk(summary, rows)
+    except BaseException:
+        if pool:
+            pool.terminate()
+        raise
+    if pool:
+        pool.close()
+        pool.join()
+    return total
+
+
+if __name__ == '__main__':
+    from database import Database
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--policy', default='simulate:wander', help="module:function, see the module docstring")
+    parser.add_argument('--levels', default='1', help="level range, e.g. 1-12")
+    parser.add_argument('--spread', action='store_true', help="start games on every level in range, round robin")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-ticks', type=int, default=DEFAULT_MAX_TICKS)
+    parser.add_argument('--chunk-size', type=int)
+    parser.add_argument('--no-save', action='store_true', help="don't write the scores to pacman.db")
+    args = parser.parse_args()
+
+    db = None if args.no_save else Database()
+    session = f"sim-{uuid.uuid4().hex}"
+    player = args.policy
+
+    def save(summary: Summary, rows: List[tuple]):
+        if db:
+            db.scores.submit_many([(score, level, player, session, True) for score, level in rows])
+
+    started = time.perf_counter()
+    try:
+        summary = run(args.games, args.workers, args.policy, parse_levels(args.levels), args.seed,
+                      args.max_ticks, args.spread, args.chunk_size, on_chunk=save)
+    finally:
+        if db:
+            db.close()
+    elapsed = time.perf_counter() - started
+    print(summary.report())
+    print(f"{elapsed:.1f}s, {summary.games / elapsed:.0f} games/s, "
+          f"{summary.ticks_sum / elapsed:.0f} ticks/s")
+    if db:
+        print(f"scores saved as session {session}")
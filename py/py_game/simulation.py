@@ -0,0 +1,312 @@
+# simulation.py
+import random
+import struct
+from itertools import compress
+from typing import Callable, List, Optional
+
+import pygame
+
+from config import *
+from sprites import Player, Ghost
+from zobrist import DOT_KEYS, PELLET_KEYS, actors_hash, board_hash
+
+DX = (1, 0, -1, 0)  # by direction: 0 right, 1 down, 2 left, 3 up
+DY = (0, 1, 0, -1)
+
+MASK64 = (1 << 64) - 1
+
+# Snapshot layout (little endian): the head, one GHOST record per ghost,
+# one byte per template dot and pellet (1 = still there), then a DEATH
+# record per life lost. Bump SNAPSHOT_VERSION whenever it changes.
+SNAPSHOT_VERSION = 1
+# version, level, ticks, score, lives, over, re-plan interval, animate,
+# seed, rng state, board hash (see zobrist.py), player x, y, direction, animation frame, deaths.
+# Positions are int32: actors can walk out through a side opening and keep going.
+SNAPSHOT_HEAD = struct.Struct('<BHIIBBHBQQQiiBBB')
+# x, y, direction, state, frightened timer, respawn timer, last re-plan (-1 = never), visible
+SNAPSHOT_GHOST = struct.Struct('<iiBBHiiB')
+SNAPSHOT_DEATH = struct.Struct('<IHB')  # tick, level, ghost index
+
+
+class SplitMix64(random.Random):
+    """random.Random whose whole state is one 64-bit word, so it snapshots in 8 bytes"""
+    def seed(self, a: int = None, version: int = 2):
+        self.state = (random.getrandbits(64) if a is None else a) & MASK64
+        self.gauss_next = None
+
+    def _next(self) -> int:
+        self.state = z = (self.state + 0x9E3779B97F4A7C15) & MASK64
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+        return z ^ (z >> 31)
+
+    def random(self) -> float:
+        return (self._next() >> 11) * (1.0 / (1 << 53))
+
+    def getrandbits(self, k: int) -> int:
+        if k < 0:
+            raise ValueError("number of bits must be non-negative")
+        value = 0
+        for _ in range((k + 63) // 64):
+            value = value << 64 | self._next()
+        return value >> (-k % 64)
+
+    def getstate(self) -> int:
+        return self.state
+
+    def setstate(self, state: int):
+        self.state = state
+        self.gauss_next = None
+
+
+def _no_lap(phase: str):
+    pass
+
+
+class Simulation:
+    """The game rules, one step() per tick, without a window
+
+    Game drives one of these from its frame loop; env.py drives it
+    headless. Time is counted in ticks, so ghost re-plans and respawns
+    happen at the same points of a run whatever the frame rate.
+
+    Levels come from `levels`, a level number -> CompiledLevel lookup
+    (e.g. LevelCache.get); the compiled walls and dot templates are
+    shared, only the dot lists are per run.
+
+    Anything random in the rules must draw from `rng`, seeded by reset(),
+    so a run is reproduced by its seed and inputs (see input_log.py).
+
+    snapshot() captures the whole state as a few hundred bytes; restore()
+    puts it back and clone() makes an independent copy, for rollouts and
+    rollback. `hash` is the position's Zobrist key (see zobrist.py).
+    """
+    def __init__(self, levels: Callable[[int], Optional['CompiledLevel']], timer=None):
+        self.levels = levels
+        self.lap = timer.lap if timer else _no_lap
+        # Quality knobs (see Game.apply_quality), applied to new actors too
+        self.animate = True
+        self.replan_interval = GHOST_REPLAN_INTERVAL
+        self.reset()
+
+    def reset(self, level: int = 1, seed: int = None):
+        """Back to the start of a run; call load_level() to begin playing"""
+        self.seed = random.getrandbits(64) if seed is None else seed
+        self.rng = SplitMix64(self.seed)
+        self.ticks = 0
+        self.current_level = level
+        self.score = 0
+        self.lives = INITIAL_LIVES
+        self.over = False        # lost all lives or ran out of levels
+        self.deaths: List[tuple] = []  # (tick, level, ghost index) per life lost
+
+        self.compiled = None
+        self.player = None
+        self.ghosts = []
+        self.walls = []
+        self.wall_cells = frozenset()
+        self.dots = []
+        self.power_pellets = []
+        self.dot_flags = bytearray()     # per template dot, 1 = not eaten yet
+        self.pellet_flags = bytearray()
+        self.board_hash = 0              # Zobrist key of the level and the dots left
+
+        self.eaten: List[pygame.Rect] = []  # dots/pellets eaten by the last step
+        self.level_loaded = False            # the last step (re)started a level
+
+    @property
+    def now_ms(self) -> int:
+        """Simulated milliseconds since reset, FPS ticks per second"""
+        return self.ticks * 1000 // FPS
+
+    @property
+    def hash(self) -> int:
+        """64-bit Zobrist key of the position: board plus actors"""
+        return self.board_hash ^ actors_hash(self)
+
+    @property
+    def won(self) -> bool:
+        return self.over and self.lives > 0
+
+    def load_level(self) -> bool:
+        compiled = self.levels(self.current_level)
+        if not compiled:
+            return False
+
+        # Swap in the precompiled level; only the dot lists are mutable
+        self.compiled = compiled
+        self.walls = compiled.walls
+        self.wall_cells = compiled.wall_cells
+        self.dots = compiled.new_dots()
+        self.power_pellets = compiled.new_pellets()
+        self.dot_flags = bytearray(b'\1') * len(compiled.dots)
+        self.pellet_flags = bytearray(b'\1') * len(compiled.pellets)
+
+        # Create player and ghosts
+        self.player = Player(PLAYER_SPAWN[0] * CELL_SIZE, PLAYER_SPAWN[1] * CELL_SIZE)
+        self.ghosts = [
+            Ghost(x * CELL_SIZE, y * CELL_SIZE, color)
+            for (x, y), color in zip(GHOST_SPAWNS, GHOST_COLORS)
+        ]
+        self.set_quality(self.animate, self.replan_interval)
+        self.board_hash = board_hash(self)
+        self.level_loaded = True
+        return True
+
+    def set_quality(self, animate: bool, replan_interval: int):
+        self.animate = animate
+        self.replan_interval = replan_interval
+        if self.player:
+            self.player.animate = animate
+        for ghost in self.ghosts:
+            ghost.replan_interval = replan_interval
+
+    def step(self, direction: Optional[int]) -> int:
+        """Advance one tick with the given input (None = no key); returns the score gained"""
+        self.ticks += 1
+        self.eaten = []
+        self.level_loaded = False
+        start_score = self.score
+        player = self.player
+        walls = self.walls
+
+        # Turn if the requested direction is open
+        if direction is not None:
+            next_rect = player.rect.move(DX[direction] * player.speed, DY[direction] * player.speed)
+            if next_rect.collidelist(walls) == -1:
+                player.direction = direction
+
+        player.update(walls)
+        self.lap('update.player')
+
+        now = self.now_ms
+        for ghost in self.ghosts:
+            ghost.update(player, walls, self.wall_cells, now)
+        self.lap('update.ghosts')
+
+        # Check dot collection
+        player_rect = player.rect
+        for i in reversed(player_rect.collidelistall(self.dots)):
+            dot = self.dots.pop(i)
+            self.eaten.append(dot)
+            index = self.compiled.dot_index[dot.x, dot.y]
+            self.dot_flags[index] = 0
+            self.board_hash ^= DOT_KEYS[index]
+            self.score += 10
+
+        # Check power pellet collection
+        for i in reversed(player_rect.collidelistall(self.power_pellets)):
+            pellet = self.power_pellets.pop(i)
+            self.eaten.append(pellet)
+            index = self.compiled.pellet_index[pellet.x, pellet.y]
+            self.pellet_flags[index] = 0
+            self.board_hash ^= PELLET_KEYS[index]
+            self.score += 50
+            for ghost in self.ghosts:
+                ghost.state = 3
+                ghost.frightened_timer = POWER_PELLET_DURATION
+        self.lap('update.dots')
+
+        # Check ghost collisions
+        for i, ghost in enumerate(self.ghosts):
+            if player_rect.colliderect(ghost.rect):
+                if ghost.state == 3:
+                    ghost.state = 4
+                    self.score += 100
+                elif ghost.state == 1:
+                    self.lives -= 1
+                    self.deaths.append((self.ticks, self.current_level, i))
+                    if self.lives <= 0:
+                        self.over = True
+                    else:
+                        self.load_level()
+                    break  # one life per tick; the level restarted under us
+
+        # Check level completion
+        if not self.over and not self.dots and not self.power_pellets:
+            self.current_level += 1
+            if not self.load_level():
+                self.over = True
+        if self.over and not self.level_loaded:
+            self.board_hash = board_hash(self)  # ran out of levels: current_level moved on
+        self.lap('update.collisions')
+        return self.score - start_score
+
+    def snapshot(self) -> bytes:
+        """The full state of a loaded run as flat bytes (hashable, comparable)
+
+        Only the level number is stored, so restore() needs the same levels.
+        The dots/pellets eaten by the last step (eaten, level_loaded) are not
+        part of it.
+        """
+        player = self.player
+        parts = [SNAPSHOT_HEAD.pack(
+            SNAPSHOT_VERSION, self.current_level, self.ticks, self.score, self.lives, self.over,
+            self.replan_interval, self.animate, self.seed, self.rng.state, self.board_hash, player.rect.x,
+            player.rect.y, player.direction, player.animation_frame, len(self.deaths))]
+        pack_ghost = SNAPSHOT_GHOST.pack
+        for ghost in self.ghosts:
+            parts.append(pack_ghost(
+                ghost.rect.x, ghost.rect.y, ghost.direction, ghost.state, ghost.frightened_timer,
+                ghost.respawn_timer, -1 if ghost.path_update_timer is None else ghost.path_update_timer,
+                ghost.visible))
+        parts.append(self.dot_flags)
+        parts.append(self.pellet_flags)
+        for death in self.deaths:
+            parts.append(SNAPSHOT_DEATH.pack(*death))
+        return b''.join(parts)
+
+    def restore(self, data: bytes):
+        """Return to a snapshot(), reusing this simulation's actors"""
+        (version, level, self.ticks, self.score, self.lives, over, replan_interval, animate,
+         self.seed, rng_state, self.board_hash, x, y, direction, frame, deaths) = SNAPSHOT_HEAD.unpack_from(data)
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported snapshot version {version}")
+        if self.compiled is None or level != self.current_level:
+            self.compiled = self.levels(level)
+            if not self.compiled:
+                raise ValueError(f"no level {level}")
+            self.walls = self.compiled.walls
+            self.wall_cells = self.compiled.wall_cells
+        compiled = self.compiled
+        self.current_level = level
+        self.over = bool(over)
+        self.rng.setstate(rng_state)
+        self.eaten = []
+        self.level_loaded = False
+
+        if self.player is None:
+            self.player = Player(x, y)
+            self.ghosts = [Ghost(gx * CELL_SIZE, gy * CELL_SIZE, color)
+                           for (gx, gy), color in zip(GHOST_SPAWNS, GHOST_COLORS)]
+        player = self.player
+        player.rect = pygame.Rect(x, y, player.rect.width, player.rect.height)
+        player.direction = direction
+        player.animation_frame = frame
+
+        offset = SNAPSHOT_HEAD.size
+        unpack_ghost = SNAPSHOT_GHOST.unpack_from
+        for ghost in self.ghosts:
+            (gx, gy, ghost.direction, ghost.state, ghost.frightened_timer, ghost.respawn_timer,
+             replanned, visible) = unpack_ghost(data, offset)
+            ghost.rect = pygame.Rect(gx, gy, ghost.rect.width, ghost.rect.height)
+            ghost.path_update_timer = None if replanned == -1 else replanned
+            ghost.visible = bool(visible)
+            ghost.path = []
+            offset += SNAPSHOT_GHOST.size
+        self.set_quality(bool(animate), replan_interval)
+
+        end = offset + len(compiled.dots)
+        self.dot_flags = bytearray(data[offset:end])
+        self.dots = list(compress(compiled.dots, self.dot_flags))
+        offset, end = end, end + len(compiled.pellets)
+        self.pellet_flags = bytearray(data[offset:end])
+        self.power_pellets = list(compress(compiled.pellets, self.pellet_flags))
+        self.deaths = [SNAPSHOT_DEATH.unpack_from(data, end + i * SNAPSHOT_DEATH.size)
+                       for i in range(deaths)]
+
+    def clone(self) -> 'Simulation':
+        """An independent copy sharing the level lookup (but not the frame timer)"""
+        copy = Simulation(self.levels)
+        copy.restore(self.snapshot())
+        return copy
@@ -3,7 +3,7 @@ import pygame
 import math
 from config import *
 import heapq
-from typing import List, Tuple
+from typing import FrozenSet, List, Tuple
 
 class Player(pygame.sprite.Sprite):
     def __init__(self, x: int, y: int):
@@ -16,6 +16,7 @@ class Player(pygame.sprite.Sprite):
         self.speed = PLAYER_SPEED
         self.next_direction = None
         self.animation_frame = 0
+        self.animate = True
         
     def update(self, walls: List[pygame.Rect]):
         # Movement and collision logic
@@ -26,17 +27,12 @@ class Player(pygame.sprite.Sprite):
         next_rect.x += dx
         next_rect.y += dy
         
-        collision = False
-        for wall in walls:
-            if next_rect.colliderect(wall):
-                collision = True
-                break
-                
-        if not collision:
+        if next_rect.collidelist(walls) == -1:
             self.rect = next_rect
             
         # Animation
-        self.animation_frame = (self.animation_frame + 1) % 10
+        if self.animate:
+            self.animation_frame = (self.animation_frame + 1) % 10
         
     def draw(self, screen: pygame.Surface):
         angle = 90 * self.direction
@@ -80,28 +76,21 @@ class Ghost(pygame.sprite.Sprite):
         self.state = 1  # 1:normal, 3:frightened, 4:eaten(dead)
         self.frightened_timer = 0
         self.path = []
-        self.path_update_timer = 0
+        self.path_update_timer = None  # time of the last re-plan
+        self.replan_interval = GHOST_REPLAN_INTERVAL
         self.respawn_timer = 0
-        self.respawn_duration = 5000  # 5 seconds in milliseconds
+        self.respawn_duration = GHOST_RESPAWN_MS
         self.visible = True
         
-    def find_path(self, start: Tuple[int, int], goal: Tuple[int, int], 
-                  walls: List[pygame.Rect], cell_size: int) -> List[Tuple[int, int]]:
+    def find_path(self, start: Tuple[int, int], goal: Tuple[int, int],
+                  wall_cells: FrozenSet[Tuple[int, int]]) -> List[Tuple[int, int]]:
         """A* pathfinding algorithm implementation"""
         def get_neighbors(pos: Tuple[int, int]) -> List[Tuple[int, int]]:
+            # Walls are whole cells, so a cell is blocked exactly when it is one
             neighbors = []
             for dx, dy in [(0, 1), (1, 0), (0, -1), (-1, 0)]:
                 new_pos = (pos[0] + dx, pos[1] + dy)
-                pixel_pos = get_pixel_position(new_pos, cell_size)
-                rect = pygame.Rect(pixel_pos[0], pixel_pos[1], cell_size, cell_size)
-                
-                can_move = True
-                for wall in walls:
-                    if rect.colliderect(wall):
-                        can_move = False
-                        break
-                
-                if can_move:
+                if new_pos not in wall_cells:
                     neighbors.append(new_pos)
             return neighbors
 
@@ -162,13 +151,7 @@ class Ghost(pygame.sprite.Sprite):
             elif direction == 2: next_rect.x -= self.speed
             elif direction == 3: next_rect.y -= self.speed
             
-            can_move = True
-            for wall in walls:
-                if next_rect.colliderect(wall):
-                    can_move = False
-                    break
-            
-            if can_move:
+            if next_rect.collidelist(walls) == -1:
                 return direction
         
         return self.direction  # Keep current direction if no better option
@@ -190,9 +173,10 @@ class Ghost(pygame.sprite.Sprite):
             return True  # Ghost is in eaten state
         return False  # Ghost is not in eaten state
 
-    def update(self, player: Player, walls: List[pygame.Rect]):
-        current_time = pygame.time.get_ticks()
-        
+    def update(self, player: Player, walls: List[pygame.Rect],
+               wall_cells: FrozenSet[Tuple[int, int]], current_time: int):
+        # current_time: simulation clock in ms (see Simulation.now_ms)
+
         # Handle eaten state
         if self.handle_eaten_state(current_time):
             return  # Skip normal update if ghost is eaten
@@ -203,8 +187,8 @@ class Ghost(pygame.sprite.Sprite):
             if self.frightened_timer <= 0:
                 self.state = 1
         
-        # Update path every 500ms
-        if current_time - self.path_update_timer > 500:
+        # Update path every replan_interval ms (500 unless the governor slowed it)
+        if self.path_update_timer is None or current_time - self.path_update_timer > self.replan_interval:
             self.path_update_timer = current_time
             
             # Get current positions in grid coordinates
@@ -214,7 +198,7 @@ class Ghost(pygame.sprite.Sprite):
             if self.state == 3:  # Frightened state - run away
                 self.direction = self.get_escape_direction((player.rect.x, player.rect.y), walls)
             else:  # Normal state - chase player
-                self.path = self.find_path(ghost_pos, player_pos, walls, CELL_SIZE)
+                self.path = self.find_path(ghost_pos, player_pos, wall_cells)
                 if len(self.path) > 1:
                     # Determine direction to next path point
                     next_pos = self.path[1]
@@ -237,13 +221,7 @@ class Ghost(pygame.sprite.Sprite):
         next_rect.y += dy
         
         # Check collision
-        collision = False
-        for wall in walls:
-            if next_rect.colliderect(wall):
-                collision = True
-                break
-        
-        if not collision:
+        if next_rect.collidelist(walls) == -1:
             self.rect = next_rect
             
     def draw(self, screen: pygame.Surface):
@@ -1,7 +1,10 @@
 import sqlite3
 
-# 连接到 SQLite 数据库（如果文件不存在，会自动创建）
-conn = sqlite3.connect('pacman.db')
+from config import DB_PATH
+from database import sqlite_uri
+
+# 以只读方式连接到 SQLite 数据库（路径见 config.DB_PATH，文件不存在时不会创建空库）
+conn = sqlite3.connect(sqlite_uri(DB_PATH, mode='ro'), uri=True)
 cursor = conn.cursor()
 
 # 查看所有表
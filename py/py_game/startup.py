@@ -0,0 +1,87 @@
+# startup.py
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Tuple
+
+
+class StartupProfile:
+    """Collect import/init timings for the --startup-profile report"""
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self.phases: List[Tuple[str, str, float]] = []  # (group, name, seconds)
+        self.milestones: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str, group: str = 'init'):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases.append((group, name, time.perf_counter() - begin))
+
+    def mark(self, name: str):
+        """Record a milestone relative to process start (first one wins)"""
+        with self._lock:
+            self.milestones.setdefault(name, time.perf_counter() - self.start)
+
+    def report(self, target_ms: float = None) -> str:
+        lines = ['Startup profile:']
+        with self._lock:
+            phases = list(self.phases)
+            milestones = dict(self.milestones)
+        for group in ('import', 'init', 'background'):
+            rows = [(name, sec) for g, name, sec in phases if g == group]
+            if not rows:
+                continue
+            lines.append(f'  {group}: {sum(sec for _, sec in rows) * 1000:8.1f} ms')
+            for name, sec in rows:
+                lines.append(f'    {name:<28}{sec * 1000:8.1f} ms')
+        for name, sec in milestones.items():
+            lines.append(f'  {name:<30}{sec * 1000:8.1f} ms')
+        if target_ms is not None and 'first menu frame' in milestones:
+            ms = milestones['first menu frame'] * 1000
+            verdict = 'OK' if ms <= target_ms else 'MISSED'
+            lines.append(f'  target {target_ms:.0f} ms: {verdict}')
+        return '\n'.join(lines)
+
+
+class Preloader:
+    """Run deferred initializers on a background thread while the menu is up"""
+    def __init__(self, profile: StartupProfile):
+        self.profile = profile
+        self.tasks: List[Tuple[str, Callable[[], Any]]] = []
+        self.results: Dict[str, Any] = {}
+        self.errors: Dict[str, BaseException] = {}
+        self.done = threading.Event()
+        self.thread = None
+
+    def add(self, name: str, fn: Callable[[], Any]):
+        self.tasks.append((name, fn))
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='preloader', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            for name, fn in self.tasks:
+                try:
+                    with self.profile.phase(name, 'background'):
+                        self.results[name] = fn()
+                except Exception as e:
+                    self.errors[name] = e
+        finally:
+            self.done.set()
+
+    def get(self, name: str) -> Any:
+        """Wait for the background work and return one task's result"""
+        if self.thread is None:
+            self.start()
+        self.done.wait()
+        if name in self.errors:
+            raise self.errors[name]
+        return self.results[name]
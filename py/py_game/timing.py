@@ -0,0 +1,116 @@
+# timing.py
+import csv
+import json
+import time
+from array import array
+from typing import Dict, List, Tuple
+
+# Every phase of a frame, in the order they run. A frame's time is split
+# between them with lap(): each lap is charged the time since the last one.
+PHASES = (
+    'events',
+    'update.agent', 'update.player', 'update.ghosts', 'update.dots', 'update.collisions',
+    'draw.walls', 'draw.dots', 'draw.actors', 'draw.hud', 'draw.overlay', 'draw.flip',
+)
+
+
+class FrameTimer:
+    """perf_counter_ns phase timings kept in ring buffers of the last `size` frames
+
+    While disabled every call returns straight away, so the hooks can stay
+    in the frame loop permanently.
+    """
+    def __init__(self, size: int = 600, export_path: str = None):
+        self.size = size
+        self.index = {name: i for i, name in enumerate(PHASES)}
+        self.samples = [array('q', bytes(8 * size)) for _ in PHASES]
+        self.totals = array('q', bytes(8 * size))
+        self.count = 0            # frames recorded so far
+        self.current = [0] * len(PHASES)
+        self.last = 0
+        self.overlay = False
+        self.export_file = None
+        self.export_writer = None
+        self.export_json = False
+        self.enabled = False
+        self.pending = None       # enabled from the next begin_frame, see toggle_overlay
+        if export_path:
+            self.open_export(export_path)
+
+    def open_export(self, path: str):
+        self.export_file = open(path, 'w', newline='')
+        self.export_json = path.endswith(('.json', '.jsonl'))
+        if not self.export_json:
+            self.export_writer = csv.writer(self.export_file)
+            self.export_writer.writerow(['frame', 'total_us'] + [f'{p}_us' for p in PHASES])
+        self.enabled = True
+
+    def toggle_overlay(self):
+        """Show or hide the overlay; timing starts or stops with the next frame
+
+        Switching on mid-frame would time the rest of the frame from a
+        stale `last` and record one huge bogus sample.
+        """
+        self.overlay = not self.overlay
+        self.pending = self.overlay or self.export_file is not None
+
+    def begin_frame(self):
+        if self.pending is not None:
+            self.enabled = self.pending
+            self.pending = None
+        if not self.enabled:
+            return
+        self.current = [0] * len(PHASES)
+        self.last = time.perf_counter_ns()
+
+    def lap(self, phase: str):
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns()
+        self.current[self.index[phase]] += now - self.last
+        self.last = now
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        slot = self.count % self.size
+        for buffer, value in zip(self.samples, self.current):
+            buffer[slot] = value
+        total = sum(self.current)
+        self.totals[slot] = total
+        if self.export_file:
+            row = [round(ns / 1000) for ns in self.current]
+            if self.export_json:
+                record = dict(zip(PHASES, row))
+                record.update(frame=self.count, total=round(total / 1000))
+                self.export_file.write(json.dumps(record) + '\n')
+            else:
+                self.export_writer.writerow([self.count, round(total / 1000)] + row)
+        self.count += 1
+
+    def recent(self, buffer: array) -> List[int]:
+        """Samples of one ring buffer, oldest first"""
+        n = min(self.count, self.size)
+        start = self.count - n
+        return [buffer[(start + i) % self.size] for i in range(n)]
+
+    def percentiles(self, phase: str = None) -> Tuple[float, float, float]:
+        """p50/p95/p99 in ms for one phase, or for the whole frame"""
+        buffer = self.totals if phase is None else self.samples[self.index[phase]]
+        values = sorted(self.recent(buffer))
+        if not values:
+            return 0.0, 0.0, 0.0
+        last = len(values) - 1
+        return tuple(values[int(last * q)] / 1e6 for q in (0.50, 0.95, 0.99))
+
+    def summary(self) -> Dict[str, Tuple[float, float, float]]:
+        result = {'frame': self.percentiles()}
+        for phase in PHASES:
+            result[phase] = self.percentiles(phase)
+        return result
+
+    def close(self):
+        if self.export_file:
+            self.export_file.close()
+            self.export_file = self.export_writer = None
+            self.enabled = self.overlay
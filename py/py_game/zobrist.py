@@ -0,0 +1,149 @@
+# zobrist.py
+"""Zobrist keys for game positions and a bounded transposition table
+
+A position's key is the XOR of one 64-bit key per feature: the level,
+the player's x, y and direction, each ghost's x, y, direction and state,
+and every dot and pellet still on the board. Simulation keeps the board
+part up to date as it steps - an eaten dot XORs its key out, only
+loading a level hashes the whole board - and Simulation.hash adds the
+five actors' keys when it is read. That is O(1) either way. Folding the
+actors in on every tick instead was measured to cost ~18% of a step,
+while searches read the hash far less often than they step.
+
+Score, lives, the tick and the ghosts' timers are not part of the key.
+Two states with the same key play the same from here until a timer runs
+out, which is what search and dedup want. For exact equality, compare
+Simulation.snapshot() bytes.
+
+Keys come from a stateless mixer rather than a seeded table, so they are
+the same in every process and every run. Hashes can be stored and
+compared across machines.
+"""
+from typing import Any, List, Optional
+
+MASK64 = (1 << 64) - 1
+
+# Feature kinds; actor 0 is the player, ghosts are 1..4
+LEVEL, X, Y, DIRECTION, GHOST_STATE, DOT, PELLET = range(7)
+
+
+def mix(kind: int, index: int, value: int) -> int:
+    """splitmix64 finalizer over the feature, a fixed pseudo-random 64-bit key"""
+    z = ((kind << 56) ^ (index << 40) ^ (value & 0xFFFFFFFFFF)) * 0x9E3779B97F4A7C15 & MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return z ^ (z >> 31)
+
+
+class _Keys(dict):
+    """value -> key for one (kind, index), filled in on first use"""
+    def __init__(self, kind: int, index: int = 0):
+        super().__init__()
+        self.kind = kind
+        self.index = index
+
+    def __missing__(self, value: int) -> int:
+        key = self[value] = mix(self.kind, self.index, value)
+        return key
+
+
+ACTORS = 5
+LEVEL_KEYS = _Keys(LEVEL)
+X_KEYS = [_Keys(X, actor) for actor in range(ACTORS)]
+Y_KEYS = [_Keys(Y, actor) for actor in range(ACTORS)]
+DIRECTION_KEYS = [_Keys(DIRECTION, actor) for actor in range(ACTORS)]
+STATE_KEYS = [_Keys(GHOST_STATE, actor) for actor in range(ACTORS)]
+DOT_KEYS = _Keys(DOT)
+PELLET_KEYS = _Keys(PELLET)
+
+
+def actors_hash(sim) -> int:
+    """XOR of the player's and the ghosts' keys"""
+    player = sim.player
+    key = X_KEYS[0][player.rect.x] ^ Y_KEYS[0][player.rect.y] ^ DIRECTION_KEYS[0][player.direction]
+    for actor, ghost in enumerate(sim.ghosts, 1):
+        key ^= (X_KEYS[actor][ghost.rect.x] ^ Y_KEYS[actor][ghost.rect.y]
+                ^ DIRECTION_KEYS[actor][ghost.direction] ^ STATE_KEYS[actor][ghost.state])
+    return key
+
+
+def board_hash(sim) -> int:
+    """XOR of the level's key and those of the dots and pellets left, from scratch"""
+    key = LEVEL_KEYS[sim.current_level]
+    for i, present in enumerate(sim.dot_flags):
+        if present:
+            key ^= DOT_KEYS[i]
+    for i, present in enumerate(sim.pellet_flags):
+        if present:
+            key ^= PELLET_KEYS[i]
+    return key
+
+
+def full_hash(sim) -> int:
+    """A Simulation's key computed from scratch, to check Simulation.hash against"""
+    return board_hash(sim) ^ actors_hash(sim)
+
+
+class TranspositionTable:
+    """Fixed number of slots indexed by key; on a collision the deeper entry stays
+
+    store() into a slot that holds another position only replaces it when
+    the new entry was searched at least as deep, so expensive results
+    aren't evicted by cheap ones. Entries for the same key are always
+    replaced.
+    """
+    def __init__(self, size: int = 1 << 20):
+        self.size = size
+        self.keys: List[Optional[int]] = [None] * size
+        self.depths = [0] * size
+        self.values: List[Any] = [None] * size
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0  # another position's entry replaced
+        self.rejected = 0   # store dropped, the slot held a deeper entry
+
+    def get(self, key: int, min_depth: int = 0) -> Optional[Any]:
+        """The stored value, if it was searched at least min_depth deep"""
+        slot = key % self.size
+        if self.keys[slot] == key and self.depths[slot] >= min_depth:
+            self.hits += 1
+            return self.values[slot]
+        self.misses += 1
+        return None
+
+    def depth(self, key: int) -> int:
+        """Depth stored for the key, -1 if it isn't in the table"""
+        slot = key % self.size
+        return self.depths[slot] if self.keys[slot] == key else -1
+
+    def store(self, key: int, depth: int, value: Any) -> bool:
+        slot = key % self.size
+        held = self.keys[slot]
+        if held is not None and held != key:
+            if depth < self.depths[slot]:
+                self.rejected += 1
+                return False
+            self.evictions += 1
+        self.keys[slot] = key
+        self.depths[slot] = depth
+        self.values[slot] = value
+        self.stores += 1
+        return True
+
+    def clear(self):
+        self.keys = [None] * self.size
+        self.depths = [0] * self.size
+        self.values = [None] * self.size
+
+    def __len__(self) -> int:
+        return self.size - self.keys.count(None)
+
+    def __contains__(self, key: int) -> bool:
+        return self.keys[key % self.size] == key
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'size': self.size, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0, 'stores': self.stores,
+                'evictions': self.evictions, 'rejected': self.rejected}